@@ -3,20 +3,91 @@ AI System - Core self-learning functionality
 Combines LLM, database, and training to create self-improving AI
 """
 
+import asyncio
+import itertools
 import json
-from typing import Dict, Any, List, Optional
-from parse_conversations import extract_training_examples, load_conversations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Iterator, AsyncIterator, Tuple
+from json_stream import JsonFieldStreamer
+from example_index import use_example_index
+from evaluation import held_out_examples, is_held_out, evaluate_prompt, compare_reports
 from llm_integration import (
     generate_llm_response,
+    agenerate_llm_response,
+    stream_llm_response,
+    astream_llm_response,
     extract_json_from_response,
     format_chat_history,
     format_client_sequence,
-    format_consultant_reply
+    format_consultant_reply,
+    PROVIDER_MODELS
 )
-from database import get_prompt, update_prompt
+from database import get_prompt, get_prompt_record, update_prompt, PromptVersionConflict
+from config import Config
+from reply_cache import ReplyCache, make_reply_cache_key
+from singleflight import SingleFlight
+from history_window import HistoryCompactor
+from prompts import HISTORY_SUMMARY_PROMPT, EDITOR_BATCH_PROMPT
+from timing import stage
+from metrics import registry as metrics
+from rate_limit import background_priority, in_background
+
+# Exact-match cache of replies, keyed by prompt version and conversation
+reply_cache = ReplyCache(
+    max_entries=Config.REPLY_CACHE_SIZE,
+    ttl_seconds=Config.REPLY_CACHE_TTL,
+    disk_path=Config.REPLY_CACHE_PATH or None,
+    max_disk_entries=Config.REPLY_CACHE_DISK_SIZE
+)
+
+# Identical reply requests in flight at the same time share one LLM call
+reply_flights = SingleFlight()
+
+# Fields the chatbot and editor responses must have (see extract_json_from_response)
+REPLY_SCHEMA = {'reply': str}
+EDITOR_SCHEMA = {'prompt': str}
+
+
+def _reply_cache_metrics():
+    stats = reply_cache.stats()
+    return [
+        ('issa_cache_requests_total', {'cache': 'reply', 'result': 'hit'}, stats['hits']),
+        ('issa_cache_requests_total', {'cache': 'reply', 'result': 'disk_hit'}, stats['disk_hits']),
+        ('issa_cache_requests_total', {'cache': 'reply', 'result': 'miss'}, stats['misses']),
+        ('issa_reply_coalesced_total', {}, reply_flights.stats()['followers'])
+    ]
+
+
+metrics.describe('issa_reply_coalesced_total', 'counter', 'Reply requests that shared the LLM call of an identical request in flight')
+metrics.add_collector(_reply_cache_metrics)
 
 
-def generate_ai_reply(client_sequence: str, chat_history: List[Dict], provider: str = "groq") -> str:
+def _summarize_history(previous_summary: Optional[str], new_messages: str, provider: str) -> str:
+    """Fold newly aged-out messages into the rolling conversation summary"""
+    prompt = HISTORY_SUMMARY_PROMPT.format(
+        max_words=int(Config.HISTORY_SUMMARY_TOKENS * 0.75),
+        previous_summary=previous_summary or "(none)",
+        new_messages=new_messages
+    )
+    return generate_llm_response(prompt, provider=provider)
+
+
+# Keeps reply prompts within a token budget for long conversations
+history_compactor = HistoryCompactor(
+    _summarize_history,
+    token_budget=Config.HISTORY_TOKEN_BUDGET,
+    keep_last=Config.HISTORY_KEEP_MESSAGES,
+    summary_tokens=Config.HISTORY_SUMMARY_TOKENS
+)
+
+
+def generate_ai_reply(
+    client_sequence: str,
+    chat_history: List[Dict],
+    provider: str = "groq",
+    system_prompt: Optional[str] = None
+) -> str:
     """
     Generate AI consultant reply given client messages and chat history
     
@@ -24,34 +95,218 @@ def generate_ai_reply(client_sequence: str, chat_history: List[Dict], provider:
         client_sequence: Client's message(s) as a string
         chat_history: List of previous messages
         provider: LLM provider to use
+        system_prompt: Use this chatbot prompt instead of the live one (for
+            evaluation); such replies skip the reply cache
     
     Returns:
         AI-generated reply as string
     """
+    if system_prompt is not None:
+        full_prompt = prepare_reply(
+            {'prompt_text': system_prompt, 'version': None}, client_sequence, chat_history, provider
+        )
+        with stage('llm'):
+            response = generate_llm_response(full_prompt, provider=provider, json_mode=True)
+        with stage('parse'):
+            return parse_reply(response)
+    
     # Get current chatbot prompt from database
-    system_prompt = get_prompt('chatbot')
+    with stage('prompt'):
+        prompt_record = get_prompt_record('chatbot')
     
-    # Format the prompt with current context
-    formatted_history = format_chat_history(chat_history)
+    # Checked before the history is compacted, which may call the LLM for a summary
+    cache_key = reply_cache_key(prompt_record, client_sequence, chat_history, provider)
+    with stage('cache'):
+        cached = reply_cache.get(cache_key, prompt_record['version'])
+    if cached is not None:
+        return cached
     
-    full_prompt = system_prompt.format(
-        chat_history=formatted_history,
-        client_sequence=client_sequence
+    def generate() -> str:
+        full_prompt = prepare_reply(prompt_record, client_sequence, chat_history, provider)
+        with stage('llm'):
+            response = generate_llm_response(full_prompt, provider=provider, json_mode=True)
+        
+        with stage('parse'):
+            reply = parse_reply(response)
+        _cache_reply(cache_key, reply, response, prompt_record['version'])
+        return reply
+    
+    # Duplicate deliveries of this request already in flight wait for its reply
+    if not Config.REPLY_COALESCE:
+        return generate()
+    reply, _ = reply_flights.do(cache_key, generate)
+    return reply
+
+
+async def agenerate_ai_reply(client_sequence: str, chat_history: List[Dict], provider: str = "groq") -> str:
+    """
+    Async version of generate_ai_reply for the ASGI entry point (see asgi.py)
+    
+    The prompt lookup and history compaction are usually cache hits but may
+    hit Supabase or the LLM, so they run in a worker thread; the reply call
+    itself is awaited on the event loop.
+    """
+    with stage('prompt'):
+        prompt_record = await asyncio.to_thread(get_prompt_record, 'chatbot')
+    
+    cache_key = reply_cache_key(prompt_record, client_sequence, chat_history, provider)
+    with stage('cache'):
+        cached = reply_cache.get(cache_key, prompt_record['version'])
+    if cached is not None:
+        return cached
+    
+    async def generate() -> str:
+        full_prompt = await asyncio.to_thread(
+            prepare_reply, prompt_record, client_sequence, chat_history, provider
+        )
+        with stage('llm'):
+            response = await agenerate_llm_response(full_prompt, provider=provider, json_mode=True)
+        
+        with stage('parse'):
+            reply = parse_reply(response)
+        _cache_reply(cache_key, reply, response, prompt_record['version'])
+        return reply
+    
+    if not Config.REPLY_COALESCE:
+        return await generate()
+    reply, _ = await reply_flights.ado(cache_key, generate)
+    return reply
+
+
+def stream_ai_reply(client_sequence: str, chat_history: List[Dict], provider: str = "groq") -> Iterator[Tuple[str, str]]:
+    """
+    Stream an AI reply as it is generated
+    
+    The model's JSON output is read incrementally and the characters of its
+    "reply" field are yielded as soon as they arrive. Cached replies are
+    sent as a single token.
+    
+    Yields:
+        ("token", text) for each new piece of the reply, then ("done", full_reply)
+    """
+    prompt_record = get_prompt_record('chatbot')
+    cache_key = reply_cache_key(prompt_record, client_sequence, chat_history, provider)
+    
+    cached = reply_cache.get(cache_key, prompt_record['version'])
+    if cached is not None:
+        yield "token", cached
+        yield "done", cached
+        return
+    
+    full_prompt = prepare_reply(prompt_record, client_sequence, chat_history, provider)
+    streamer = JsonFieldStreamer('reply')
+    for chunk in stream_llm_response(full_prompt, provider=provider):
+        text = streamer.feed(chunk)
+        if text:
+            yield "token", text
+    
+    reply = _finish_streamed_reply(streamer)
+    _cache_reply(cache_key, reply, streamer.text, prompt_record['version'])
+    yield "done", reply
+
+
+async def astream_ai_reply(client_sequence: str, chat_history: List[Dict], provider: str = "groq") -> AsyncIterator[Tuple[str, str]]:
+    """Async version of stream_ai_reply"""
+    prompt_record = await asyncio.to_thread(get_prompt_record, 'chatbot')
+    cache_key = reply_cache_key(prompt_record, client_sequence, chat_history, provider)
+    
+    cached = reply_cache.get(cache_key, prompt_record['version'])
+    if cached is not None:
+        yield "token", cached
+        yield "done", cached
+        return
+    
+    full_prompt = await asyncio.to_thread(
+        prepare_reply, prompt_record, client_sequence, chat_history, provider
     )
+    streamer = JsonFieldStreamer('reply')
+    async for chunk in astream_llm_response(full_prompt, provider=provider):
+        text = streamer.feed(chunk)
+        if text:
+            yield "token", text
     
-    # Generate response
-    response = generate_llm_response(full_prompt, provider=provider)
+    reply = _finish_streamed_reply(streamer)
+    _cache_reply(cache_key, reply, streamer.text, prompt_record['version'])
+    yield "done", reply
+
+
+def _finish_streamed_reply(streamer: JsonFieldStreamer) -> str:
+    """Final reply for a stream; falls back to full-text parsing if no reply field was found"""
+    if streamer.done:
+        return streamer.value
+    return parse_reply(streamer.text)
+
+
+def prepare_reply(
+    prompt_record: Dict[str, Any],
+    client_sequence: str,
+    chat_history: List[Dict],
+    provider: str
+) -> str:
+    """
+    Build the full chatbot prompt for a request
     
-    # Extract JSON reply
+    Long chat histories are compacted to the configured token budget (recent
+    messages verbatim, older ones summarised) before being inlined.
+    """
+    with stage('history'):
+        formatted_history = history_compactor.compact(chat_history, provider)
+    
+    return build_reply_prompt(prompt_record['prompt_text'], client_sequence, formatted_history)
+
+
+def reply_cache_key(
+    prompt_record: Dict[str, Any],
+    client_sequence: str,
+    chat_history: List[Dict],
+    provider: str
+) -> str:
+    """
+    Reply cache (and single-flight) key for a request
+    
+    Built from the raw conversation rather than the compacted history, whose
+    summary is LLM-generated: checking the cache never needs a summary call,
+    and the key is the same in every worker and after restarts.
+    """
+    if hasattr(chat_history, 'formatted'):
+        formatted_history = chat_history.formatted()  # training example history, formatted once per conversation
+    else:
+        formatted_history = format_chat_history(chat_history)
+    return make_reply_cache_key(
+        prompt_record['version'],
+        provider,
+        PROVIDER_MODELS.get(provider, provider),
+        formatted_history,
+        client_sequence
+    )
+
+
+def build_reply_prompt(system_prompt: str, client_sequence: str, formatted_history: str) -> str:
+    """Fill the chatbot prompt template with the current conversation context"""
+    return system_prompt.format(
+        chat_history=formatted_history,
+        client_sequence=client_sequence
+    )
+
+
+def parse_reply(response: str) -> str:
+    """Extract the 'reply' field from a chatbot response, falling back to the raw text"""
     try:
-        json_response = extract_json_from_response(response)
-        return json_response.get('reply', response)
+        # A reply cut off at the token limit still beats sending the raw JSON
+        json_response = extract_json_from_response(response, REPLY_SCHEMA, allow_truncated=True)
+        return json_response['reply']
     except Exception as e:
         # Fallback if JSON parsing fails
         print(f"Warning: Failed to parse JSON response: {e}")
         return response
 
 
+def _cache_reply(cache_key: str, reply: str, response: str, prompt_version: int):
+    # Don't cache raw fallbacks from responses that weren't valid JSON
+    if reply != response:
+        reply_cache.set(cache_key, reply, prompt_version)
+
+
 def improve_prompt_with_editor(
     client_sequence: str,
     chat_history: List[Dict],
@@ -72,40 +327,163 @@ def improve_prompt_with_editor(
     Returns:
         Dict with analysis, changes, and updated prompt
     """
-    # Get current prompts
-    current_chatbot_prompt = get_prompt('chatbot')
-    editor_prompt = get_prompt('editor')
+    with stage('prompt'):
+        editor_prompt = get_prompt('editor')
+    with stage('history'):
+        formatted_history = format_chat_history(chat_history)
     
-    # Format the editor prompt
-    formatted_history = format_chat_history(chat_history)
+    def build_editor_prompt(current_chatbot_prompt: str) -> str:
+        return editor_prompt.format(
+            current_prompt=current_chatbot_prompt,
+            client_sequence=client_sequence,
+            chat_history=formatted_history,
+            consultant_reply=consultant_reply,
+            ai_reply=ai_reply
+        )
     
-    full_prompt = editor_prompt.format(
-        current_prompt=current_chatbot_prompt,
-        client_sequence=client_sequence,
-        chat_history=formatted_history,
-        consultant_reply=consultant_reply,
-        ai_reply=ai_reply
-    )
+    return _run_editor(build_editor_prompt, "Auto-improvement", provider)
+
+
+def improve_prompt_with_editor_batch(examples: List[Dict[str, Any]], provider: str = "groq") -> Dict[str, Any]:
+    """
+    Ask the editor for one consolidated prompt revision covering several examples
     
-    # Generate improvement suggestions
-    response = generate_llm_response(full_prompt, provider=provider)
+    Cuts editor calls and prompt_history writes by the batch size compared
+    to calling improve_prompt_with_editor once per example.
     
-    try:
-        result = extract_json_from_response(response)
+    Args:
+        examples: Dicts with client_sequence, chat_history, consultant_reply and ai_reply
+        provider: LLM provider to use
+    
+    Returns:
+        Dict with analysis, changes, and updated prompt
+    """
+    if len(examples) == 1:
+        ex = examples[0]
+        return improve_prompt_with_editor(
+            ex['client_sequence'], ex['chat_history'], ex['consultant_reply'], ex['ai_reply'], provider=provider
+        )
+    
+    # Summarising long histories calls the LLM too: queue it like the editor call
+    sections = []
+    with stage('history'), background_priority():
+        for n, ex in enumerate(examples, 1):
+            sections.append(
+                f"#### Example {n}\n"
+                f"Chat History:\n{history_compactor.compact(ex['chat_history'], provider)}\n\n"
+                f"Client Sequence:\n{ex['client_sequence']}\n\n"
+                f"Real Consultant Reply:\n{ex['consultant_reply']}\n\n"
+                f"AI Predicted Reply:\n{ex['ai_reply']}\n"
+            )
+    formatted_examples = '\n'.join(sections)
+    
+    def build_editor_prompt(current_chatbot_prompt: str) -> str:
+        return EDITOR_BATCH_PROMPT.format(
+            current_prompt=current_chatbot_prompt,
+            num_examples=len(examples),
+            examples=formatted_examples
+        )
+    
+    return _run_editor(build_editor_prompt, f"Batch auto-improvement ({len(examples)} examples)", provider)
+
+
+def _run_editor(build_editor_prompt, reason_prefix: str, provider: str) -> Dict[str, Any]:
+    """
+    Run an editor prompt against the current chatbot prompt and save the result
+    
+    The update is a compare-and-swap on the version the edit was based on;
+    if another request updated the prompt first, the editor is re-run on the
+    latest prompt (up to PROMPT_UPDATE_RETRIES times).
+    """
+    for attempt in range(Config.PROMPT_UPDATE_RETRIES + 1):
+        # Get current chatbot prompt and the version this edit is based on
+        with stage('prompt'):
+            chatbot_record = get_prompt_record('chatbot')
+        current_chatbot_prompt = chatbot_record['prompt_text']
         
-        # Update the database with new prompt
-        if 'prompt' in result:
-            change_reason = f"Auto-improvement: {result.get('analysis', 'No analysis provided')}"
-            update_prompt('chatbot', result['prompt'], change_reason)
+        # Generate improvement suggestions (queued behind live replies when near the rate limit)
+        with stage('editor_llm'), background_priority():
+            response = generate_llm_response(build_editor_prompt(current_chatbot_prompt), provider=provider, json_mode=True)
         
-        return result
-    except Exception as e:
-        print(f"Error parsing editor response: {e}")
-        return {
-            "analysis": "Failed to parse editor response",
-            "changes_made": [],
-            "prompt": current_chatbot_prompt
-        }
+        try:
+            with stage('parse'):
+                result = extract_json_from_response(response, EDITOR_SCHEMA)
+            
+            # Update the database with new prompt
+            if 'prompt' in result:
+                comparison = check_prompt_regression(chatbot_record, result['prompt'], provider)
+                if comparison:
+                    print(f"Warning: Editor revision regressed on held-out examples, not saved: {comparison['regressions']}")
+                    return {
+                        "analysis": result.get('analysis', 'No analysis provided'),
+                        "changes_made": [],
+                        "prompt": current_chatbot_prompt,
+                        "rejected": True,
+                        "evaluation": comparison
+                    }
+                
+                change_reason = f"{reason_prefix}: {result.get('analysis', 'No analysis provided')}"
+                with stage('prompt_update'):
+                    update_prompt(
+                        'chatbot',
+                        result['prompt'],
+                        change_reason,
+                        expected_version=chatbot_record['version']
+                    )
+            
+            return result
+        except PromptVersionConflict as e:
+            print(f"Warning: {e} (attempt {attempt + 1}), retrying editor on latest prompt")
+        except Exception as e:
+            print(f"Error parsing editor response: {e}")
+            return {
+                "analysis": "Failed to parse editor response",
+                "changes_made": [],
+                "prompt": current_chatbot_prompt
+            }
+    
+    return {
+        "analysis": "Prompt was updated concurrently; changes not applied",
+        "changes_made": [],
+        "prompt": get_prompt('chatbot')
+    }
+
+
+# Baseline evaluation of the live prompt for the regression gate, by version
+_gate_baseline: Dict[str, Any] = {}
+
+
+def check_prompt_regression(current_record: Dict[str, Any], new_prompt: str, provider: str) -> Optional[Dict[str, Any]]:
+    """
+    Score an editor revision against the live prompt before it is saved
+    
+    Only active when EVAL_GATE_SAMPLES > 0. Both prompts are evaluated on
+    the same held-out examples; the live prompt's report is reused until
+    its version changes.
+    
+    Returns:
+        The comparison (see evaluation.compare_reports) if the revision
+        regressed, otherwise None
+    """
+    if Config.EVAL_GATE_SAMPLES <= 0:
+        return None
+    
+    examples = held_out_examples(Config.EVAL_GATE_SAMPLES)
+    if not examples:
+        print("Warning: Evaluation gate skipped, no held-out examples (set EVAL_HOLDOUT_FRACTION)")
+        return None
+    
+    baseline = _gate_baseline.get('report')
+    if _gate_baseline.get('key') != (current_record['version'], provider, len(examples)):
+        baseline = evaluate_prompt(
+            generate_ai_reply, current_record['prompt_text'], examples, provider,
+            label=f"v{current_record['version']}"
+        )
+        _gate_baseline.update(key=(current_record['version'], provider, len(examples)), report=baseline)
+    
+    candidate = evaluate_prompt(generate_ai_reply, new_prompt, examples, provider, label='editor revision')
+    comparison = compare_reports(baseline, candidate)
+    return comparison if comparison['regressions'] else None
 
 
 def manually_improve_prompt(instructions: str, provider: str = "groq") -> Dict[str, Any]:
@@ -119,9 +497,12 @@ def manually_improve_prompt(instructions: str, provider: str = "groq") -> Dict[s
     Returns:
         Dict with updated prompt
     """
-    current_prompt = get_prompt('chatbot')
-    
-    improvement_prompt = f"""You are an AI prompt engineer. Update the following system prompt based on these instructions:
+    for attempt in range(Config.PROMPT_UPDATE_RETRIES + 1):
+        with stage('prompt'):
+            record = get_prompt_record('chatbot')
+        current_prompt = record['prompt_text']
+        
+        improvement_prompt = f"""You are an AI prompt engineer. Update the following system prompt based on these instructions:
 
 Instructions: {instructions}
 
@@ -131,79 +512,150 @@ Current Prompt:
 Return the updated prompt in JSON format:
 {{"prompt": "updated prompt here", "summary": "brief description of changes made"}}
 """
-    
-    response = generate_llm_response(improvement_prompt, provider=provider)
-    
-    try:
-        result = extract_json_from_response(response)
         
-        if 'prompt' in result:
-            change_reason = f"Manual update: {instructions}"
-            update_prompt('chatbot', result['prompt'], change_reason)
+        with stage('editor_llm'), background_priority():
+            response = generate_llm_response(improvement_prompt, provider=provider, json_mode=True)
         
-        return result
-    except Exception as e:
-        print(f"Error: {e}")
-        return {"error": str(e), "prompt": current_prompt}
+        try:
+            with stage('parse'):
+                result = extract_json_from_response(response, EDITOR_SCHEMA)
+            
+            if 'prompt' in result:
+                change_reason = f"Manual update: {instructions}"
+                with stage('prompt_update'):
+                    update_prompt('chatbot', result['prompt'], change_reason, expected_version=record['version'])
+            
+            return result
+        except PromptVersionConflict as e:
+            print(f"Warning: {e} (attempt {attempt + 1}), retrying on latest prompt")
+        except Exception as e:
+            print(f"Error: {e}")
+            return {"error": str(e), "prompt": current_prompt}
+    
+    return {"error": "Prompt was updated concurrently; changes not applied", "prompt": get_prompt('chatbot')}
 
 
-def train_on_sample_data(num_samples: int = 5, provider: str = "groq") -> List[Dict[str, Any]]:
+def train_on_sample_data(
+    num_samples: int = 5,
+    provider: str = "groq",
+    concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    start: int = 0,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None
+) -> List[Dict[str, Any]]:
     """
     Train the AI by processing sample conversations and improving the prompt
     
+    AI replies for upcoming samples are generated ahead of time on a thread
+    pool while the editor works through samples strictly in order, so each
+    prompt update still builds on the previous one. Replies generated ahead
+    use the prompt that was current when they started.
+    
+    With batch_size > 1, the editor is called once per batch of samples
+    (see improve_prompt_with_editor_batch) and every sample in the batch
+    shares that improvement.
+    
     Args:
         num_samples: Number of training examples to process
         provider: LLM provider to use
+        concurrency: Max AI replies generated in parallel (default TRAIN_CONCURRENCY)
+        batch_size: Samples per editor call (default EDITOR_BATCH_SIZE)
+        start: Number of samples to skip (used to resume a background job)
+        on_result: Called with each result as soon as its editor step finishes
+        should_stop: Checked before each editor step; returning True ends training early
     
     Returns:
         List of training results
     """
+    concurrency = max(1, concurrency or Config.TRAIN_CONCURRENCY)
+    batch_size = max(1, batch_size or Config.EDITOR_BATCH_SIZE)
+    
     print(f"\n{'='*60}")
-    print(f"TRAINING AI ON {num_samples} SAMPLES")
+    print(f"TRAINING AI ON {num_samples} SAMPLES (concurrency {concurrency}, batch size {batch_size})")
     print(f"{'='*60}\n")
     
-    # Load training examples
-    conversations = load_conversations()
-    examples = extract_training_examples(conversations)
-    
-    # Process samples
-    results = []
-    for i, example in enumerate(examples[:num_samples]):
-        print(f"\n--- Sample {i+1}/{num_samples} ---")
+    # Load training examples from the precompiled index (built on first use),
+    # leaving out the contacts held back for evaluation
+    samples = []
+    with use_example_index(Config.CONVERSATIONS_PATH, Config.EXAMPLE_INDEX_PATH or None) as index:
+        training_examples = (ex for ex in index if not is_held_out(ex.contact_id))
         
         # Prepare data
-        client_seq = format_client_sequence(example['client_sequence'])
-        chat_hist = example['chat_history']
-        real_reply = format_consultant_reply(example['consultant_reply'])
-        
-        print(f"Client: {client_seq[:100]}...")
+        for example in itertools.islice(training_examples, start, num_samples):
+            samples.append((
+                format_client_sequence(example['client_sequence']),
+                example['chat_history'],
+                format_consultant_reply(example['consultant_reply'])
+            ))
+    
+    # Process samples: replies run ahead in the pool, editor steps stay serial
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='train') as pool:
+        pending = deque()
+        upcoming = iter(samples)
         
-        # Generate AI reply
-        ai_reply = generate_ai_reply(client_seq, chat_hist, provider=provider)
-        print(f"AI Reply: {ai_reply[:100]}...")
-        print(f"Real Reply: {real_reply[:100]}...")
+        def submit_next():
+            sample = next(upcoming, None)
+            if sample is not None:
+                client_seq, chat_hist, _ = sample
+                pending.append((sample, pool.submit(in_background(generate_ai_reply), client_seq, chat_hist, provider)))
         
-        # Improve prompt
-        improvement = improve_prompt_with_editor(
-            client_seq,
-            chat_hist,
-            real_reply,
-            ai_reply,
-            provider=provider
-        )
+        for _ in range(concurrency):
+            submit_next()
         
-        print(f"Analysis: {improvement.get('analysis', 'No analysis')}")
+        batch = []
+        while pending:
+            (client_seq, chat_hist, real_reply), future = pending.popleft()
+            submit_next()
+            
+            sample_num = start + len(results) + len(batch) + 1
+            print(f"\n--- Sample {sample_num}/{num_samples} ---")
+            print(f"Client: {client_seq[:100]}...")
+            
+            # Generated in the background
+            ai_reply = future.result()
+            print(f"AI Reply: {ai_reply[:100]}...")
+            print(f"Real Reply: {real_reply[:100]}...")
+            
+            batch.append({
+                'sample_num': sample_num,
+                'client_sequence': client_seq,
+                'chat_history': chat_hist,
+                'consultant_reply': real_reply,
+                'ai_reply': ai_reply
+            })
+            if len(batch) < batch_size and pending:
+                continue
+            
+            if should_stop and should_stop():
+                print("Training stopped before completion")
+                break
+            
+            # Improve prompt (once per batch)
+            improvement = improve_prompt_with_editor_batch(batch, provider=provider)
+            
+            print(f"Analysis: {improvement.get('analysis', 'No analysis')}")
+            
+            for item in batch:
+                result = {
+                    'sample_num': item['sample_num'],
+                    'client_sequence': item['client_sequence'],
+                    'ai_reply': item['ai_reply'],
+                    'real_reply': item['consultant_reply'],
+                    'improvement': improvement
+                }
+                results.append(result)
+                if on_result:
+                    on_result(result)
+            batch = []
         
-        results.append({
-            'sample_num': i + 1,
-            'client_sequence': client_seq,
-            'ai_reply': ai_reply,
-            'real_reply': real_reply,
-            'improvement': improvement
-        })
+        # Don't wait on replies that were generated ahead for samples we won't use
+        for _, future in pending:
+            future.cancel()
     
     print(f"\n{'='*60}")
-    print(f"✓ Completed training on {num_samples} samples")
+    print(f"✓ Completed training on {len(results)} samples")
     print(f"{'='*60}\n")
     
     return results
@@ -1,21 +1,127 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from dotenv import load_dotenv
+import json
 import os
+import time
 from ai_system import (
     generate_ai_reply,
+    stream_ai_reply,
     improve_prompt_with_editor,
     manually_improve_prompt,
-    train_on_sample_data
+    train_on_sample_data,
+    reply_cache
 )
-from llm_integration import format_client_sequence, format_consultant_reply
-from database import get_prompt, get_prompt_history
+from llm_integration import format_client_sequence, format_consultant_reply, router, warm_up_provider
+from config import Config
+from jobs import TrainingJobRunner
+from timing import start_trace, end_trace, current_trace
+from metrics import record_http_request, render_metrics
+from profiling import RequestProfiler, token_matches
+from database import get_prompt, get_prompt_record, get_prompt_history, get_prompt_cache_stats
+from clients import clients, Readiness
+from resilience import ProviderUnavailable
 
 load_dotenv()
 
 app = Flask(__name__)
 
+profiler = RequestProfiler(Config.PROFILE_DIR, Config.PROFILE_SAMPLE_RATE, Config.PROFILE_MAX_FILES)
+
+
+@app.before_request
+def begin_timing():
+    g.timing_token = start_trace()
+
+
+@app.before_request
+def begin_profile():
+    """Profile this request if it sent X-Profile: <ADMIN_TOKEN> or was sampled"""
+    if request.path.startswith('/admin/') or request.path == '/metrics':
+        return
+    requested = token_matches(request.headers.get('X-Profile'), Config.ADMIN_TOKEN)
+    if profiler.should_profile(requested):
+        profile = profiler.start()
+        if profile is not None:
+            g.profile = profile
+            g.profile_id = profiler.new_id()
+            g.profile_trace = current_trace()
+
+
+@app.after_request
+def add_server_timing(response):
+    """Report per-stage timings (prompt fetch, history, LLM call, ...) in a Server-Timing header"""
+    trace = current_trace()
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_http_request(route, request.method, response.status_code, time.perf_counter() - trace.started)
+    if 'profile_id' in g:
+        response.headers['X-Profile-Id'] = g.profile_id
+        g.profile_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_timing(exc):
+    token = g.pop('timing_token', None)
+    if token is not None:
+        end_trace(token)
+
+
+@app.teardown_request
+def finish_profile(exc):
+    # Runs after a streamed response is fully sent, so the profile covers the whole stream
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    data = request.get_json(silent=True)
+    chat_history = data.get('chatHistory') if isinstance(data, dict) else None
+    try:
+        profiler.finish(profile, g.profile_id, {
+            "method": request.method,
+            "path": request.path,
+            "route": request.url_rule.rule if request.url_rule else None,
+            "status": g.get('profile_status', 500),
+            "error": str(exc) if exc else None,
+            "request_bytes": request.content_length,
+            "chat_history_messages": len(chat_history) if isinstance(chat_history, list) else None
+        }, g.get('profile_trace'))
+    except OSError as e:
+        print(f"Warning: Could not save request profile: {e}")
+
+
+def admin_error():
+    """Error response for /admin routes, or None if the request carries ADMIN_TOKEN"""
+    if not Config.ADMIN_TOKEN:
+        return jsonify({"error": "Admin routes are disabled (set ADMIN_TOKEN)"}), 404
+    provided = request.headers.get('X-Admin-Token')
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        provided = auth[len('Bearer '):]
+    if not token_matches(provided, Config.ADMIN_TOKEN):
+        return jsonify({"error": "Invalid admin token"}), 401
+    return None
+
+
 # Determine which LLM provider to use
-LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'groq')  # Default to groq
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'groq')  # Default to groq; 'auto' routes across providers
+
+
+def warm_prompt_cache():
+    for prompt_type in ('chatbot', 'editor'):
+        get_prompt_record(prompt_type)
+
+
+# Builds the provider and database clients and fills the prompt cache in the
+# background, so the worker accepts connections immediately; /ready reports
+# when it is done
+readiness = Readiness({
+    "provider": lambda: warm_up_provider(LLM_PROVIDER),
+    "prompt_cache": warm_prompt_cache
+}, retry_seconds=Config.WARMUP_RETRY_SECONDS)
+
+if Config.WARMUP_ON_START:
+    readiness.start()
 
 
 @app.route('/')
@@ -31,14 +137,73 @@ def index():
             "POST /improve-ai-manually": "Manually update the AI prompt with specific instructions",
             "GET /prompt": "Get current chatbot prompt",
             "GET /prompt-history": "Get prompt change history",
-            "POST /train": "Train AI on sample data"
+            "GET /ready": "Readiness (provider and prompt cache warmed)",
+            "GET /metrics": "Prometheus metrics",
+            "GET /admin/profiles": "List saved request profiles (admin)",
+            "POST /train": "Start a background training job on sample data",
+            "GET /train/<job_id>": "Get training job progress and results",
+            "DELETE /train/<job_id>": "Cancel a training job"
         }
     })
 
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "healthy"})
+    return jsonify({
+        "status": "healthy",
+        "promptCache": get_prompt_cache_stats(),
+        "replyCache": reply_cache.stats(),
+        "providers": router.snapshot()
+    })
+
+
+@app.route('/ready')
+def ready():
+    """200 once the chosen provider's clients are built and the prompt cache is filled, 503 until then"""
+    status = readiness.status()
+    status["clients"] = clients.loaded()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: stage latencies, LLM calls and tokens, errors, cache hit counts"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/profiles')
+def list_profiles():
+    """Saved request profiles, newest first"""
+    error = admin_error()
+    if error:
+        return error
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({"profiles": profiler.list_profiles(limit)})
+
+
+@app.route('/admin/profiles/<profile_id>')
+def get_profile(profile_id):
+    """One profile: request details, stage timings and the top functions by cumulative time"""
+    error = admin_error()
+    if error:
+        return error
+    profile = profiler.get(profile_id)
+    if not profile:
+        return jsonify({"error": f"Profile not found: {profile_id}"}), 404
+    return jsonify(profile)
+
+
+@app.route('/admin/profiles/<profile_id>/download')
+def download_profile(profile_id):
+    """Raw cProfile data, for pstats or snakeviz"""
+    error = admin_error()
+    if error:
+        return error
+    path = profiler.profile_path(profile_id)
+    if not path:
+        return jsonify({"error": f"Profile not found: {profile_id}"}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"{profile_id}.prof")
 
 
 @app.route('/generate-reply', methods=['POST'])
@@ -59,6 +224,10 @@ def generate_reply():
     {
       "aiReply": "Great news! As a US citizen, you can apply..."
     }
+    
+    Streaming: send "stream": true (or Accept: text/event-stream) to receive
+    Server-Sent Events instead - "token" events with {"text": "..."} as the
+    reply is generated, then a final "done" event with the JSON above.
     """
     try:
         data = request.get_json()
@@ -72,6 +241,14 @@ def generate_reply():
         if not client_sequence:
             return jsonify({"error": "clientSequence is required"}), 400
         
+        if wants_stream(data, request.headers.get('Accept', '')):
+            events = stream_ai_reply(client_sequence, chat_history, provider=LLM_PROVIDER)
+            return Response(
+                stream_with_context(sse_stream(events)),
+                mimetype='text/event-stream',
+                headers=SSE_HEADERS
+            )
+        
         # Generate AI reply
         ai_reply = generate_ai_reply(
             client_sequence,
@@ -84,10 +261,38 @@ def generate_reply():
             "provider": LLM_PROVIDER
         })
     
+    except ProviderUnavailable as e:
+        # Provider failing or out of quota; tell the client when to come back instead of a 500
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(max(1, round(e.retry_after)))}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def wants_stream(data: dict, accept: str) -> bool:
+    """Whether a /generate-reply request asked for Server-Sent Events"""
+    return bool(data.get('stream')) or 'text/event-stream' in accept
+
+
+def sse_event(event: str, payload: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def sse_stream(events):
+    """Turn (kind, text) pairs from stream_ai_reply into SSE messages"""
+    try:
+        for kind, text in events:
+            if kind == "token":
+                yield sse_event("token", {"text": text})
+            else:
+                yield sse_event("done", {"aiReply": text, "provider": LLM_PROVIDER})
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+
+
 @app.route('/improve-ai', methods=['POST'])
 def improve_ai():
     """
@@ -220,41 +425,136 @@ def prompt_history():
         return jsonify({"error": str(e)}), 500
 
 
+def is_positive_int(value) -> bool:
+    # bool is an int subclass, but {"numSamples": true} is a mistake
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def run_training_job(params, start, on_result, should_stop):
+    """Run a background training job (see jobs.py)"""
+    train_on_sample_data(
+        num_samples=params['num_samples'],
+        provider=params['provider'],
+        concurrency=params.get('concurrency'),
+        batch_size=params.get('batch_size'),
+        start=start,
+        on_result=on_result,
+        should_stop=should_stop
+    )
+
+
+# Jobs left behind by a crashed or restarted worker are resumed at worker
+# startup (gunicorn.conf.py, or the __main__ block below), not on import
+training_jobs = TrainingJobRunner(Config.JOBS_DIR, run_training_job)
+
+
 @app.route('/train', methods=['POST'])
 def train():
     """
-    Train AI on sample data
+    Start training on sample data as a background job
     
     Request:
     {
-      "numSamples": 5
+      "numSamples": 5,
+      "concurrency": 4,   (optional, AI replies generated in parallel)
+      "batchSize": 5      (optional, samples per editor call)
     }
     
-    Response:
+    Response (202):
     {
-      "results": [...],
-      "summary": "Trained on 5 samples"
+      "jobId": "3f2c...",
+      "status": "queued",
+      "statusUrl": "/train/3f2c..."
     }
     """
     try:
-        data = request.get_json() or {}
+        data = request.get_json(silent=True) or {}
         num_samples = data.get('numSamples', 5)
         
-        results = train_on_sample_data(
-            num_samples=num_samples,
-            provider=LLM_PROVIDER
-        )
+        # Checked here, since a bad value would only fail later in the background job
+        for field, value, optional in (
+            ('numSamples', num_samples, False),
+            ('concurrency', data.get('concurrency'), True),
+            ('batchSize', data.get('batchSize'), True)
+        ):
+            if optional and value is None:
+                continue
+            if not is_positive_int(value):
+                return jsonify({"error": f"{field} must be a positive integer"}), 400
+        
+        job = training_jobs.submit({
+            'num_samples': num_samples,
+            'concurrency': data.get('concurrency'),
+            'batch_size': data.get('batchSize'),
+            'provider': LLM_PROVIDER
+        })
         
         return jsonify({
-            "results": results,
-            "summary": f"Trained on {num_samples} samples",
+            "jobId": job['id'],
+            "status": job['status'],
+            "statusUrl": f"/train/{job['id']}",
             "provider": LLM_PROVIDER
-        })
+        }), 202
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/train', methods=['GET'])
+def list_training_jobs():
+    """List recent training jobs (without results)"""
+    limit = request.args.get('limit', 20, type=int)
+    jobs = training_jobs.list_jobs(limit=limit)
+    return jsonify({"jobs": jobs, "count": len(jobs)})
+
+
+@app.route('/train/<job_id>', methods=['GET'])
+def training_job_status(job_id):
+    """
+    Get progress and results of a training job
+    
+    Response:
+    {
+      "jobId": "3f2c...",
+      "status": "running",      (queued, running, completed, failed, cancelled)
+      "progress": {"completed": 2, "total": 5},
+      "results": [...],
+      "summary": "Trained on 2 samples"
+    }
+    """
+    job = training_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": f"Training job not found: {job_id}"}), 404
+    
+    return jsonify({
+        "jobId": job['id'],
+        "status": job['status'],
+        "progress": job['progress'],
+        "results": job['results'],
+        "error": job['error'],
+        "cancelRequested": job['cancel_requested'],
+        "summary": f"Trained on {len(job['results'])} samples",
+        "provider": job['params'].get('provider')
+    })
+
+
+@app.route('/train/<job_id>', methods=['DELETE'])
+def cancel_training_job(job_id):
+    """Cancel a training job; a running job stops after its current sample"""
+    job = training_jobs.cancel(job_id)
+    if not job:
+        return jsonify({"error": f"Training job not found: {job_id}"}), 404
+    
+    return jsonify({
+        "jobId": job['id'],
+        "status": job['status'],
+        "cancelRequested": job['cancel_requested']
+    }), 202
+
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Only in the reloader's serving process, not the one watching files
+        training_jobs.resume_incomplete()
     app.run(host='0.0.0.0', port=port, debug=True)
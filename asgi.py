@@ -0,0 +1,200 @@
+"""
+ASGI entry point - serves /generate-reply on an asyncio event loop
+Every other route is delegated to the Flask app running in a thread pool
+
+Run with:
+    gunicorn asgi:app -k uvicorn_worker.UvicornWorker --workers 2
+"""
+
+import json
+import time
+from typing import Optional
+from a2wsgi import WSGIMiddleware
+from ai_system import agenerate_ai_reply, astream_ai_reply
+from app import app as flask_app, LLM_PROVIDER, SSE_HEADERS, profiler, sse_event, wants_stream
+from config import Config
+from timing import start_trace, end_trace, current_trace
+from metrics import record_http_request
+from profiling import token_matches
+from resilience import ProviderUnavailable
+
+# Flask routes (training, prompt management, ...) keep running synchronously
+wsgi_app = WSGIMiddleware(flask_app, workers=Config.WSGI_THREADS)
+
+
+async def app(scope, receive, send):
+    """Route async-capable endpoints to native handlers, everything else to Flask"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http' and scope['path'] == '/generate-reply' and scope['method'] == 'POST':
+        started = time.perf_counter()
+
+        async def send_and_record(message):
+            if message['type'] == 'http.response.start':
+                record_http_request('/generate-reply', 'POST', message['status'], time.perf_counter() - started)
+            await send(message)
+
+        await generate_reply(scope, receive, send_and_record)
+        return
+
+    await wsgi_app(scope, receive, send)
+
+
+async def generate_reply(scope, receive, send):
+    """
+    Async version of POST /generate-reply (same request and response shape as app.py)
+
+    Hundreds of replies can be in flight per worker since the LLM call is
+    awaited instead of holding a thread.
+    """
+    token = start_trace()
+    profile = _begin_profile(scope)
+    if profile is not None:
+        send = _profiled_send(send, profile)
+    body = b''
+    data = None
+    try:
+        body = await _read_body(receive)
+
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+
+        if not data:
+            await _send_json(send, {"error": "No JSON data provided"}, 400)
+            return
+
+        client_sequence = data.get('clientSequence', '')
+        chat_history = data.get('chatHistory', [])
+
+        if not client_sequence:
+            await _send_json(send, {"error": "clientSequence is required"}, 400)
+            return
+
+        accept = dict(scope.get('headers', [])).get(b'accept', b'').decode('latin-1')
+        if wants_stream(data, accept):
+            events = astream_ai_reply(client_sequence, chat_history, provider=LLM_PROVIDER)
+            await _send_sse(send, events)
+            return
+
+        ai_reply = await agenerate_ai_reply(
+            client_sequence,
+            chat_history,
+            provider=LLM_PROVIDER
+        )
+
+        await _send_json(send, {
+            "aiReply": ai_reply,
+            "provider": LLM_PROVIDER
+        })
+
+    except ProviderUnavailable as e:
+        await _send_json(send, {"error": str(e)}, 503, retry_after=e.retry_after)
+    except Exception as e:
+        if profile is not None:
+            profile['error'] = str(e)
+        await _send_json(send, {"error": str(e)}, 500)
+    finally:
+        if profile is not None:
+            _finish_profile(profile, scope, body, data)
+        end_trace(token)
+
+
+def _begin_profile(scope) -> Optional[dict]:
+    """
+    Same rules as app.begin_profile: X-Profile: <ADMIN_TOKEN> or PROFILE_SAMPLE_RATE
+
+    cProfile runs on the event loop thread, so the CPU profile also counts
+    other requests the loop served meanwhile; the stage trace is this request's only.
+    """
+    header = dict(scope.get('headers', [])).get(b'x-profile')
+    requested = token_matches(header.decode('latin-1') if header else None, Config.ADMIN_TOKEN)
+    if not profiler.should_profile(requested):
+        return None
+    profile = profiler.start()
+    if profile is None:
+        return None
+    return {'profile': profile, 'id': profiler.new_id(), 'trace': current_trace(), 'status': 500, 'error': None}
+
+
+def _profiled_send(send, profile: dict):
+    """Add X-Profile-Id to the response and remember its status"""
+    async def profiled_send(message):
+        if message['type'] == 'http.response.start':
+            profile['status'] = message['status']
+            message = dict(message, headers=list(message['headers']) + [(b'x-profile-id', profile['id'].encode())])
+        await send(message)
+    return profiled_send
+
+
+def _finish_profile(profile: dict, scope, body: bytes, data):
+    chat_history = data.get('chatHistory') if isinstance(data, dict) else None
+    try:
+        profiler.finish(profile['profile'], profile['id'], {
+            "method": scope['method'],
+            "path": scope['path'],
+            "route": scope['path'],
+            "status": profile['status'],
+            "error": profile['error'],
+            "request_bytes": len(body),
+            "chat_history_messages": len(chat_history) if isinstance(chat_history, list) else None
+        }, profile['trace'])
+    except OSError as e:
+        print(f"Warning: Could not save request profile: {e}")
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, payload: dict, status: int = 200, retry_after: Optional[float] = None):
+    body = json.dumps(payload).encode('utf-8')
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode())
+    ]
+    if retry_after is not None:
+        headers.append((b'retry-after', str(max(1, round(retry_after))).encode()))
+    trace = current_trace()
+    if trace is not None:
+        headers.append((b'server-timing', trace.server_timing().encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_sse(send, events):
+    """Stream (kind, text) pairs from astream_ai_reply as Server-Sent Events"""
+    headers = [(b'content-type', b'text/event-stream')]
+    headers += [(k.lower().encode(), v.encode()) for k, v in SSE_HEADERS.items()]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    try:
+        async for kind, text in events:
+            if kind == "token":
+                message = sse_event("token", {"text": text})
+            else:
+                message = sse_event("done", {"aiReply": text, "provider": LLM_PROVIDER})
+            await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+    except Exception as e:
+        message = sse_event("error", {"error": str(e)})
+        await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
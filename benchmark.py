@@ -0,0 +1,357 @@
+"""
+Benchmark - load test for the API endpoints with latency percentiles and per-stage breakdowns
+Requests are built from conversations.json; by default the app runs in-process against the fake LLM and prompt store
+
+Usage:
+    python3 benchmark.py --concurrency 16 --duration 30 --save baseline.json
+    python3 benchmark.py --concurrency 16 --duration 30 --compare baseline.json
+    python3 benchmark.py --url http://localhost:5000 --mix generate-reply=1
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+# name -> (method, path)
+ENDPOINTS = {
+    'generate-reply': ('POST', '/generate-reply'),
+    'improve-ai': ('POST', '/improve-ai'),
+    'prompt': ('GET', '/prompt'),
+    'prompt-history': ('GET', '/prompt-history')
+}
+
+DEFAULT_MIX = 'generate-reply=90,prompt=5,prompt-history=4,improve-ai=1'
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'generate-reply=9,prompt=1' -> {'generate-reply': 9.0, 'prompt': 1.0}"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' (choose from {', '.join(ENDPOINTS)})")
+        weights[name] = float(weight or 1)
+    if not any(weights.values()):
+        raise ValueError("Request mix has no weight")
+    return weights
+
+
+def build_payloads(conversations_path: str, limit: int = 500) -> List[Dict[str, Any]]:
+    """Request bodies for /generate-reply and /improve-ai from real training examples"""
+    from parse_conversations import extract_training_examples, iter_conversations
+    from llm_integration import format_client_sequence, format_consultant_reply
+
+    payloads = []
+    for example in extract_training_examples(iter_conversations(conversations_path)):
+        payloads.append({
+            'clientSequence': format_client_sequence(example['client_sequence']),
+            'chatHistory': list(example['chat_history']),
+            'consultantReply': format_consultant_reply(example['consultant_reply'])
+        })
+        if len(payloads) >= limit:
+            break
+    if not payloads:
+        raise ValueError(f"No training examples found in {conversations_path}")
+    return payloads
+
+
+class InProcessClient:
+    """Sends requests through Flask's test client (one per thread)"""
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[dict]) -> Tuple[int, str]:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class HttpClient:
+    """Sends requests to a running server"""
+
+    def __init__(self, base_url: str, timeout: float = 120):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+        self._requests = requests
+
+    def request(self, method: str, path: str, body: Optional[dict]) -> Tuple[int, str]:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.request(method, self.base_url + path, json=body, timeout=self.timeout)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+def run_benchmark(
+    client,
+    payloads: List[Dict[str, Any]],
+    mix: Dict[str, float],
+    concurrency: int = 8,
+    duration: Optional[float] = 30,
+    total_requests: Optional[int] = None,
+    warmup: int = 0,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Drive the app with `concurrency` closed-loop workers
+
+    Each worker sends its next request as soon as the previous one
+    finishes, picking the endpoint from `mix` by weight. The run stops after
+    `duration` seconds or `total_requests` requests, whichever comes first;
+    the first `warmup` requests are not measured.
+
+    Returns:
+        Report dict (see summarize)
+    """
+    from timing import parse_server_timing
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples: List[Tuple[str, float, bool, Dict[str, float]]] = []
+    lock = threading.Lock()
+    counter = {'sent': 0}
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+    measure_from = {'time': started}
+
+    def next_request_index() -> Optional[int]:
+        with lock:
+            if total_requests is not None and counter['sent'] >= total_requests + warmup:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            counter['sent'] += 1
+            return counter['sent']
+
+    def worker(worker_id: int):
+        rng = random.Random(f"{seed}:{worker_id}")
+        while True:
+            n = next_request_index()
+            if n is None:
+                return
+            name = rng.choices(names, weights)[0]
+            method, path = ENDPOINTS[name]
+            body = None
+            if method == 'POST':
+                payload = rng.choice(payloads)
+                body = {'clientSequence': payload['clientSequence'], 'chatHistory': payload['chatHistory']}
+                if name == 'improve-ai':
+                    body['consultantReply'] = payload['consultantReply']
+
+            t0 = time.perf_counter()
+            try:
+                status, server_timing = client.request(method, path, body)
+                ok = status < 400
+            except Exception:
+                server_timing, ok = '', False
+            latency = time.perf_counter() - t0
+
+            if n == warmup:
+                measure_from['time'] = time.perf_counter()
+            if n > warmup:
+                with lock:
+                    samples.append((name, latency, ok, parse_server_timing(server_timing)))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - measure_from['time']
+    return summarize(samples, elapsed)
+
+
+def summarize(samples: List[Tuple[str, float, bool, Dict[str, float]]], elapsed: float) -> Dict[str, Any]:
+    """Latency percentiles, throughput and mean/p95 per stage, overall and per endpoint"""
+    def stats(rows):
+        latencies = sorted(latency for _, latency, _, _ in rows)
+        errors = sum(1 for _, _, ok, _ in rows if not ok)
+        result = {
+            'requests': len(rows),
+            'errors': errors,
+            'rps': round(len(rows) / elapsed, 2) if elapsed > 0 else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            'p50_ms': _percentile_ms(latencies, 50),
+            'p95_ms': _percentile_ms(latencies, 95),
+            'p99_ms': _percentile_ms(latencies, 99)
+        }
+
+        stage_values: Dict[str, List[float]] = {}
+        for _, _, _, stages in rows:
+            for stage_name, ms in stages.items():
+                stage_values.setdefault(stage_name, []).append(ms)
+        result['stages'] = {
+            stage_name: {
+                'mean_ms': round(sum(values) / len(values), 2),
+                'p95_ms': round(sorted(values)[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))], 2),
+                'count': len(values)
+            }
+            for stage_name, values in sorted(stage_values.items())
+        }
+        return result
+
+    endpoints = {}
+    for name in sorted({row[0] for row in samples}):
+        endpoints[name] = stats([row for row in samples if row[0] == name])
+
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'overall': stats(samples),
+        'endpoints': endpoints
+    }
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.10) -> List[str]:
+    """
+    Regressions against a saved baseline
+
+    Flags any endpoint (and the overall run) whose p95/p99 latency grew, or
+    whose throughput fell, by more than `tolerance` (a fraction), and any
+    increase in the error count.
+    """
+    regressions = []
+    scopes = [('overall', report['overall'], baseline['overall'])]
+    scopes += [
+        (name, stats, baseline['endpoints'][name])
+        for name, stats in report['endpoints'].items()
+        if name in baseline['endpoints']
+    ]
+
+    for scope, current, before in scopes:
+        for key in ('p95_ms', 'p99_ms'):
+            if current[key] and before[key] and current[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{scope} {key}: {before[key]} -> {current[key]}")
+        if before['rps'] and current['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f"{scope} rps: {before['rps']} -> {current['rps']}")
+        if current['errors'] > before['errors']:
+            regressions.append(f"{scope} errors: {before['errors']} -> {current['errors']}")
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'endpoint':<18}{'reqs':>7}{'err':>5}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    rows = [('OVERALL', report['overall'])] + list(report['endpoints'].items())
+    for name, stats in rows:
+        lines.append(
+            f"{name:<18}{stats['requests']:>7}{stats['errors']:>5}{stats['rps']:>9}"
+            f"{_fmt(stats['p50_ms']):>10}{_fmt(stats['p95_ms']):>10}{_fmt(stats['p99_ms']):>10}"
+        )
+
+    for name, stats in report['endpoints'].items():
+        if stats['stages']:
+            lines.append(f"\n{name} stages (mean / p95 ms):")
+            for stage_name, stage_stats in stats['stages'].items():
+                lines.append(f"  {stage_name:<16}{stage_stats['mean_ms']:>10} / {stage_stats['p95_ms']}")
+    return '\n'.join(lines)
+
+
+def _percentile_ms(sorted_latencies: List[float], pct: float) -> Optional[float]:
+    if not sorted_latencies:
+        return None
+    index = min(len(sorted_latencies) - 1, int(round(pct / 100 * (len(sorted_latencies) - 1))))
+    return round(sorted_latencies[index] * 1000, 2)
+
+
+def _fmt(value: Optional[float]) -> str:
+    return '-' if value is None else f"{value:.1f}"
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API endpoints")
+    parser.add_argument('--url', help="Benchmark a running server instead of the in-process app")
+    parser.add_argument('--real', action='store_true', help="In-process: use the configured LLMs and Supabase instead of the fakes")
+    parser.add_argument('--reply-cache', action='store_true', help="Keep the reply cache on (off by default so every reply hits the pipeline)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to run (0 = until --requests)")
+    parser.add_argument('--requests', type=int, default=None, help="Stop after this many measured requests")
+    parser.add_argument('--warmup', type=int, default=20, help="Requests sent before measuring")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--conversations', default='conversations.json')
+    parser.add_argument('--save', help="Write the report to this JSON file (e.g. a release baseline)")
+    parser.add_argument('--compare', help="Baseline JSON to check for regressions; exits 1 if any")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed slowdown as a fraction (default 0.10)")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        # Must be set before the app (and its config) is imported
+        if not args.real:
+            os.environ.setdefault('PROMPT_STORE', 'fake')
+            os.environ.setdefault('LLM_PROVIDER', 'fake')
+        if not args.reply_cache:
+            os.environ['REPLY_CACHE_SIZE'] = '0'
+        from app import app as flask_app
+        client = InProcessClient(flask_app)
+
+    payloads = build_payloads(args.conversations)
+    print(f"Benchmarking {args.url or 'in-process app'}: concurrency {args.concurrency}, mix {args.mix}")
+
+    report = run_benchmark(
+        client, payloads, mix,
+        concurrency=args.concurrency,
+        duration=args.duration or None,
+        total_requests=args.requests,
+        warmup=args.warmup,
+        seed=args.seed
+    )
+    report['meta'] = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'target': args.url or 'in-process',
+        'llm_provider': os.getenv('LLM_PROVIDER', 'groq'),
+        'prompt_store': os.getenv('PROMPT_STORE', 'supabase'),
+        'fake_llm_latency_ms': os.getenv('FAKE_LLM_LATENCY_MS'),
+        'reply_cache': args.reply_cache,
+        'concurrency': args.concurrency,
+        'mix': mix,
+        'seed': args.seed
+    }
+    print(format_report(report))
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved report to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"\nNo regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Clients - lazily constructed, fork-safe API clients
+Provider SDKs and the Supabase client are only imported and built the first time they are used
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class ClientRegistry:
+    """
+    Builds each client on first use from a registered factory.
+
+    A factory returns the client, or None when it can't be built here (no
+    API key, package not installed); that outcome is remembered so the
+    import isn't retried on every call. Clients are dropped in forked
+    children (gunicorn --preload) so workers never share a parent's sockets.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+        self._clients.pop(name, None)
+
+    def get(self, name: str) -> Optional[Any]:
+        """The client for `name`, building it on first use (None if unavailable)"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        try:
+            return self._clients[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if name not in self._clients:
+                if name not in self._factories:
+                    raise ValueError(f"Unknown client: {name}")
+                self._clients[name] = self._factories[name]()
+            return self._clients[name]
+
+    def peek(self, name: str) -> Optional[Any]:
+        """The client for `name` if it has been built in this process, without building it"""
+        return self._clients.get(name) if self._pid == os.getpid() else None
+
+    def failed(self, name: str) -> bool:
+        """Whether building `name` was attempted in this process and gave no client"""
+        return self._pid == os.getpid() and name in self._clients and self._clients[name] is None
+
+    def loaded(self) -> List[str]:
+        """Names of clients built so far in this process"""
+        return sorted(name for name, client in self._clients.items() if client is not None)
+
+    def reset(self, name: Optional[str] = None):
+        """Forget built clients (all of them, or one) so they are rebuilt on next use"""
+        with self._lock:
+            if name is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(name, None)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+
+# Shared by llm_integration.py and database.py
+clients = ClientRegistry()
+
+
+class Readiness:
+    """
+    Runs warm-up steps once per process on a background thread.
+
+    The process reports ready once every step has succeeded. Failed steps
+    are retried every `retry_seconds`, so a provider outage at boot doesn't
+    leave the worker unready forever.
+    """
+
+    def __init__(self, steps: Dict[str, Callable[[], Any]], retry_seconds: float = 5.0):
+        self.steps = steps
+        self.retry_seconds = retry_seconds
+        self._checks: Dict[str, Dict[str, Any]] = {}
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start warming up in the background (no-op if already started in this process)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._checks = {name: {'ok': False, 'error': 'pending', 'ms': None} for name in self.steps}
+        threading.Thread(target=self._run, name='warmup', daemon=True).start()
+
+    def run(self) -> bool:
+        """Run every pending step once in the calling thread; True when all have succeeded"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._checks = {name: {'ok': False, 'error': 'pending', 'ms': None} for name in self.steps}
+        for name, step in self.steps.items():
+            if self._checks[name]['ok']:
+                continue
+            started = time.perf_counter()
+            try:
+                step()
+                error = None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            self._checks[name] = {
+                'ok': error is None,
+                'error': error,
+                'ms': round((time.perf_counter() - started) * 1000, 1)
+            }
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        return self._pid == os.getpid() and all(check['ok'] for check in self._checks.values())
+
+    def status(self) -> Dict[str, Any]:
+        if self._pid != os.getpid():
+            # Forked after warm-up started, or never started: warm this process now
+            self.start()
+        return {'ready': self.ready, 'checks': dict(self._checks)}
+
+    def _run(self):
+        while not self.run():
+            time.sleep(self.retry_seconds)
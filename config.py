@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,19 +10,167 @@ class Config:
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     
+    # LLM routing: LLM_PROVIDER=auto picks the fastest healthy provider;
+    # LLM_FAILOVER=true keeps the chosen provider first but fails over on errors
+    LLM_FAILOVER = os.getenv('LLM_FAILOVER', 'false').lower() == 'true'
+    LLM_HEDGE = os.getenv('LLM_HEDGE', 'false').lower() == 'true'
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+    
+    # Ask providers for JSON output (Groq/OpenAI JSON mode, Gemini JSON MIME
+    # type on SDKs that support it) for replies and editor runs
+    LLM_JSON_MODE = os.getenv('LLM_JSON_MODE', 'true').lower() == 'true'
+    
     # Supabase
     SUPABASE_URL = os.getenv('SUPABASE_URL')
     SUPABASE_KEY = os.getenv('SUPABASE_KEY')
     
+    # Local stand-ins for load tests and CI (no API keys or network needed).
+    # LLM_PROVIDER=fake calls the fake LLM directly; FAKE_LLM=true also lets
+    # "auto" routing pick it. Latency is the mean time to first token for a
+    # fixed/uniform/lognormal distribution; tokens/s 0 means instant output
+    FAKE_LLM = os.getenv('FAKE_LLM', 'false').lower() == 'true'
+    FAKE_LLM_LATENCY_MS = float(os.getenv('FAKE_LLM_LATENCY_MS', 300))
+    FAKE_LLM_DISTRIBUTION = os.getenv('FAKE_LLM_DISTRIBUTION', 'lognormal')
+    FAKE_LLM_LATENCY_SIGMA = float(os.getenv('FAKE_LLM_LATENCY_SIGMA', 0.5))
+    FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', 0))
+    FAKE_LLM_ERROR_RATE = float(os.getenv('FAKE_LLM_ERROR_RATE', 0))
+    FAKE_LLM_SEED = int(os.getenv('FAKE_LLM_SEED', 0))
+    
+    # PROMPT_STORE=fake keeps prompts in SQLite instead of Supabase; use a
+    # file for FAKE_STORE_PATH to share it between workers
+    PROMPT_STORE = os.getenv('PROMPT_STORE', 'supabase')
+    FAKE_STORE_PATH = os.getenv('FAKE_STORE_PATH', ':memory:')
+    FAKE_STORE_LATENCY_MS = float(os.getenv('FAKE_STORE_LATENCY_MS', 0))
+    
+    # Prompt cache (seconds before a cached prompt is revalidated by version)
+    PROMPT_CACHE_TTL = float(os.getenv('PROMPT_CACHE_TTL', 300))
+    
+    # Reply cache: max in-memory entries (0 disables), TTL in seconds, and an
+    # optional SQLite file that survives restarts and is shared by workers,
+    # capped at REPLY_CACHE_DISK_SIZE rows (oldest replies are evicted first,
+    # 0 = no limit)
+    REPLY_CACHE_SIZE = int(os.getenv('REPLY_CACHE_SIZE', 1000))
+    REPLY_CACHE_TTL = float(os.getenv('REPLY_CACHE_TTL', 3600))
+    REPLY_CACHE_PATH = os.getenv('REPLY_CACHE_PATH', '')
+    REPLY_CACHE_DISK_SIZE = int(os.getenv('REPLY_CACHE_DISK_SIZE', 100000))
+    
+    # Share one LLM call between identical reply requests in flight at the
+    # same time (duplicate webhook deliveries); per worker process
+    REPLY_COALESCE = os.getenv('REPLY_COALESCE', 'true').lower() == 'true'
+    
+    # Chat history window: token budget for inlined history (0 disables),
+    # recent messages kept verbatim, and size of the rolling summary
+    HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 3000))
+    HISTORY_KEEP_MESSAGES = int(os.getenv('HISTORY_KEEP_MESSAGES', 8))
+    HISTORY_SUMMARY_TOKENS = int(os.getenv('HISTORY_SUMMARY_TOKENS', 300))
+    
+    # Training data and its compiled example index (defaults to <source>.idx)
+    CONVERSATIONS_PATH = os.getenv('CONVERSATIONS_PATH', 'conversations.json')
+    EXAMPLE_INDEX_PATH = os.getenv('EXAMPLE_INDEX_PATH', '')
+    
+    # AI replies generated in parallel during /train (editor steps stay serial)
+    TRAIN_CONCURRENCY = int(os.getenv('TRAIN_CONCURRENCY', 4))
+    
+    # Training samples per editor call (1 = one prompt revision per sample)
+    EDITOR_BATCH_SIZE = int(os.getenv('EDITOR_BATCH_SIZE', 1))
+    
+    # Directory for background training job state (mount a volume to keep
+    # jobs across container restarts)
+    JOBS_DIR = os.getenv('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'issa_train_jobs'))
+    
+    # Offline evaluation (evaluation.py): share of contacts held out of
+    # training (0 = none, so /train uses every contact), generations in
+    # parallel and per minute (0 = unlimited), and the score drop that counts
+    # as a regression
+    EVAL_HOLDOUT_FRACTION = float(os.getenv('EVAL_HOLDOUT_FRACTION', 0))
+    EVAL_CONCURRENCY = int(os.getenv('EVAL_CONCURRENCY', 4))
+    EVAL_RPM = float(os.getenv('EVAL_RPM', 60))
+    EVAL_REGRESSION_TOLERANCE = float(os.getenv('EVAL_REGRESSION_TOLERANCE', 0.02))
+    
+    # Held-out examples to score editor revisions on before saving them
+    # (0 disables the gate; each check costs two generations per example)
+    EVAL_GATE_SAMPLES = int(os.getenv('EVAL_GATE_SAMPLES', 0))
+    
+    # Times to re-run an editor call when another request updated the prompt first
+    PROMPT_UPDATE_RETRIES = int(os.getenv('PROMPT_UPDATE_RETRIES', 2))
+    
+    # File shared by all workers on a host to announce new prompt versions
+    # (set to an empty string to disable cross-worker invalidation)
+    PROMPT_SYNC_FILE = os.getenv(
+        'PROMPT_SYNC_FILE',
+        os.path.join(tempfile.gettempdir(), 'issa_prompt_versions.json')
+    )
+    
+    # Prometheus metrics: directory where each worker publishes its counters
+    # so /metrics covers the whole host ('' = per-process only)
+    METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'issa_metrics'))
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+    
+    # Provider call resilience (resilience.py): attempts per call, full-jitter
+    # backoff base/cap in seconds (a provider's Retry-After wins), total
+    # seconds per call including retries (live replies, then background
+    # training/editor/evaluation calls, whose outputs are much longer), and
+    # consecutive failures that open a provider's circuit breaker (0
+    # disables) and how long it stays open
+    LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', 3))
+    LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 0.5))
+    LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 8))
+    LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', 30))
+    LLM_BACKGROUND_DEADLINE = float(os.getenv('LLM_BACKGROUND_DEADLINE', 120))
+    LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 5))
+    LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30))
+    
+    # Client-side provider quotas (rate_limit.py), e.g. "groq=30/12000" for
+    # requests/tokens per minute ('' disables). All workers share the buckets
+    # in RATE_LIMIT_PATH. HEADROOM is the share of each quota we use. RESERVE
+    # is the share training/editor/evaluation calls leave for live replies.
+    # MAX_WAIT is how long a live (or background) call waits before failing.
+    # COMPLETION_TOKENS is the output size assumed until the provider reports usage.
+    RATE_LIMITS = os.getenv('RATE_LIMITS', '')
+    RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', os.path.join(tempfile.gettempdir(), 'issa_rate_limits.sqlite'))
+    RATE_LIMIT_HEADROOM = float(os.getenv('RATE_LIMIT_HEADROOM', 0.9))
+    RATE_LIMIT_RESERVE = float(os.getenv('RATE_LIMIT_RESERVE', 0.25))
+    RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 10))
+    RATE_LIMIT_BACKGROUND_MAX_WAIT = float(os.getenv('RATE_LIMIT_BACKGROUND_MAX_WAIT', 300))
+    RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv('RATE_LIMIT_COMPLETION_TOKENS', 600))
+    
+    # Connection pool shared by the Groq/OpenAI SDKs and Supabase, per worker:
+    # pool limits, idle keep-alive seconds, timeouts in seconds (pool = wait
+    # for a free connection), and HTTP/2 (needs the h2 package)
+    HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 50))
+    HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', 20))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 60))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 60))
+    HTTP_POOL_TIMEOUT = float(os.getenv('HTTP_POOL_TIMEOUT', 10))
+    HTTP2 = os.getenv('HTTP2', 'true').lower() == 'true'
+    
+    # Warm provider clients and the prompt cache when a worker starts (/ready
+    # returns 503 until done), retrying failed steps every few seconds
+    WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'true').lower() == 'true'
+    WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', 5))
+    
+    # Token for /admin routes and the X-Profile header ('' disables both)
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+    
+    # Request profiling: share of requests profiled automatically (0-1),
+    # where profiles are written, and how many are kept
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'issa_profiles'))
+    PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 100))
+    
     # Flask
     FLASK_ENV = os.getenv('FLASK_ENV', 'development')
     PORT = int(os.getenv('PORT', 5000))
     
+    # Threads per worker for Flask routes when served through asgi.py
+    WSGI_THREADS = int(os.getenv('WSGI_THREADS', 10))
+    
     @classmethod
     def validate(cls):
         """Validate that required config is present"""
-        if not cls.GROQ_API_KEY and not cls.GEMINI_API_KEY:
+        if not cls.GROQ_API_KEY and not cls.GEMINI_API_KEY and not cls.FAKE_LLM:
             raise ValueError("At least one LLM API key (GROQ or GEMINI) is required")
-        if not cls.SUPABASE_URL or not cls.SUPABASE_KEY:
+        if cls.PROMPT_STORE != 'fake' and (not cls.SUPABASE_URL or not cls.SUPABASE_KEY):
             raise ValueError("Supabase credentials are required")
         return True
@@ -4,15 +4,61 @@ Manages AI prompt storage and retrieval
 """
 
 from typing import Optional, Dict, Any
-from datetime import datetime
 from config import Config
+from prompt_cache import PromptCache
+from prompt_sync import PromptVersionBoard
+from timing import stage
+from metrics import registry as metrics
+from clients import clients
 
-try:
-    from supabase import create_client, Client
-    supabase: Client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY) if Config.SUPABASE_URL and Config.SUPABASE_KEY else None
-except ImportError:
-    print("Supabase package not installed. Run: pip install supabase")
-    supabase = None
+
+def _make_supabase():
+    """Build the Supabase client (or its SQLite stand-in) on first use"""
+    if Config.PROMPT_STORE == 'fake':
+        # SQLite stand-in with the same client API (see fake_store.py)
+        from fake_store import FakeSupabase
+        return FakeSupabase(Config.FAKE_STORE_PATH, latency_ms=Config.FAKE_STORE_LATENCY_MS)
+    
+    if not Config.SUPABASE_URL or not Config.SUPABASE_KEY:
+        return None
+    try:
+        from supabase import create_client, ClientOptions
+    except ImportError:
+        print("Supabase package not installed. Run: pip install supabase")
+        return None
+    
+    # Share the provider SDKs' keep-alive connection pool (see http_pool.py)
+    from http_pool import http_client
+    return create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY, options=ClientOptions(httpx_client=http_client()))
+
+
+clients.register('supabase', _make_supabase)
+
+
+def get_supabase():
+    """The Supabase client, or None if it isn't configured"""
+    return clients.get('supabase')
+
+# In-process cache of the latest prompt per type (see prompt_cache.py)
+prompt_cache = PromptCache(ttl_seconds=Config.PROMPT_CACHE_TTL)
+
+# Versions published by any worker on this host (see prompt_sync.py). An
+# in-memory fake store is private to each process, so its versions mean
+# nothing to other workers
+_private_store = Config.PROMPT_STORE == 'fake' and Config.FAKE_STORE_PATH == ':memory:'
+version_board = PromptVersionBoard('' if _private_store else Config.PROMPT_SYNC_FILE)
+
+
+def _prompt_cache_metrics():
+    stats = prompt_cache.stats()
+    return [
+        ('issa_cache_requests_total', {'cache': 'prompt', 'result': 'hit'}, stats['hits']),
+        ('issa_cache_requests_total', {'cache': 'prompt', 'result': 'revalidated'}, stats['revalidations']),
+        ('issa_cache_requests_total', {'cache': 'prompt', 'result': 'miss'}, stats['misses'])
+    ]
+
+
+metrics.add_collector(_prompt_cache_metrics)
 
 
 # Database Schema SQL (for reference - create this in Supabase SQL Editor)
@@ -42,11 +88,52 @@ CREATE TABLE IF NOT EXISTS prompt_history (
 -- Create index for faster queries
 CREATE INDEX IF NOT EXISTS idx_prompts_type ON prompts(prompt_type);
 CREATE INDEX IF NOT EXISTS idx_prompts_updated ON prompts(updated_at DESC);
+
+-- Atomic versioned update: history insert + version bump in one call.
+-- Pass p_expected_version to reject the write if someone else updated first.
+CREATE OR REPLACE FUNCTION update_prompt_versioned(
+    p_prompt_type VARCHAR,
+    p_new_prompt TEXT,
+    p_change_reason TEXT,
+    p_expected_version INTEGER DEFAULT NULL
+) RETURNS JSONB AS $$
+DECLARE
+    current_row prompts%ROWTYPE;
+    updated_row prompts%ROWTYPE;
+BEGIN
+    SELECT * INTO current_row FROM prompts
+    WHERE prompt_type = p_prompt_type
+    ORDER BY updated_at DESC
+    LIMIT 1
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'missing');
+    END IF;
+
+    IF p_expected_version IS NOT NULL AND current_row.version <> p_expected_version THEN
+        RETURN jsonb_build_object('status', 'conflict', 'prompt', to_jsonb(current_row));
+    END IF;
+
+    INSERT INTO prompt_history (prompt_id, old_prompt, new_prompt, change_reason)
+    VALUES (current_row.id, current_row.prompt_text, p_new_prompt, p_change_reason);
+
+    UPDATE prompts
+    SET prompt_text = p_new_prompt,
+        version = current_row.version + 1,
+        updated_at = NOW()
+    WHERE id = current_row.id
+    RETURNING * INTO updated_row;
+
+    RETURN jsonb_build_object('status', 'updated', 'prompt', to_jsonb(updated_row));
+END;
+$$ LANGUAGE plpgsql;
 """
 
 
 def init_database():
     """Initialize database with default prompts"""
+    supabase = get_supabase()
     if not supabase:
         raise ValueError("Supabase client not initialized")
     
@@ -89,86 +176,165 @@ def get_prompt(prompt_type: str = 'chatbot') -> str:
     Returns:
         The prompt text
     """
+    return get_prompt_record(prompt_type)['prompt_text']
+
+
+def get_prompt_record(prompt_type: str = 'chatbot') -> Dict[str, Any]:
+    """
+    Get the latest prompt text and version, served from the prompt cache when possible
+    
+    Fresh cache entries are returned without touching the database unless
+    another worker has published a newer version. Expired entries are
+    revalidated with a version-only query and the prompt text is only
+    refetched when the stored version has changed.
+    
+    Args:
+        prompt_type: 'chatbot' or 'editor'
+    
+    Returns:
+        Dict with 'prompt_text' and 'version'
+    """
+    supabase = get_supabase()
     if not supabase:
         # Fallback to local prompts if database unavailable
         from prompts import CHATBOT_PROMPT, EDITOR_PROMPT
-        return CHATBOT_PROMPT if prompt_type == 'chatbot' else EDITOR_PROMPT
+        text = CHATBOT_PROMPT if prompt_type == 'chatbot' else EDITOR_PROMPT
+        return {'prompt_text': text, 'version': 0}
+    
+    # Drop our copy if another worker has already written a newer version
+    published = version_board.get(prompt_type)
+    current = prompt_cache.peek(prompt_type)
+    if published is not None and current and current['version'] < published:
+        prompt_cache.invalidate(prompt_type)
     
-    result = supabase.table('prompts')\
-        .select('prompt_text')\
-        .eq('prompt_type', prompt_type)\
-        .order('updated_at', desc=True)\
-        .limit(1)\
-        .execute()
+    cached = prompt_cache.get(prompt_type)
+    if cached:
+        return cached
+    
+    if prompt_cache.peek(prompt_type):
+        version = _fetch_prompt_version(prompt_type)
+        revalidated = prompt_cache.revalidate(prompt_type, version)
+        if revalidated:
+            return revalidated
+    
+    prompt_cache.record_miss()
+    with stage('db_prompt'):
+        result = supabase.table('prompts')\
+            .select('prompt_text, version')\
+            .eq('prompt_type', prompt_type)\
+            .order('updated_at', desc=True)\
+            .limit(1)\
+            .execute()
     
     if result.data:
-        return result.data[0]['prompt_text']
+        row = result.data[0]
+        return prompt_cache.set(prompt_type, row['prompt_text'], row['version'])
     else:
         raise ValueError(f"No prompt found for type: {prompt_type}")
 
 
-def update_prompt(prompt_type: str, new_prompt: str, change_reason: str = "Manual update") -> Dict[str, Any]:
+def _fetch_prompt_version(prompt_type: str) -> Optional[int]:
+    """Fetch only the current version number (cheap revalidation query)"""
+    with stage('db_prompt'):
+        result = get_supabase().table('prompts')\
+            .select('version')\
+            .eq('prompt_type', prompt_type)\
+            .order('updated_at', desc=True)\
+            .limit(1)\
+            .execute()
+    
+    return result.data[0]['version'] if result.data else None
+
+
+def get_prompt_cache_stats() -> Dict[str, Any]:
+    """Get prompt cache hit/miss counters"""
+    return prompt_cache.stats()
+
+
+class PromptVersionConflict(ValueError):
+    """Raised when a prompt changed since the caller read it (compare-and-swap failed)"""
+    
+    def __init__(self, prompt_type: str, expected_version: int, current_version: int):
+        super().__init__(
+            f"Prompt '{prompt_type}' is at version {current_version}, expected {expected_version}"
+        )
+        self.prompt_type = prompt_type
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+def update_prompt(
+    prompt_type: str,
+    new_prompt: str,
+    change_reason: str = "Manual update",
+    expected_version: Optional[int] = None
+) -> Dict[str, Any]:
     """
     Update prompt in database and log the change
     
+    Runs as a single atomic call to the update_prompt_versioned() stored
+    procedure, which locks the current row, writes prompt_history and bumps
+    the version together.
+    
     Args:
         prompt_type: 'chatbot' or 'editor'
         new_prompt: The updated prompt text
         change_reason: Explanation of what changed
+        expected_version: Only apply the update if the stored version still matches
     
     Returns:
         Updated prompt record
+    
+    Raises:
+        PromptVersionConflict: if expected_version no longer matches; re-read and retry
     """
+    supabase = get_supabase()
     if not supabase:
         raise ValueError("Supabase client not initialized")
     
-    # Get current prompt
-    current = supabase.table('prompts')\
-        .select('*')\
-        .eq('prompt_type', prompt_type)\
-        .order('updated_at', desc=True)\
-        .limit(1)\
-        .execute()
+    with stage('db_update'):
+        result = supabase.rpc('update_prompt_versioned', {
+            'p_prompt_type': prompt_type,
+            'p_new_prompt': new_prompt,
+            'p_change_reason': change_reason,
+            'p_expected_version': expected_version
+        }).execute()
     
-    if not current.data:
+    outcome = result.data or {}
+    status = outcome.get('status')
+    row = outcome.get('prompt')
+    
+    if status == 'missing':
         raise ValueError(f"No existing prompt found for type: {prompt_type}")
     
-    old_prompt = current.data[0]['prompt_text']
-    prompt_id = current.data[0]['id']
-    old_version = current.data[0]['version']
-    
-    # Log to history
-    supabase.table('prompt_history').insert({
-        'prompt_id': prompt_id,
-        'old_prompt': old_prompt,
-        'new_prompt': new_prompt,
-        'change_reason': change_reason
-    }).execute()
-    
-    # Update prompt
-    result = supabase.table('prompts')\
-        .update({
-            'prompt_text': new_prompt,
-            'version': old_version + 1,
-            'updated_at': datetime.utcnow().isoformat()
-        })\
-        .eq('id', prompt_id)\
-        .execute()
+    if status == 'conflict':
+        # The procedure returns the winning row, so the retry can start from the cache
+        prompt_cache.set(prompt_type, row['prompt_text'], row['version'])
+        version_board.publish(prompt_type, row['version'])
+        raise PromptVersionConflict(prompt_type, expected_version, row['version'])
     
-    return result.data[0] if result.data else None
+    if row:
+        prompt_cache.set(prompt_type, row['prompt_text'], row['version'])
+        version_board.publish(prompt_type, row['version'])
+        return row
+    
+    prompt_cache.invalidate(prompt_type)
+    return None
 
 
 def get_prompt_history(prompt_type: str, limit: int = 10) -> list:
     """Get prompt change history"""
+    supabase = get_supabase()
     if not supabase:
         return []
     
     # Get prompt ID
-    prompt = supabase.table('prompts')\
-        .select('id')\
-        .eq('prompt_type', prompt_type)\
-        .limit(1)\
-        .execute()
+    with stage('db_history'):
+        prompt = supabase.table('prompts')\
+            .select('id')\
+            .eq('prompt_type', prompt_type)\
+            .limit(1)\
+            .execute()
     
     if not prompt.data:
         return []
@@ -176,21 +342,39 @@ def get_prompt_history(prompt_type: str, limit: int = 10) -> list:
     prompt_id = prompt.data[0]['id']
     
     # Get history
-    result = supabase.table('prompt_history')\
-        .select('*')\
-        .eq('prompt_id', prompt_id)\
-        .order('created_at', desc=True)\
-        .limit(limit)\
-        .execute()
+    with stage('db_history'):
+        result = supabase.table('prompt_history')\
+            .select('*')\
+            .eq('prompt_id', prompt_id)\
+            .order('created_at', desc=True)\
+            .limit(limit)\
+            .execute()
     
     return result.data
 
 
+def get_prompt_history_entry(history_id: int) -> Optional[dict]:
+    """Get one prompt_history row by id"""
+    supabase = get_supabase()
+    if not supabase:
+        return None
+    
+    with stage('db_history'):
+        result = supabase.table('prompt_history')\
+            .select('*')\
+            .eq('id', history_id)\
+            .limit(1)\
+            .execute()
+    
+    return result.data[0] if result.data else None
+
+
 def test_database():
     """Test database connection and operations"""
     print("Testing Supabase Database Integration...")
     print("=" * 60)
     
+    supabase = get_supabase()
     if not supabase:
         print("✗ Supabase client not initialized")
         print("Please set SUPABASE_URL and SUPABASE_KEY in .env")
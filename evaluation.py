@@ -0,0 +1,370 @@
+"""
+Evaluation - offline scoring of chatbot prompt versions
+Replays held-out training examples through a prompt and measures how close its replies are to the real consultant's
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+from config import Config
+from database import get_prompt_record, get_prompt_history_entry
+from example_index import use_example_index
+from llm_integration import format_client_sequence, format_consultant_reply
+from rate_limit import in_background
+
+METRICS = ('token_f1', 'rouge_l', 'tfidf_cosine')
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def resolve_prompt(source: str) -> Tuple[str, str]:
+    """
+    Prompt text for an evaluation source.
+
+    Sources:
+        current        the live chatbot prompt
+        history:<id>   the prompt saved by prompt_history row <id>
+        file:<path>    a prompt kept in a local file
+
+    Returns:
+        (label, prompt_text)
+    """
+    if source == 'current':
+        record = get_prompt_record('chatbot')
+        return f"current (v{record['version']})", record['prompt_text']
+
+    kind, _, value = source.partition(':')
+    if kind == 'history' and value.isdigit():
+        entry = get_prompt_history_entry(int(value))
+        if not entry:
+            raise ValueError(f"No prompt_history entry {value}")
+        return source, entry['new_prompt']
+    if kind == 'file' and value:
+        with open(value, 'r', encoding='utf-8') as f:
+            return source, f.read()
+
+    raise ValueError(f"Unknown prompt source '{source}' (use current, history:<id> or file:<path>)")
+
+
+def is_held_out(contact_id: str, fraction: Optional[float] = None) -> bool:
+    """
+    Whether a contact's conversations belong to the evaluation split.
+
+    The split is a hash of the contact id, so it's stable across runs and
+    machines and a conversation never lands on both sides.
+    """
+    fraction = Config.EVAL_HOLDOUT_FRACTION if fraction is None else fraction
+    if fraction <= 0:
+        return False
+    bucket = int.from_bytes(hashlib.sha256(contact_id.encode('utf-8')).digest()[:8], 'big')
+    return bucket / 2 ** 64 < fraction
+
+
+def held_out_examples(limit: Optional[int] = None, scenario: Optional[str] = None) -> List[Any]:
+    """Examples from the evaluation split, in corpus order"""
+    examples = []
+    with use_example_index(Config.CONVERSATIONS_PATH, Config.EXAMPLE_INDEX_PATH or None) as index:
+        for example in index:
+            if scenario and example.scenario != scenario:
+                continue
+            if is_held_out(example.contact_id):
+                examples.append(example)
+                if limit and len(examples) >= limit:
+                    break
+    return examples
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def token_f1(candidate: List[str], reference: List[str]) -> float:
+    """Unigram overlap F1 (as used for SQuAD answers)"""
+    if not candidate or not reference:
+        return float(candidate == reference)
+    overlap = sum((Counter(candidate) & Counter(reference)).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / len(candidate)
+    recall = overlap / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_l(candidate: List[str], reference: List[str]) -> float:
+    """ROUGE-L F1: longest common subsequence of tokens, so word order counts"""
+    if not candidate or not reference:
+        return float(candidate == reference)
+    previous = [0] * (len(reference) + 1)
+    for token in candidate:
+        current = [0]
+        for j, ref_token in enumerate(reference):
+            current.append(previous[j] + 1 if token == ref_token else max(previous[j + 1], current[j]))
+        previous = current
+    lcs = previous[-1]
+    if not lcs:
+        return 0.0
+    precision = lcs / len(candidate)
+    recall = lcs / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+def build_idf(documents: Iterable[List[str]]) -> Dict[str, float]:
+    """Smoothed inverse document frequency over tokenized documents"""
+    counts = Counter()
+    total = 0
+    for tokens in documents:
+        counts.update(set(tokens))
+        total += 1
+    return {token: math.log((1 + total) / (1 + n)) + 1 for token, n in counts.items()}
+
+
+def tfidf_cosine(candidate: List[str], reference: List[str], idf: Dict[str, float]) -> float:
+    """Cosine similarity of TF-IDF vectors; unseen tokens get the highest idf weight"""
+    if not candidate or not reference:
+        return float(candidate == reference)
+    default = max(idf.values(), default=1.0)
+    a = {t: n * idf.get(t, default) for t, n in Counter(candidate).items()}
+    b = {t: n * idf.get(t, default) for t, n in Counter(reference).items()}
+    dot = sum(weight * b[t] for t, weight in a.items() if t in b)
+    norm = math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values()))
+    return dot / norm if norm else 0.0
+
+
+class RateLimiter:
+    """Spaces call start times so at most `per_minute` begin in any minute (0 = unlimited)"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def evaluate_prompt(
+    generate_reply: Callable[..., str],
+    prompt_text: str,
+    examples: List[Any],
+    provider: str = "groq",
+    concurrency: Optional[int] = None,
+    requests_per_minute: Optional[float] = None,
+    label: str = 'prompt'
+) -> Dict[str, Any]:
+    """
+    Score a prompt against training examples
+
+    Replies are generated concurrently (at most `concurrency` in flight and
+    `requests_per_minute` started per minute) and compared with the real
+    consultant reply using token F1, ROUGE-L and TF-IDF cosine similarity.
+
+    Args:
+        generate_reply: generate_ai_reply, or any function with its signature
+        prompt_text: Chatbot prompt to evaluate
+        examples: Training examples (see held_out_examples)
+        provider: LLM provider to use
+        concurrency: Max generations in parallel (default EVAL_CONCURRENCY)
+        requests_per_minute: Generation rate limit (default EVAL_RPM, 0 = unlimited)
+        label: Name for the prompt in the report
+
+    Returns:
+        Report with overall and per-scenario mean scores, latency and errors
+    """
+    concurrency = max(1, concurrency or Config.EVAL_CONCURRENCY)
+    limiter = RateLimiter(Config.EVAL_RPM if requests_per_minute is None else requests_per_minute)
+    references = [format_consultant_reply(ex['consultant_reply']) for ex in examples]
+    idf = build_idf(tokenize(ref) for ref in references)
+
+    def run(i):
+        example = examples[i]
+        limiter.wait()
+        start = time.perf_counter()
+        try:
+            reply = generate_reply(
+                format_client_sequence(example['client_sequence']),
+                example['chat_history'],
+                provider,
+                system_prompt=prompt_text
+            )
+        except Exception as e:
+            return {'scenario': example['scenario'], 'error': str(e)}
+        latency = time.perf_counter() - start
+
+        candidate, reference = tokenize(reply), tokenize(references[i])
+        return {
+            'scenario': example['scenario'],
+            'contact_id': example['contact_id'],
+            'latency': latency,
+            'ai_reply': reply,
+            'real_reply': references[i],
+            'scores': {
+                'token_f1': token_f1(candidate, reference),
+                'rouge_l': rouge_l(candidate, reference),
+                'tfidf_cosine': tfidf_cosine(candidate, reference, idf)
+            }
+        }
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='eval') as pool:
+        # Evaluation is offline work, so live replies get the provider quota first
+        results = list(pool.map(in_background(run), range(len(examples))))
+
+    scored = [r for r in results if 'scores' in r]
+    scenarios = {}
+    for scenario in sorted({r['scenario'] for r in results}):
+        in_scenario = [r for r in results if r['scenario'] == scenario]
+        scenarios[scenario] = _summarize(in_scenario)
+
+    latencies = sorted(r['latency'] for r in scored)
+    return {
+        'label': label,
+        'provider': provider,
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'latency_p50_seconds': _percentile(latencies, 50),
+        'latency_p95_seconds': _percentile(latencies, 95),
+        'overall': _summarize(results),
+        'scenarios': scenarios,
+        'results': results
+    }
+
+
+def compare_reports(
+    baseline: Dict[str, Any],
+    candidate: Dict[str, Any],
+    tolerance: Optional[float] = None,
+    min_samples: int = 3
+) -> Dict[str, Any]:
+    """
+    Find where a candidate prompt scores worse than the baseline
+
+    A regression is a drop of more than `tolerance` in the combined score,
+    overall or in any scenario with at least `min_samples` scored examples
+    on both sides. A higher error count overall also counts.
+
+    Returns:
+        Dict with per-scope score deltas and the list of regressions
+    """
+    tolerance = Config.EVAL_REGRESSION_TOLERANCE if tolerance is None else tolerance
+    scopes = [('overall', baseline['overall'], candidate['overall'])]
+    for scenario, stats in candidate['scenarios'].items():
+        if scenario in baseline['scenarios']:
+            scopes.append((scenario, baseline['scenarios'][scenario], stats))
+
+    deltas = {}
+    regressions = []
+    for scope, before, after in scopes:
+        if before['scored'] < min_samples or after['scored'] < min_samples:
+            continue
+        delta = round(after['score'] - before['score'], 4)
+        deltas[scope] = delta
+        if delta < -tolerance:
+            regressions.append({
+                'scope': scope,
+                'baseline': before['score'],
+                'candidate': after['score'],
+                'delta': delta
+            })
+
+    if candidate['overall']['errors'] > baseline['overall']['errors']:
+        regressions.append({
+            'scope': 'errors',
+            'baseline': baseline['overall']['errors'],
+            'candidate': candidate['overall']['errors'],
+            'delta': candidate['overall']['errors'] - baseline['overall']['errors']
+        })
+
+    return {'deltas': deltas, 'regressions': regressions}
+
+
+def _summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    scored = [r['scores'] for r in results if 'scores' in r]
+    summary = {'samples': len(results), 'scored': len(scored), 'errors': len(results) - len(scored)}
+    for metric in METRICS:
+        summary[metric] = round(sum(s[metric] for s in scored) / len(scored), 4) if scored else 0.0
+    summary['score'] = round(sum(summary[m] for m in METRICS) / len(METRICS), 4)
+    return summary
+
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 3)
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Plain-text table of a report's overall and per-scenario scores"""
+    header = f"{'scope':<28}{'n':>5}{'err':>5}" + ''.join(f"{m:>14}" for m in METRICS) + f"{'score':>9}"
+    lines = [f"{report['label']} ({report['provider']}, {report['wall_seconds']}s)", header]
+    rows = [('OVERALL', report['overall'])] + list(report['scenarios'].items())
+    for scope, stats in rows:
+        lines.append(
+            f"{scope[:27]:<28}{stats['samples']:>5}{stats['errors']:>5}"
+            + ''.join(f"{stats[m]:>14.4f}" for m in METRICS)
+            + f"{stats['score']:>9.4f}"
+        )
+    return '\n'.join(lines)
+
+
+def main():
+    """Evaluate a prompt version; exits with status 1 if it regresses against the baseline"""
+    from ai_system import generate_ai_reply
+
+    parser = argparse.ArgumentParser(description="Score chatbot prompt versions on held-out examples")
+    parser.add_argument('--prompt', default='current', help="current, history:<id> or file:<path>")
+    parser.add_argument('--baseline', help="Prompt to compare against (same formats as --prompt)")
+    parser.add_argument('--samples', type=int, default=50, help="Held-out examples to score")
+    parser.add_argument('--scenario', help="Only score examples from this scenario")
+    parser.add_argument('--provider', default='groq')
+    parser.add_argument('--concurrency', type=int, default=None)
+    parser.add_argument('--rpm', type=float, default=None, help="Max generations started per minute")
+    parser.add_argument('--tolerance', type=float, default=None)
+    parser.add_argument('--output', help="Write the full JSON report(s) to this file")
+    args = parser.parse_args()
+
+    examples = held_out_examples(args.samples, args.scenario)
+    if not examples:
+        print("No held-out examples (check EVAL_HOLDOUT_FRACTION and CONVERSATIONS_PATH)")
+        return 2
+
+    def run(source):
+        label, prompt_text = resolve_prompt(source)
+        report = evaluate_prompt(
+            generate_ai_reply, prompt_text, examples, args.provider,
+            concurrency=args.concurrency, requests_per_minute=args.rpm, label=label
+        )
+        print(format_report(report) + '\n')
+        return report
+
+    output = {'candidate': run(args.prompt)}
+    status = 0
+    if args.baseline:
+        output['baseline'] = run(args.baseline)
+        output['comparison'] = compare_reports(output['baseline'], output['candidate'], args.tolerance)
+        for regression in output['comparison']['regressions']:
+            print(f"REGRESSION {regression['scope']}: {regression['baseline']} -> {regression['candidate']}")
+        status = 1 if output['comparison']['regressions'] else 0
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
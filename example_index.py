@@ -0,0 +1,326 @@
+"""
+Example Index - precompiled, memory-mapped training examples
+Built once from conversations.json so training runs don't re-parse the whole corpus
+
+File layout:
+    MAGIC | header offset (8 bytes, little-endian) | conversation records | tables | header JSON
+
+Each conversation that yields training examples is stored once, as a compact
+JSON record, and every example is just (conversation, client_start,
+reply_start, reply_end) offsets into it, so the file grows linearly with the
+corpus rather than with the square of conversation length. Records are
+streamed to disk as they are extracted and the tables and header are written
+last, so building the index needs memory only for the offset tables.
+
+The tables are fixed-width little-endian arrays read straight from the mmap:
+the byte offset and length of every conversation record, the example
+offsets, and lookup tables by contact_id and scenario (keys sorted for binary
+search, each pointing at a run of example numbers). The header JSON only
+holds the source file's mtime/size/sha256 (for invalidation), the example
+count and where each table starts. Records are only decoded when accessed.
+"""
+
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Dict, Any, Iterator, List, Optional
+from parse_conversations import Conversation, TrainingExample, extract_training_examples, iter_conversations
+
+MAGIC = b'IEXIDX4\n'
+_LENGTH = struct.Struct('<Q')
+_RECORD = struct.Struct('<QI')    # record offset, length
+_EXAMPLE = struct.Struct('<IIII')  # record number, client_start, reply_start, reply_end
+_KEY = struct.Struct('<QIII')     # key offset, key length, first id, id count
+_ID = struct.Struct('<I')
+
+
+class ExampleIndex:
+    """
+    Read-only view over a compiled example index file.
+
+    Only the small header is parsed on open; the offset tables and example
+    records stay in the mmap'd file until they are accessed, so opening is
+    cheap however big the corpus is and the pages are shared between workers
+    by the OS page cache.
+
+    The per-process cached index is handed out by use_example_index(), which
+    counts its users so a replaced index is closed once the last one is done.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"Not an example index: {path}")
+
+        self._data_start = len(MAGIC) + _LENGTH.size
+        (header_offset,) = _LENGTH.unpack(self._mm[len(MAGIC):self._data_start])
+        self.header = json.loads(self._mm[header_offset:])
+        self._count = self.header['count']
+        self._tables = self.header['tables']
+        self._last = (None, None)  # (record index, Conversation), shared by consecutive examples
+        stat = os.fstat(self._file.fileno())
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        self.verified_source = None  # (mtime_ns, size) of a source whose content hash matched
+        self._users = 0
+        self._retired = False
+        self._users_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> TrainingExample:
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        record, client_start, reply_start, reply_end = self._row(_EXAMPLE, 'examples', i)
+        return TrainingExample(self._conversation(record), client_start, reply_start, reply_end)
+
+    def __iter__(self) -> Iterator[TrainingExample]:
+        return self.examples()
+
+    def _conversation(self, record: int) -> Conversation:
+        # Examples are read mostly in order, so keeping the last decoded
+        # conversation lets its examples share one message list and one
+        # formatted-history buffer
+        last_record, conversation = self._last
+        if last_record == record:
+            return conversation
+
+        offset, length = self._row(_RECORD, 'records', record)
+        start = self._data_start + offset
+        data = json.loads(self._mm[start:start + length])
+        conversation = Conversation(data['contact_id'], data['scenario'], data['messages'])
+        conversation.history_start = data['history_start']
+        self._last = (record, conversation)
+        return conversation
+
+    def examples(self, start: int = 0, stop: Optional[int] = None) -> Iterator[TrainingExample]:
+        """Decode examples lazily, in corpus order"""
+        for i in range(start, min(stop if stop is not None else len(self), len(self))):
+            yield self[i]
+
+    def by_contact(self, contact_id: str) -> List[TrainingExample]:
+        return [self[i] for i in self._lookup('by_contact', contact_id)]
+
+    def by_scenario(self, scenario: str) -> List[TrainingExample]:
+        return [self[i] for i in self._lookup('by_scenario', scenario)]
+
+    def _row(self, layout: struct.Struct, table: str, i: int):
+        return layout.unpack_from(self._mm, self._tables[table] + i * layout.size)
+
+    def _lookup(self, table: str, key: str) -> List[int]:
+        """Example numbers stored under `key`, by binary search over the sorted keys"""
+        wanted = key.encode('utf-8')
+        lo, hi = 0, self._tables[table + '_count']
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_offset, key_length, first, count = self._row(_KEY, table, mid)
+            found = self._mm[key_offset:key_offset + key_length]
+            if found < wanted:
+                lo = mid + 1
+            elif found > wanted:
+                hi = mid
+            else:
+                return [self._row(_ID, table + '_ids', first + j)[0] for j in range(count)]
+        return []
+
+    def acquire(self):
+        with self._users_lock:
+            if self._retired and self._users == 0:
+                raise ValueError(f"Example index already closed: {self.path}")
+            self._users += 1
+
+    def release(self):
+        with self._users_lock:
+            self._users -= 1
+            if not (self._retired and self._users == 0):
+                return
+        self.close()
+
+    def retire(self):
+        """Close now if unused, otherwise when the last user releases it"""
+        with self._users_lock:
+            self._retired = True
+            if self._users:
+                return
+        self.close()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def source_fingerprint(source: str) -> Dict[str, Any]:
+    """mtime and size of the source file (cheap staleness check)"""
+    stat = os.stat(source)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_index(source: str, index_path: str) -> str:
+    """Compile the training examples in `source` into an index file; returns index_path"""
+    fingerprint = source_fingerprint(source)
+    sha256 = file_sha256(source)
+
+    offsets = []
+    example_offsets = []
+    by_contact: Dict[str, List[int]] = {}
+    by_scenario: Dict[str, List[int]] = {}
+    position = 0
+
+    # Write to a temp file and swap it in so readers never see a partial index
+    directory = os.path.dirname(os.path.abspath(index_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.example_index')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(0))  # header offset, filled in below
+
+        current = None
+        examples = extract_training_examples(iter_conversations(source))
+        for i, example in enumerate(examples):
+            conversation = example.conversation
+            if conversation is not current:
+                # First example of a new conversation: write its messages once
+                current = conversation
+                record = json.dumps({
+                    'contact_id': conversation.contact_id,
+                    'scenario': conversation.scenario,
+                    'history_start': conversation.history_start,
+                    'messages': conversation.messages
+                }, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+                f.write(record)
+                offsets.append((position, len(record)))
+                position += len(record)
+
+            example_offsets.append((len(offsets) - 1, example.client_start, example.reply_start, example.reply_end))
+            by_contact.setdefault(example['contact_id'], []).append(i)
+            by_scenario.setdefault(example['scenario'], []).append(i)
+
+        tables = {
+            'records': _write_rows(f, _RECORD, offsets),
+            'examples': _write_rows(f, _EXAMPLE, example_offsets)
+        }
+        for name, lookup in (('by_contact', by_contact), ('by_scenario', by_scenario)):
+            tables.update(_write_lookup(f, name, lookup))
+
+        header_offset = f.tell()
+        f.write(json.dumps({
+            'source': os.path.abspath(source),
+            'source_mtime_ns': fingerprint['mtime_ns'],
+            'source_size': fingerprint['size'],
+            'source_sha256': sha256,
+            'count': len(example_offsets),
+            'tables': tables
+        }, separators=(',', ':')).encode('utf-8'))
+
+        f.seek(len(MAGIC))
+        f.write(_LENGTH.pack(header_offset))
+
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def _write_rows(f, layout: struct.Struct, rows) -> int:
+    """Append fixed-width rows; returns where they start"""
+    start = f.tell()
+    for row in rows:
+        f.write(layout.pack(*row))
+    return start
+
+
+def _write_lookup(f, name: str, lookup: Dict[str, List[int]]) -> Dict[str, int]:
+    """Append a key -> example numbers table: key bytes, the numbers, then the sorted key rows"""
+    keys = sorted((key.encode('utf-8'), ids) for key, ids in lookup.items())
+    rows = []
+    first = 0
+    for key, ids in keys:
+        rows.append((f.tell(), len(key), first, len(ids)))
+        f.write(key)
+        first += len(ids)
+    ids_start = _write_rows(f, _ID, ((i,) for _, ids in keys for i in ids))
+    return {name: _write_rows(f, _KEY, rows), name + '_ids': ids_start, name + '_count': len(rows)}
+
+
+def is_index_current(index: ExampleIndex, source: str) -> bool:
+    """
+    Valid if the source is unchanged; a changed mtime alone falls back to the
+    content hash, which is then remembered so a touched file is hashed once
+    """
+    header = index.header
+    fingerprint = source_fingerprint(source)
+    stamp = (fingerprint['mtime_ns'], fingerprint['size'])
+    if stamp == (header['source_mtime_ns'], header['source_size']) or stamp == index.verified_source:
+        return True
+    if fingerprint['size'] == header['source_size'] and file_sha256(source) == header['source_sha256']:
+        index.verified_source = stamp
+        return True
+    return False
+
+
+def open_index(source: str = 'conversations.json', index_path: Optional[str] = None) -> ExampleIndex:
+    """Open the index for `source`, building or rebuilding it if missing or stale"""
+    index_path = index_path or source + '.idx'
+
+    if os.path.exists(index_path):
+        try:
+            index = ExampleIndex(index_path)
+            if is_index_current(index, source):
+                return index
+            index.close()
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Warning: Rebuilding example index ({e})")
+
+    build_index(source, index_path)
+    return ExampleIndex(index_path)
+
+
+_indexes: Dict[str, ExampleIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def use_example_index(source: str = 'conversations.json', index_path: Optional[str] = None) -> Iterator[ExampleIndex]:
+    """
+    Per-process cached index for `source`, opened lazily on first use.
+
+    Each call re-checks the source fingerprint (a stat) and whether another
+    worker has swapped in a new index file, and reopens when needed. The
+    index is only valid inside the with block: a replaced index stays open
+    until every block using it has exited, then it is closed.
+    """
+    index_path = index_path or source + '.idx'
+    with _indexes_lock:
+        index = _indexes.get(index_path)
+        if index is not None:
+            try:
+                stat = os.stat(index_path)
+                same_file = (stat.st_ino, stat.st_mtime_ns) == index.file_id
+            except FileNotFoundError:
+                same_file = False
+            if not (same_file and is_index_current(index, source)):
+                del _indexes[index_path]
+                index.retire()
+                index = None
+
+        if index is None:
+            index = _indexes[index_path] = open_index(source, index_path)
+        index.acquire()
+
+    try:
+        yield index
+    finally:
+        index.release()
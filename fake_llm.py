@@ -0,0 +1,208 @@
+"""
+Fake LLM - deterministic local stand-in for Groq/Gemini/OpenAI
+Lets the whole stack run, be load-tested and benchmarked without API keys or network access
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, AsyncIterator, List, Optional, Tuple
+
+# Sentences the fake chatbot builds its replies from
+_REPLY_SENTENCES = [
+    "Thanks for reaching out!",
+    "The DTV is a 5-year multiple-entry visa with stays of up to 180 days per entry.",
+    "You'll need a passport copy, a recent photo and a bank statement showing at least 500,000 THB.",
+    "Processing usually takes about 10 business days once everything is submitted.",
+    "Could you tell me which country you'll be applying from?",
+    "Our service fee covers document review and the full submission.",
+    "Happy to walk you through the next steps.",
+    "Let me know if you have any other questions!"
+]
+
+# Prompts whose call counts are remembered (least recently seen are forgotten first)
+_MAX_SEEN_PROMPTS = 10000
+
+# Markers that identify which of our prompts is being answered
+_EDITOR_MARKER = '"prompt": "Complete updated prompt here"'
+_MANUAL_MARKER = "Return the updated prompt in JSON format"
+_SUMMARY_MARKER = "Return ONLY the updated summary text."
+
+# (start marker, end markers) around the current chatbot prompt in editor prompts
+_CURRENT_PROMPT_MARKERS = [
+    ("### Current System Prompt:\n", ("\n\n### Client Sequence:", "\n\n### Examples (")),
+    ("Current Prompt:\n", ("\n\nReturn the updated prompt in JSON format",))
+]
+
+
+class FakeLLMError(RuntimeError):
+    """Injected provider failure; status_code mimics the HTTP error a real API would return"""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Fake LLM injected error (HTTP {status_code})")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class FakeLLM:
+    """
+    Deterministic fake provider with configurable latency, throughput and errors.
+
+    Each call's randomness is seeded from `seed`, the prompt, and how many
+    times that prompt has been seen, so a run replays identically whatever
+    order concurrent calls happen to interleave in. Counts are kept by prompt
+    digest for the last _MAX_SEEN_PROMPTS distinct prompts; a forgotten
+    prompt starts again from its first occurrence.
+
+    A call waits for a time-to-first-token drawn from the latency
+    distribution ('fixed', 'uniform' between 0 and 2x the mean, or
+    'lognormal' with `latency_sigma`), then for the output to be "generated"
+    at `tokens_per_second` (0 = instantly). With probability `error_rate`
+    it raises FakeLLMError instead (429 with a Retry-After, or 500/503).
+
+    Outputs follow the format each of our prompts asks for: {"reply": ...}
+    for the chatbot, {"analysis", "changes_made", "prompt"} for the editors
+    (the current prompt plus one revision note), {"prompt", "summary"} for
+    manual updates, and plain text for history summaries.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 300,
+        distribution: str = 'lognormal',
+        latency_sigma: float = 0.5,
+        tokens_per_second: float = 0,
+        error_rate: float = 0.0,
+        reply_sentences: int = 3,
+        seed: int = 0
+    ):
+        if distribution not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.reply_sentences = reply_sentences
+        self.seed = seed
+        self._seen: OrderedDict = OrderedDict()  # prompt digest -> calls so far
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def generate(self, prompt: str) -> str:
+        delay, text, error = self._plan(prompt)
+        if error:
+            time.sleep(delay)
+            raise error
+        time.sleep(delay + self._generation_time(text))
+        return text
+
+    async def agenerate(self, prompt: str) -> str:
+        delay, text, error = self._plan(prompt)
+        if error:
+            await asyncio.sleep(delay)
+            raise error
+        await asyncio.sleep(delay + self._generation_time(text))
+        return text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        delay, text, error = self._plan(prompt)
+        time.sleep(delay)
+        if error:
+            raise error
+        for chunk, pause in self._chunks(text):
+            time.sleep(pause)
+            yield chunk
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        delay, text, error = self._plan(prompt)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        for chunk, pause in self._chunks(text):
+            await asyncio.sleep(pause)
+            yield chunk
+
+    def _plan(self, prompt: str) -> Tuple[float, Optional[str], Optional[FakeLLMError]]:
+        """
+        Time to first token and output text for one call, or the injected
+        error to raise after that delay; callers do the waiting so async
+        calls never block the event loop
+        """
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()[:16]
+        with self._lock:
+            occurrence = self._seen.pop(digest, 0)
+            self._seen[digest] = occurrence + 1
+            if len(self._seen) > _MAX_SEEN_PROMPTS:
+                self._seen.popitem(last=False)
+            self.calls += 1
+
+        seed_material = f"{self.seed}\x00{occurrence}\x00{prompt}".encode('utf-8')
+        rng = random.Random(hashlib.sha256(seed_material).digest())
+
+        delay = self._sample_latency(rng)
+        if rng.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            status = rng.choice([429, 500, 503])
+            return delay, None, FakeLLMError(status, retry_after=1.0 if status == 429 else None)
+
+        return delay, self._respond(prompt, rng), None
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        mean = self.latency_ms / 1000
+        if self.distribution == 'fixed':
+            return mean
+        if self.distribution == 'uniform':
+            return rng.uniform(0, 2 * mean)
+        # Lognormal with the requested mean: heavy right tail like real APIs
+        return rng.lognormvariate(0, self.latency_sigma) * mean / math.exp(self.latency_sigma ** 2 / 2)
+
+    def _generation_time(self, text: str) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return (len(text) / 4) / self.tokens_per_second
+
+    def _chunks(self, text: str, chars_per_chunk: int = 16) -> Iterator[Tuple[str, float]]:
+        pause = self._generation_time(' ' * chars_per_chunk)
+        for i in range(0, len(text), chars_per_chunk):
+            yield text[i:i + chars_per_chunk], pause
+
+    def _respond(self, prompt: str, rng: random.Random) -> str:
+        if _SUMMARY_MARKER in prompt:
+            return "The client asked about the DTV visa; documents, fees and timelines were discussed."
+
+        if _EDITOR_MARKER in prompt or _MANUAL_MARKER in prompt:
+            current = _extract_current_prompt(prompt)
+            note = f"- Revision {rng.randrange(10000)}: keep replies short and ask one question at a time."
+            revised = f"{current.rstrip()}\n{note}" if current else note
+            if _EDITOR_MARKER in prompt:
+                return json.dumps({
+                    "analysis": "The AI reply was longer than the consultant's and missed a follow-up question.",
+                    "changes_made": [note[2:]],
+                    "prompt": revised
+                })
+            return json.dumps({"prompt": revised, "summary": note[2:]})
+
+        sentences: List[str] = [_REPLY_SENTENCES[0]]
+        sentences += rng.sample(_REPLY_SENTENCES[1:], min(self.reply_sentences - 1, len(_REPLY_SENTENCES) - 1))
+        return json.dumps({"reply": ' '.join(sentences)})
+
+
+def _extract_current_prompt(prompt: str) -> Optional[str]:
+    for start_marker, end_markers in _CURRENT_PROMPT_MARKERS:
+        start = prompt.find(start_marker)
+        if start == -1:
+            continue
+        start += len(start_marker)
+        ends = [prompt.find(marker, start) for marker in end_markers]
+        ends = [end for end in ends if end != -1]
+        if ends:
+            return prompt[start:min(ends)]
+    return None
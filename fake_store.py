@@ -0,0 +1,232 @@
+"""
+Fake Store - SQLite stand-in for the Supabase client
+Implements just the query shapes database.py uses, so prompt storage works without a Supabase project
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt_type TEXT NOT NULL,
+    prompt_text TEXT NOT NULL,
+    version INTEGER DEFAULT 1,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS prompt_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt_id INTEGER REFERENCES prompts(id),
+    old_prompt TEXT,
+    new_prompt TEXT,
+    change_reason TEXT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    performance_metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_prompts_type ON prompts(prompt_type);
+"""
+
+_TABLES = {
+    'prompts': ('id', 'prompt_type', 'prompt_text', 'version', 'created_at', 'updated_at', 'metadata'),
+    'prompt_history': ('id', 'prompt_id', 'old_prompt', 'new_prompt', 'change_reason', 'created_at', 'performance_metrics')
+}
+
+_JSON_COLUMNS = ('metadata', 'performance_metrics')
+
+
+class FakeResponse:
+    """Mirrors the `.data` attribute of a supabase-py API response"""
+
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeSupabase:
+    """
+    In-memory (or file-backed) SQLite implementation of the Supabase client calls we make.
+
+    Supports table(...).select(columns).eq(column, value).order(column,
+    desc=...).limit(n).execute(), table(...).insert(row).execute(), and
+    rpc('update_prompt_versioned', params).execute(), which behaves like
+    the stored procedure in DATABASE_SCHEMA. Prompts are seeded from
+    prompts.py on first use. Use a file path instead of ':memory:' to share
+    one store between gunicorn workers.
+
+    `latency_ms` is added to every execute() to approximate a network round
+    trip.
+    """
+
+    def __init__(self, path: str = ':memory:', latency_ms: float = 0):
+        self.path = path
+        self.latency_ms = latency_ms
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ':memory:':
+                self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(_SCHEMA)
+        self._seed()
+
+    def table(self, name: str) -> 'FakeQuery':
+        if name not in _TABLES:
+            raise ValueError(f"Unknown table: {name}")
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> 'FakeRpc':
+        if name != 'update_prompt_versioned':
+            raise ValueError(f"Unknown function: {name}")
+        return FakeRpc(self, params)
+
+    def _seed(self):
+        from prompts import CHATBOT_PROMPT, EDITOR_PROMPT
+        for prompt_type, text in (('chatbot', CHATBOT_PROMPT), ('editor', EDITOR_PROMPT)):
+            with self._transaction() as db:
+                if not db.execute('SELECT 1 FROM prompts WHERE prompt_type = ?', (prompt_type,)).fetchone():
+                    db.execute(
+                        'INSERT INTO prompts (prompt_type, prompt_text, version, metadata) VALUES (?, ?, 1, ?)',
+                        (prompt_type, text, json.dumps({'source': 'initial'}))
+                    )
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    def _delay(self):
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK, serialised within this process too"""
+
+    def __init__(self, store: FakeSupabase):
+        self.store = store
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.store._lock.acquire()
+        self.store._db.execute('BEGIN IMMEDIATE')
+        return self.store._db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.store._db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.store._lock.release()
+
+
+class FakeQuery:
+    """Chainable query builder for one table"""
+
+    def __init__(self, store: FakeSupabase, table: str):
+        self.store = store
+        self.table = table
+        self._columns = '*'
+        self._filters: List[Tuple[str, Any]] = []
+        self._order: Optional[Tuple[str, bool]] = None
+        self._limit: Optional[int] = None
+        self._insert: Optional[Dict[str, Any]] = None
+
+    def select(self, columns: str = '*') -> 'FakeQuery':
+        self._columns = columns
+        return self
+
+    def eq(self, column: str, value) -> 'FakeQuery':
+        self._filters.append((self._column(column), value))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> 'FakeQuery':
+        self._order = (self._column(column), desc)
+        return self
+
+    def limit(self, count: int) -> 'FakeQuery':
+        self._limit = int(count)
+        return self
+
+    def insert(self, row: Dict[str, Any]) -> 'FakeQuery':
+        self._insert = {self._column(k): v for k, v in row.items()}
+        return self
+
+    def execute(self) -> FakeResponse:
+        self.store._delay()
+        if self._insert is not None:
+            return FakeResponse([self._execute_insert()])
+
+        columns = [c.strip() for c in self._columns.split(',')]
+        selected = ', '.join(_TABLES[self.table] if columns == ['*'] else [self._column(c) for c in columns])
+        sql = f'SELECT {selected} FROM {self.table}'
+        params = []
+        if self._filters:
+            sql += ' WHERE ' + ' AND '.join(f'{column} = ?' for column, _ in self._filters)
+            params = [value for _, value in self._filters]
+        if self._order:
+            column, desc = self._order
+            # id breaks ties between rows written within the same millisecond
+            sql += f" ORDER BY {column} {'DESC' if desc else 'ASC'}, id {'DESC' if desc else 'ASC'}"
+        if self._limit is not None:
+            sql += f' LIMIT {self._limit}'
+
+        with self.store._lock:
+            rows = self.store._db.execute(sql, params).fetchall()
+        return FakeResponse([_row_to_dict(row) for row in rows])
+
+    def _execute_insert(self) -> Dict[str, Any]:
+        row = {k: json.dumps(v) if k in _JSON_COLUMNS and v is not None else v for k, v in self._insert.items()}
+        columns = ', '.join(row)
+        placeholders = ', '.join('?' for _ in row)
+        with self.store._transaction() as db:
+            cursor = db.execute(f'INSERT INTO {self.table} ({columns}) VALUES ({placeholders})', list(row.values()))
+            inserted = db.execute(f'SELECT * FROM {self.table} WHERE id = ?', (cursor.lastrowid,)).fetchone()
+        return _row_to_dict(inserted)
+
+    def _column(self, name: str) -> str:
+        # Only known column names are ever interpolated into SQL
+        if name not in _TABLES[self.table]:
+            raise ValueError(f"Unknown column {self.table}.{name}")
+        return name
+
+
+class FakeRpc:
+    """update_prompt_versioned(): the same compare-and-swap as the plpgsql function"""
+
+    def __init__(self, store: FakeSupabase, params: Dict[str, Any]):
+        self.store = store
+        self.params = params
+
+    def execute(self) -> FakeResponse:
+        self.store._delay()
+        p = self.params
+        with self.store._transaction() as db:
+            current = db.execute(
+                'SELECT * FROM prompts WHERE prompt_type = ? ORDER BY updated_at DESC, id DESC LIMIT 1',
+                (p['p_prompt_type'],)
+            ).fetchone()
+            if current is None:
+                return FakeResponse({'status': 'missing', 'prompt': None})
+
+            if p.get('p_expected_version') is not None and current['version'] != p['p_expected_version']:
+                return FakeResponse({'status': 'conflict', 'prompt': _row_to_dict(current)})
+
+            db.execute(
+                'INSERT INTO prompt_history (prompt_id, old_prompt, new_prompt, change_reason) VALUES (?, ?, ?, ?)',
+                (current['id'], current['prompt_text'], p['p_new_prompt'], p['p_change_reason'])
+            )
+            db.execute(
+                "UPDATE prompts SET prompt_text = ?, version = ?, "
+                "updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now') WHERE id = ?",
+                (p['p_new_prompt'], current['version'] + 1, current['id'])
+            )
+            updated = db.execute('SELECT * FROM prompts WHERE id = ?', (current['id'],)).fetchone()
+        return FakeResponse({'status': 'updated', 'prompt': _row_to_dict(updated)})
+
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    data = dict(row)
+    for column in _JSON_COLUMNS:
+        if data.get(column) is not None:
+            data[column] = json.loads(data[column])
+    return data
@@ -0,0 +1,12 @@
+"""
+Gunicorn Config - worker startup hooks
+Read automatically when gunicorn is started from the project directory
+"""
+
+
+def post_worker_init(worker):
+    # Pick up training jobs left behind by a worker that crashed or was restarted.
+    # Done here rather than at import so scripts and benchmarks that import the
+    # app don't start running other workers' jobs
+    from app import training_jobs
+    training_jobs.resume_incomplete()
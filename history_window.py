@@ -0,0 +1,120 @@
+"""
+History Window - keeps chat history inside a token budget
+Recent messages stay verbatim; older ones are folded into a cached rolling summary
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+class HistoryCompactor:
+    """
+    Formats chat history so its size stays flat however long the conversation gets.
+
+    When the formatted history fits in `token_budget` it is returned unchanged.
+    Otherwise the last `keep_last` messages are kept verbatim (fewer if they
+    alone would blow the budget) and everything before them is replaced by a
+    summary. Summaries are cached by a hash of the messages they cover, so the
+    next turn of the same conversation only folds the newly aged-out messages
+    into the previous summary instead of re-summarising from scratch.
+
+    `summarize_fn(previous_summary, new_messages, provider)` returns the updated
+    summary text; previous_summary is None for the first summary.
+    """
+
+    def __init__(
+        self,
+        summarize_fn: Callable[[Optional[str], str, str], str],
+        token_budget: int = 3000,
+        keep_last: int = 8,
+        summary_tokens: int = 300,
+        cache_size: int = 512
+    ):
+        self.summarize_fn = summarize_fn
+        self.token_budget = token_budget
+        self.keep_last = keep_last
+        self.summary_tokens = summary_tokens
+        self.cache_size = cache_size
+        self._summaries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.token_budget > 0
+
+    def compact(self, messages: list, provider: str = "groq") -> str:
+        """Formatted history (same line format as format_chat_history) within the budget"""
+        # Imported here: metrics uses estimate_tokens, and llm_integration imports metrics
+        from llm_integration import format_chat_message
+
+        if hasattr(messages, 'formatted'):
+            # Training example history: formatted incrementally per conversation,
+            # so only histories over budget need splitting into lines here
+            full = messages.formatted()
+            if not self.enabled or estimate_tokens(full) <= self.token_budget:
+                return full
+
+        lines = [line for line in map(format_chat_message, messages or []) if line is not None]
+        if not lines:
+            return "(No previous messages)"
+
+        full = '\n'.join(lines)
+        if not self.enabled or estimate_tokens(full) <= self.token_budget:
+            return full
+
+        keep = min(self.keep_last, len(lines))
+        while keep > 1 and estimate_tokens('\n'.join(lines[-keep:])) + self.summary_tokens > self.token_budget:
+            keep -= 1
+
+        older, recent = lines[:-keep], lines[-keep:]
+        if not older:
+            return full
+
+        summary = self._summarize(older, provider)
+        return f"(SUMMARY OF EARLIER CONVERSATION) {summary}\n" + '\n'.join(recent)
+
+    def _summarize(self, older: List[str], provider: str) -> str:
+        # Hash every prefix of the older messages so we can find the longest
+        # one that already has a summary and only fold in what came after it
+        digest = hashlib.sha256()
+        prefix_keys = []
+        for line in older:
+            digest.update(line.encode('utf-8') + b'\n')
+            prefix_keys.append(digest.hexdigest())
+
+        previous, start = None, 0
+        with self._lock:
+            for i in range(len(prefix_keys) - 1, -1, -1):
+                if prefix_keys[i] in self._summaries:
+                    self._summaries.move_to_end(prefix_keys[i])
+                    previous, start = self._summaries[prefix_keys[i]], i + 1
+                    break
+
+        if start == len(older):
+            return previous
+
+        try:
+            summary = self.summarize_fn(previous, '\n'.join(older[start:]), provider).strip()
+        except Exception as e:
+            print(f"Warning: History summary failed ({e}), truncating instead")
+            return self._fallback_summary(previous, older)
+
+        with self._lock:
+            self._summaries[prefix_keys[-1]] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _fallback_summary(self, previous: Optional[str], older: List[str]) -> str:
+        """Cheap stand-in when the LLM summary fails: first message plus a note"""
+        if previous:
+            return previous
+        budget_chars = self.summary_tokens * 4
+        return f"{older[0][:budget_chars]} ... ({len(older) - 1} more earlier messages omitted)"
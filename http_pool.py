@@ -0,0 +1,132 @@
+"""
+HTTP Pool - one pooled HTTP transport shared by the provider SDKs and Supabase
+Keep-alive connections with bounded pool sizes, timeouts and HTTP/2 where available; usage is exported to /metrics
+"""
+
+import importlib.util
+from typing import Any, Optional
+from config import Config
+from clients import clients
+from metrics import registry as metrics
+
+_TRANSPORTS = (('http_transport', 'sync'), ('async_http_transport', 'async'))
+
+# httpcore trace events that mean a new connection was set up
+_CONNECT_EVENTS = {
+    'connection.connect_tcp.complete': 'tcp',
+    'connection.start_tls.complete': 'tls'
+}
+
+_warned_http2 = False
+
+
+def http2_enabled() -> bool:
+    """HTTP2 is on and the h2 package is installed (httpx needs it for HTTP/2)"""
+    global _warned_http2
+    if not Config.HTTP2:
+        return False
+    if importlib.util.find_spec('h2') is None:
+        if not _warned_http2:
+            print("Warning: HTTP2 is enabled but h2 is not installed (pip install 'httpx[http2]'); using HTTP/1.1")
+            _warned_http2 = True
+        return False
+    return True
+
+
+def http_timeout(limit: Optional[float] = None):
+    """
+    Connect/read/write timeouts, plus how long a request may wait for a free
+    pooled connection; each is capped at `limit` seconds (e.g. the time left
+    before a call's deadline)
+    """
+    import httpx
+    cap = (lambda seconds: min(seconds, limit)) if limit is not None else (lambda seconds: seconds)
+    return httpx.Timeout(
+        cap(Config.HTTP_READ_TIMEOUT),
+        connect=cap(Config.HTTP_CONNECT_TIMEOUT),
+        pool=cap(Config.HTTP_POOL_TIMEOUT)
+    )
+
+
+def _make_transport(async_transport: bool = False):
+    import httpx
+    limits = httpx.Limits(
+        max_connections=Config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+    )
+    transport_class = httpx.AsyncHTTPTransport if async_transport else httpx.HTTPTransport
+    return transport_class(http2=http2_enabled(), limits=limits)
+
+
+# Built on first use and rebuilt in forked workers, like the SDK clients
+clients.register('http_transport', _make_transport)
+clients.register('async_http_transport', lambda: _make_transport(async_transport=True))
+
+
+def http_client(async_client: bool = False) -> Any:
+    """
+    A new httpx client that sends through the shared connection pool.
+
+    Each SDK gets its own client so base URLs and auth headers stay
+    separate, while connections (and TLS sessions) to a host are reused
+    across all of them. Don't close these clients: that would close the
+    shared transport.
+    """
+    import httpx
+    pool = 'async' if async_client else 'sync'
+    if async_client:
+        async def trace(event_name, info):
+            _count_connect(pool, event_name)
+
+        async def add_trace(request):
+            request.extensions['trace'] = trace
+
+        return httpx.AsyncClient(
+            transport=clients.get('async_http_transport'),
+            timeout=http_timeout(),
+            event_hooks={'request': [add_trace]}
+        )
+
+    def trace(event_name, info):
+        _count_connect(pool, event_name)
+
+    def add_trace(request):
+        request.extensions['trace'] = trace
+
+    return httpx.Client(
+        transport=clients.get('http_transport'),
+        timeout=http_timeout(),
+        event_hooks={'request': [add_trace]}
+    )
+
+
+def _count_connect(pool: str, event_name: str):
+    kind = _CONNECT_EVENTS.get(event_name)
+    if kind:
+        metrics.inc('issa_http_pool_connects_total', {'pool': pool, 'kind': kind})
+
+
+def _pool_metrics():
+    rows = []
+    for name, pool in _TRANSPORTS:
+        connection_pool = getattr(clients.peek(name), '_pool', None)
+        if connection_pool is None:
+            continue
+        connections = list(connection_pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        queued = sum(1 for request in list(getattr(connection_pool, '_requests', [])) if request.is_queued())
+        rows += [
+            ('issa_http_pool_connections', {'pool': pool, 'state': 'active'}, len(connections) - idle),
+            ('issa_http_pool_connections', {'pool': pool, 'state': 'idle'}, idle),
+            ('issa_http_pool_max_connections', {'pool': pool}, Config.HTTP_MAX_CONNECTIONS),
+            ('issa_http_pool_queued_requests', {'pool': pool}, queued)
+        ]
+    return rows
+
+
+metrics.describe('issa_http_pool_connections', 'gauge', 'Open pooled HTTP connections to providers and Supabase')
+metrics.describe('issa_http_pool_max_connections', 'gauge', 'HTTP connection pool size limit')
+metrics.describe('issa_http_pool_queued_requests', 'gauge', 'Requests waiting for a free pooled connection')
+metrics.describe('issa_http_pool_connects_total', 'counter', 'New TCP connections and TLS handshakes made by the pool')
+metrics.add_collector(_pool_metrics)
@@ -0,0 +1,218 @@
+"""
+Background Jobs - runs /train outside the request thread
+Jobs are persisted to disk so progress survives worker restarts and any worker can report on them
+"""
+
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; locking is skipped
+    fcntl = None
+
+
+# Job statuses
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class TrainingJobRunner:
+    """
+    In-process background runner for training jobs.
+
+    Each job is a JSON file in `jobs_dir`, so every gunicorn worker can read
+    its progress or request cancellation no matter which worker runs it.
+    The running worker holds an exclusive lock on `<id>.run.lock` for the
+    whole job; if that worker dies the lock is released, and the next worker
+    to call resume_incomplete() picks the job up from its last completed
+    sample.
+
+    `run_fn(params, start, on_result, should_stop)` does the actual work:
+    it must skip the first `start` samples, call `on_result(result)` after
+    each sample, and stop early when `should_stop()` returns True.
+    """
+
+    def __init__(self, jobs_dir: str, run_fn: Callable):
+        self.jobs_dir = jobs_dir
+        self.run_fn = run_fn
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a job and queue it on this worker; returns the job record"""
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': QUEUED,
+            'params': params,
+            'progress': {'completed': 0, 'total': params.get('num_samples')},
+            'results': [],
+            'error': None,
+            'cancel_requested': False,
+            'created_at': now,
+            'updated_at': now
+        }
+        self._write(job)
+        self._enqueue(job['id'])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id.isalnum():
+            return None
+        return self._read(job_id)
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent jobs first, without their (possibly large) results"""
+        jobs = []
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith('.json'):
+                job = self._read(name[:-5])
+                if job:
+                    job.pop('results', None)
+                    jobs.append(job)
+        jobs.sort(key=lambda j: j['created_at'], reverse=True)
+        return jobs[:limit]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Ask a job to stop after its current sample; queued jobs are cancelled at once"""
+        def request_cancel(job):
+            if job['status'] == QUEUED:
+                job['status'] = CANCELLED
+            elif job['status'] == RUNNING:
+                job['cancel_requested'] = True
+
+        if not job_id.isalnum():
+            return None
+        return self._update(job_id, request_cancel)
+
+    def resume_incomplete(self) -> List[str]:
+        """Queue every queued/running job that no live worker is executing"""
+        resumed = []
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith('.json'):
+                continue
+            job = self._read(name[:-5])
+            if job and job['status'] in (QUEUED, RUNNING) and not self._is_claimed(job['id']):
+                self._enqueue(job['id'])
+                resumed.append(job['id'])
+        return resumed
+
+    def _enqueue(self, job_id: str):
+        with self._lock:
+            # Start (or restart after a fork) the worker thread for this process
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._work, name='training-jobs', daemon=True)
+                self._thread.start()
+            self._queue.put(job_id)
+
+    def _work(self):
+        jobs = self._queue
+        while True:
+            job_id = jobs.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"Error: training job {job_id} crashed: {e}")
+
+    def _run(self, job_id: str):
+        with open(self._path(job_id, '.run.lock'), 'a') as run_lock:
+            if fcntl:
+                try:
+                    fcntl.flock(run_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return  # Another worker already claimed it
+
+            job = self._read(job_id)
+            if not job or job['status'] not in (QUEUED, RUNNING):
+                return
+
+            start = len(job['results'])
+            self._update(job_id, lambda j: j.update(status=RUNNING))
+
+            def on_result(result):
+                def append(j):
+                    j['results'].append(result)
+                    j['progress']['completed'] = len(j['results'])
+                self._update(job_id, append)
+
+            def should_stop():
+                current = self._read(job_id)
+                return bool(current and current['cancel_requested'])
+
+            try:
+                self.run_fn(job['params'], start, on_result, should_stop)
+            except Exception as e:
+                self._update(job_id, lambda j: j.update(status=FAILED, error=str(e)))
+                return
+
+            def finish(j):
+                j['status'] = CANCELLED if j['cancel_requested'] else COMPLETED
+            self._update(job_id, finish)
+
+    def _is_claimed(self, job_id: str) -> bool:
+        if not fcntl:
+            return False
+        with open(self._path(job_id, '.run.lock'), 'a') as run_lock:
+            try:
+                fcntl.flock(run_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(run_lock, fcntl.LOCK_UN)
+            return False
+
+    def _path(self, job_id: str, suffix: str = '.json') -> str:
+        if not job_id.isalnum():
+            raise ValueError(f"Invalid job id: {job_id}")
+        return os.path.join(self.jobs_dir, job_id + suffix)
+
+    def _read(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, job: Dict[str, Any]):
+        job['updated_at'] = time.time()
+        fd, tmp_path = tempfile.mkstemp(dir=self.jobs_dir, prefix='.job')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(job['id']))
+
+    def _update(self, job_id: str, mutate: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        """Read-modify-write a job file under a cross-process lock"""
+        with self._meta_lock(job_id):
+            job = self._read(job_id)
+            if job is None:
+                return None
+            mutate(job)
+            self._write(job)
+            return job
+
+    @contextmanager
+    def _meta_lock(self, job_id: str):
+        with open(self._path(job_id, '.lock'), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
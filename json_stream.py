@@ -0,0 +1,340 @@
+"""
+Incremental JSON reading for streamed LLM output
+Emits the characters of one string field (e.g. "reply") while the JSON is still arriving, and
+recovers JSON objects from model output with stray text, stray braces or a truncated ending
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Where a JSON object plausibly starts: '{' then a key or '}' (skips prose like "use {name}")
+_OBJECT_START = re.compile(r'\{\s*["}]')
+
+_SIMPLE_ESCAPES = {
+    '"': '"', '\\': '\\', '/': '/',
+    'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'
+}
+
+
+class JsonFieldStreamer:
+    """
+    Reads a JSON object chunk by chunk and decodes one top-level string field as it streams.
+
+    Text before the first '{' (e.g. "Sure! Here is the JSON:") is ignored. Escapes split across chunk boundaries are
+    held back until the rest of the escape arrives.
+
+    Usage:
+        streamer = JsonFieldStreamer('reply')
+        for chunk in chunks:
+            text = streamer.feed(chunk)   # newly decoded characters of "reply"
+        streamer.value                    # full decoded value (None if never seen)
+        streamer.text                     # raw text received so far
+    """
+
+    def __init__(self, field: str = 'reply'):
+        self.field = field
+        self.done = False
+        self._chunks: List[str] = []
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_is_key = False
+        self._expect_key = False
+        self._emitting = False
+        self._key: List[str] = []
+        self._last_key: Optional[str] = None
+        self._value: Optional[List[str]] = None
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._chunks)
+
+    @property
+    def value(self) -> Optional[str]:
+        return ''.join(self._value) if self._value is not None else None
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk of raw model output and return newly decoded field characters"""
+        self._chunks.append(chunk)
+        if self.done:
+            return ''
+
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        out: List[str] = []
+        buf = self._buffer
+
+        while self._pos < len(buf) and not self.done:
+            c = buf[self._pos]
+
+            if self._in_string:
+                if c == '\\':
+                    decoded, consumed = _decode_escape(buf, self._pos)
+                    if not consumed:
+                        break  # wait for the rest of the escape sequence
+                    self._append(decoded, out)
+                    self._pos += consumed
+                    continue
+                if c == '"':
+                    self._close_string()
+                else:
+                    self._append(c, out)
+                self._pos += 1
+                continue
+
+            if self._depth == 0:
+                # Skip any preamble until the object starts
+                if c == '{':
+                    self._depth = 1
+                    self._expect_key = True
+            elif c == '"':
+                self._in_string = True
+                self._string_is_key = self._depth == 1 and self._expect_key
+                if self._string_is_key:
+                    self._key = []
+                elif self._depth == 1 and self._last_key == self.field:
+                    self._emitting = True
+                    self._value = []
+            elif c in '{[':
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+            elif c == ',' and self._depth == 1:
+                self._expect_key = True
+                self._last_key = None
+            self._pos += 1
+
+        return ''.join(out)
+
+    def _append(self, text: str, out: List[str]):
+        if self._string_is_key:
+            self._key.append(text)
+        elif self._emitting:
+            self._value.append(text)
+            out.append(text)
+
+    def _close_string(self):
+        self._in_string = False
+        if self._string_is_key:
+            self._last_key = ''.join(self._key)
+            self._expect_key = False
+            self._string_is_key = False
+        elif self._emitting:
+            self._emitting = False
+            self.done = True
+
+
+def _decode_escape(buf: str, pos: int) -> Tuple[str, int]:
+    """
+    Decode the escape sequence starting at buf[pos] (a backslash).
+
+    Returns (decoded_text, chars_consumed); chars_consumed is 0 when the
+    sequence is incomplete and more input is needed.
+    """
+    if pos + 1 >= len(buf):
+        return '', 0
+
+    kind = buf[pos + 1]
+    if kind != 'u':
+        return _SIMPLE_ESCAPES.get(kind, kind), 2
+
+    if pos + 6 > len(buf):
+        return '', 0
+    try:
+        code = int(buf[pos + 2:pos + 6], 16)
+    except ValueError:
+        return buf[pos + 2:pos + 6], 6
+
+    # High surrogate: combine with the following \uXXXX low surrogate
+    if 0xD800 <= code <= 0xDBFF:
+        if pos + 12 > len(buf):
+            return '', 0
+        if buf[pos + 6:pos + 8] == '\\u':
+            try:
+                low = int(buf[pos + 8:pos + 12], 16)
+            except ValueError:
+                low = 0
+            if 0xDC00 <= low <= 0xDFFF:
+                return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)), 12
+
+    return chr(code), 6
+
+
+def iter_json_objects(text: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every JSON object embedded in free text, in order.
+
+    Each '{' is tried as the start of an object, so prose with stray braces
+    before or after the JSON ("use {name} here: {...}") doesn't hide it.
+    Objects nested inside a yielded object are not yielded again.
+    """
+    decoder = json.JSONDecoder()
+    pos = text.find('{')
+    while pos != -1:
+        try:
+            value, end = decoder.raw_decode(text, pos)
+        except ValueError:
+            pos = text.find('{', pos + 1)
+            continue
+        if isinstance(value, dict):
+            yield value
+        pos = text.find('{', end)
+
+
+def repair_json(text: str, start: Optional[int] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Best-effort fix of the JSON object at `start` (by default the first one in `text`)
+
+    Handles the usual model mistakes in a single pass: raw newlines and tabs
+    inside strings, trailing commas, and output cut off mid-object (e.g. at
+    the token limit). A string value cut off mid-way is closed; a key,
+    number or literal cut off mid-way is dropped along with the member it
+    started; then the open objects and arrays are closed.
+
+    Returns:
+        (repaired JSON text or None if there's no '{', the top-level field
+        whose value was cut off and may be incomplete, or None if every
+        field kept is whole); the text isn't guaranteed to parse
+    """
+    if start is None:
+        match = _OBJECT_START.search(text)
+        start = match.start() if match else text.find('{')
+    if start == -1:
+        return None, None
+
+    out: List[str] = []
+    stack: List[str] = []
+    expect = 'value'          # what the innermost container needs next: key, colon, value or comma
+    in_string = string_is_key = in_scalar = False
+    escape = False
+    key_start = 0
+    member: Optional[str] = None  # top-level field whose value is being read
+    # A prefix that can be closed as-is, its open containers, and the field left incomplete there
+    safe: Tuple[int, Tuple[str, ...], Optional[str]] = (0, (), None)
+
+    def value_done():
+        nonlocal expect, safe, member
+        expect = 'comma'
+        if len(stack) == 1:
+            member = None
+        safe = (len(out), tuple(stack), member)
+
+    for c in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+                out.append(c)
+            elif c == '\\':
+                escape = True
+                out.append(c)
+            elif c == '"':
+                in_string = False
+                out.append(c)
+                if string_is_key:
+                    expect = 'colon'
+                    if len(stack) == 1:
+                        member = _decode_key(''.join(out[key_start:]))
+                else:
+                    value_done()
+            else:
+                out.append({'\n': '\\n', '\r': '\\r', '\t': '\\t'}.get(c, c))
+            continue
+
+        if in_scalar and (c.isspace() or c in ',:}]'):
+            in_scalar = False
+            value_done()
+
+        if c.isspace():
+            out.append(c)
+        elif c == '"':
+            in_string = True
+            string_is_key = stack[-1:] == ['{'] and expect == 'key'
+            key_start = len(out)
+            out.append(c)
+        elif c in '{[':
+            stack.append(c)
+            expect = 'key' if c == '{' else 'value'
+            out.append(c)
+            safe = (len(out), tuple(stack), member)
+        elif c in '}]':
+            if expect in ('colon', 'value') and stack[-1] == '{':
+                break  # e.g. {"a": } - give up on the member and repair from the last safe point
+            _strip_trailing_comma(out)
+            out.append('}' if stack.pop() == '{' else ']')
+            value_done()
+            if not stack:
+                return ''.join(out), None
+        elif c == ':':
+            expect = 'value'
+            out.append(c)
+        elif c == ',':
+            expect = 'key' if stack[-1] == '{' else 'value'
+            out.append(c)
+        else:
+            in_scalar = True
+            out.append(c)
+
+    # Cut off (or broken): close what's open
+    if in_string and not string_is_key:
+        if escape:
+            out.pop()
+        _drop_partial_unicode_escape(out)
+        out.append('"')
+        open_containers, incomplete = stack, member
+    else:
+        length, open_containers, incomplete = safe
+        del out[length:]
+    _strip_trailing_comma(out)
+    out.extend('}' if bracket == '{' else ']' for bracket in reversed(open_containers))
+    return ''.join(out), incomplete
+
+
+def iter_repaired_objects(text: str) -> Iterator[Tuple[Dict[str, Any], Optional[str]]]:
+    """
+    Yield (object, incomplete field) for each JSON object in `text` that parses once repaired
+
+    For output that iter_json_objects can't read; see repair_json.
+    """
+    for match in _OBJECT_START.finditer(text):
+        repaired, incomplete = repair_json(text, match.start())
+        try:
+            value = json.loads(repaired)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            yield value, incomplete
+
+
+def _decode_key(raw: str) -> str:
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw.strip('"')
+
+
+def _strip_trailing_comma(out: List[str]):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ',':
+        out.pop()
+
+
+def _drop_partial_unicode_escape(out: List[str]):
+    tail = ''.join(out[-6:])
+    cut = tail.rfind('\\u')
+    if cut != -1 and len(tail) - cut < 6:
+        del out[len(out) - (len(tail) - cut):]
+
+
+def missing_fields(data: Any, schema: Dict[str, type]) -> List[str]:
+    """
+    Fields of a simple schema ({field: type}) that `data` lacks or has with the wrong type
+
+    Returns:
+        Names of the offending fields; empty when `data` matches
+    """
+    if not isinstance(data, dict):
+        return list(schema)
+    return [field for field, kind in schema.items() if not isinstance(data.get(field), kind)]
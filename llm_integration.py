@@ -2,110 +2,566 @@
 LLM Integration - supports multiple providers (Groq, Gemini, OpenAI)
 """
 
+import functools
+import inspect
 import json
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Iterator, AsyncIterator
 from config import Config
+from llm_router import LLMRouter
+from fake_llm import FakeLLM
+from clients import clients
+from http_pool import http_client, http_timeout
+from resilience import resilient, guard_for, call_timeout
+from rate_limit import queued_for_quota, rate_limited, acquire_quota, aacquire_quota
+from metrics import registry as metrics, track_llm_call, track_stream, atrack_stream, record_usage
+from json_stream import iter_json_objects, iter_repaired_objects, missing_fields
 
-# Initialize clients based on available API keys
-groq_client = None
-gemini_model = None
-openai_client = None
+# Model used by each provider
+PROVIDER_MODELS = {
+    "groq": "llama-3.3-70b-versatile",
+    "gemini": "gemini-1.5-flash",
+    "openai": "gpt-3.5-turbo",
+    "fake": "fake-llm"
+}
 
-if Config.GROQ_API_KEY:
+# Deterministic local provider for load tests and CI (see fake_llm.py)
+fake_llm = FakeLLM(
+    latency_ms=Config.FAKE_LLM_LATENCY_MS,
+    distribution=Config.FAKE_LLM_DISTRIBUTION,
+    latency_sigma=Config.FAKE_LLM_LATENCY_SIGMA,
+    tokens_per_second=Config.FAKE_LLM_TOKENS_PER_SECOND,
+    error_rate=Config.FAKE_LLM_ERROR_RATE,
+    seed=Config.FAKE_LLM_SEED
+)
+
+
+# Provider SDKs are imported and their clients built on first use (see
+# clients.py), so a worker only pays for the providers it actually calls
+def _make_groq(async_client: bool = False):
+    if not Config.GROQ_API_KEY:
+        return None
     try:
-        from groq import Groq
-        groq_client = Groq(api_key=Config.GROQ_API_KEY)
+        from groq import Groq, AsyncGroq
     except ImportError:
         print("Groq package not installed. Run: pip install groq")
+        return None
+    return (AsyncGroq if async_client else Groq)(
+        api_key=Config.GROQ_API_KEY,
+        http_client=http_client(async_client),
+        timeout=http_timeout(),
+        max_retries=0  # retries are handled by resilience.py
+    )
+
 
-if Config.GEMINI_API_KEY:
+def _make_gemini():
+    # The Gemini SDK talks gRPC, so it keeps its own channel rather than the shared HTTP pool
+    if not Config.GEMINI_API_KEY:
+        return None
     try:
         import google.generativeai as genai
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        gemini_model = genai.GenerativeModel('gemini-1.5-flash')
     except ImportError:
         print("Gemini package not installed. Run: pip install google-generativeai")
+        return None
+    genai.configure(api_key=Config.GEMINI_API_KEY)
+    return genai.GenerativeModel(PROVIDER_MODELS['gemini'])
 
-if Config.OPENAI_API_KEY:
+
+def _make_openai(async_client: bool = False):
+    if not Config.OPENAI_API_KEY:
+        return None
     try:
-        from openai import OpenAI
-        openai_client = OpenAI(api_key=Config.OPENAI_API_KEY)
+        from openai import OpenAI, AsyncOpenAI
     except ImportError:
         print("OpenAI package not installed. Run: pip install openai")
+        return None
+    return (AsyncOpenAI if async_client else OpenAI)(
+        api_key=Config.OPENAI_API_KEY,
+        http_client=http_client(async_client),
+        timeout=http_timeout(),
+        max_retries=0  # retries are handled by resilience.py
+    )
+
+
+# Async clients are used by agenerate_llm_response (Gemini's model serves both)
+clients.register("groq", _make_groq)
+clients.register("async_groq", lambda: _make_groq(async_client=True))
+clients.register("gemini", _make_gemini)
+clients.register("openai", _make_openai)
+clients.register("async_openai", lambda: _make_openai(async_client=True))
 
+_CLIENT_ERRORS = {
+    "groq": "Groq client not initialized. Check GROQ_API_KEY",
+    "gemini": "Gemini model not initialized. Check GEMINI_API_KEY",
+    "openai": "OpenAI client not initialized. Check OPENAI_API_KEY"
+}
 
-def generate_with_groq(prompt: str, model: str = "llama-3.3-70b-versatile") -> str:
-    """Generate response using Groq API"""
-    if not groq_client:
-        raise ValueError("Groq client not initialized. Check GROQ_API_KEY")
+
+def _client(provider: str, async_client: bool = False):
+    """The provider's client, built on first use; raises if it can't be built"""
+    name = f"async_{provider}" if async_client and provider != "gemini" else provider
+    client = clients.get(name)
+    if client is None:
+        raise ValueError(_CLIENT_ERRORS[provider])
+    return client
+
+
+def warm_up_provider(provider: str):
+    """Build the provider's clients now instead of on the first request ("auto" warms every configured one)"""
+    if provider == "auto":
+        providers = [p for p in ("groq", "gemini", "openai", "fake") if _is_provider_configured(p)]
+        if not providers:
+            raise ValueError("No LLM providers initialized. Check your API keys")
+    else:
+        providers = [provider]
     
-    response = groq_client.chat.completions.create(
+    for name in providers:
+        if name == "fake":
+            if not Config.FAKE_LLM:
+                raise ValueError("Fake LLM not enabled. Set FAKE_LLM=true")
+            continue
+        if name not in _CLIENT_ERRORS:
+            raise ValueError(f"Unknown provider: {name}")
+        _client(name)
+        _client(name, async_client=True)
+
+
+@queued_for_quota("groq", PROVIDER_MODELS["groq"])
+@resilient("groq")
+@rate_limited("groq", PROVIDER_MODELS["groq"])
+@track_llm_call("groq")
+def generate_with_groq(prompt: str, model: str = PROVIDER_MODELS["groq"], json_mode: bool = False) -> str:
+    """Generate response using Groq API (json_mode asks for a JSON object)"""
+    try:
+        response = _client("groq").chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=2000,
+            timeout=http_timeout(call_timeout()),
+            **_json_format(prompt, json_mode)
+        )
+    except Exception as e:
+        text = _failed_generation(e)
+        if text is None:
+            raise
+        record_usage("groq", prompt, None, text)
+        return text
+    text = response.choices[0].message.content
+    record_usage("groq", prompt, response, text)
+    return text
+
+
+@queued_for_quota("gemini", PROVIDER_MODELS["gemini"])
+@resilient("gemini")
+@rate_limited("gemini", PROVIDER_MODELS["gemini"])
+@track_llm_call("gemini")
+def generate_with_gemini(prompt: str, json_mode: bool = False) -> str:
+    """Generate response using Google Gemini API"""
+    response = _client("gemini").generate_content(
+        prompt, **_gemini_json_config(json_mode), **_gemini_request_options()
+    )
+    record_usage("gemini", prompt, response, response.text)
+    return response.text
+
+
+@queued_for_quota("openai", PROVIDER_MODELS["openai"])
+@resilient("openai")
+@rate_limited("openai", PROVIDER_MODELS["openai"])
+@track_llm_call("openai")
+def generate_with_openai(prompt: str, model: str = PROVIDER_MODELS["openai"], json_mode: bool = False) -> str:
+    """Generate response using OpenAI API"""
+    response = _client("openai").chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.7,
-        max_tokens=2000
+        max_tokens=2000,
+        timeout=http_timeout(call_timeout()),
+        **_json_format(prompt, json_mode)
     )
-    return response.choices[0].message.content
+    text = response.choices[0].message.content
+    record_usage("openai", prompt, response, text)
+    return text
 
 
-def generate_with_gemini(prompt: str) -> str:
-    """Generate response using Google Gemini API"""
-    if not gemini_model:
-        raise ValueError("Gemini model not initialized. Check GEMINI_API_KEY")
+@queued_for_quota("fake", PROVIDER_MODELS["fake"])
+@resilient("fake")
+@rate_limited("fake", PROVIDER_MODELS["fake"])
+@track_llm_call("fake")
+def generate_with_fake(prompt: str, json_mode: bool = False) -> str:
+    """Generate response using the local fake LLM (its output is always JSON)"""
+    text = fake_llm.generate(prompt)
+    record_usage("fake", prompt, None, text)
+    return text
+
+
+def generate_llm_response(prompt: str, provider: str = "groq", json_mode: bool = False) -> str:
+    """
+    Generate LLM response using specified provider
+    
+    Args:
+        prompt: The prompt to send to the LLM
+        provider: One of "groq", "gemini", "openai", "fake", or "auto" to let
+            the router pick the fastest healthy provider
+        json_mode: Use the provider's JSON output mode, where it has one, for
+            prompts that ask for a JSON object (see LLM_JSON_MODE)
+    
+    Returns:
+        LLM response as string
+    """
+    if provider == "auto":
+        return router.generate(prompt, json_mode=json_mode)
+    if Config.LLM_FAILOVER:
+        return router.generate(prompt, preferred=provider, json_mode=json_mode)
     
-    response = gemini_model.generate_content(prompt)
+    if provider == "groq":
+        return generate_with_groq(prompt, json_mode=json_mode)
+    elif provider == "gemini":
+        return generate_with_gemini(prompt, json_mode=json_mode)
+    elif provider == "openai":
+        return generate_with_openai(prompt, json_mode=json_mode)
+    elif provider == "fake":
+        return generate_with_fake(prompt, json_mode=json_mode)
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+
+@queued_for_quota("groq", PROVIDER_MODELS["groq"])
+@resilient("groq")
+@rate_limited("groq", PROVIDER_MODELS["groq"])
+@track_llm_call("groq")
+async def agenerate_with_groq(prompt: str, model: str = PROVIDER_MODELS["groq"], json_mode: bool = False) -> str:
+    """Generate response using Groq API without blocking the event loop"""
+    try:
+        response = await _client("groq", async_client=True).chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=2000,
+            timeout=http_timeout(call_timeout()),
+            **_json_format(prompt, json_mode)
+        )
+    except Exception as e:
+        text = _failed_generation(e)
+        if text is None:
+            raise
+        record_usage("groq", prompt, None, text)
+        return text
+    text = response.choices[0].message.content
+    record_usage("groq", prompt, response, text)
+    return text
+
+
+@queued_for_quota("gemini", PROVIDER_MODELS["gemini"])
+@resilient("gemini")
+@rate_limited("gemini", PROVIDER_MODELS["gemini"])
+@track_llm_call("gemini")
+async def agenerate_with_gemini(prompt: str, json_mode: bool = False) -> str:
+    """Generate response using Google Gemini API without blocking the event loop"""
+    response = await _client("gemini", async_client=True).generate_content_async(
+        prompt, **_gemini_json_config(json_mode), **_gemini_request_options()
+    )
+    record_usage("gemini", prompt, response, response.text)
     return response.text
 
 
-def generate_with_openai(prompt: str, model: str = "gpt-3.5-turbo") -> str:
-    """Generate response using OpenAI API"""
-    if not openai_client:
-        raise ValueError("OpenAI client not initialized. Check OPENAI_API_KEY")
-    
-    response = openai_client.chat.completions.create(
+@queued_for_quota("openai", PROVIDER_MODELS["openai"])
+@resilient("openai")
+@rate_limited("openai", PROVIDER_MODELS["openai"])
+@track_llm_call("openai")
+async def agenerate_with_openai(prompt: str, model: str = PROVIDER_MODELS["openai"], json_mode: bool = False) -> str:
+    """Generate response using OpenAI API without blocking the event loop"""
+    response = await _client("openai", async_client=True).chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.7,
-        max_tokens=2000
+        max_tokens=2000,
+        timeout=http_timeout(call_timeout()),
+        **_json_format(prompt, json_mode)
     )
-    return response.choices[0].message.content
+    text = response.choices[0].message.content
+    record_usage("openai", prompt, response, text)
+    return text
 
 
-def generate_llm_response(prompt: str, provider: str = "groq") -> str:
+@queued_for_quota("fake", PROVIDER_MODELS["fake"])
+@resilient("fake")
+@rate_limited("fake", PROVIDER_MODELS["fake"])
+@track_llm_call("fake")
+async def agenerate_with_fake(prompt: str, json_mode: bool = False) -> str:
+    """Generate response using the local fake LLM without blocking the event loop"""
+    text = await fake_llm.agenerate(prompt)
+    record_usage("fake", prompt, None, text)
+    return text
+
+
+async def agenerate_llm_response(prompt: str, provider: str = "groq", json_mode: bool = False) -> str:
     """
-    Generate LLM response using specified provider
+    Async version of generate_llm_response
+    
+    Many calls can be in flight at once on a single event loop, so one worker
+    process is no longer tied up for the whole duration of each LLM call.
     
     Args:
         prompt: The prompt to send to the LLM
-        provider: One of "groq", "gemini", "openai"
+        provider: One of "groq", "gemini", "openai", "fake", or "auto"
+        json_mode: Use the provider's JSON output mode (see generate_llm_response)
     
     Returns:
         LLM response as string
     """
+    if provider == "auto":
+        return await router.agenerate(prompt, json_mode=json_mode)
+    if Config.LLM_FAILOVER:
+        return await router.agenerate(prompt, preferred=provider, json_mode=json_mode)
+    
     if provider == "groq":
-        return generate_with_groq(prompt)
+        return await agenerate_with_groq(prompt, json_mode=json_mode)
     elif provider == "gemini":
-        return generate_with_gemini(prompt)
+        return await agenerate_with_gemini(prompt, json_mode=json_mode)
     elif provider == "openai":
-        return generate_with_openai(prompt)
+        return await agenerate_with_openai(prompt, json_mode=json_mode)
+    elif provider == "fake":
+        return await agenerate_with_fake(prompt, json_mode=json_mode)
     else:
         raise ValueError(f"Unknown provider: {provider}")
 
 
-def extract_json_from_response(response: str) -> Dict[str, Any]:
+def _json_format(prompt: str, json_mode: bool) -> Dict[str, Any]:
+    """Groq/OpenAI JSON mode arguments; both reject it for prompts that don't mention JSON"""
+    if not (json_mode and Config.LLM_JSON_MODE and "json" in prompt.lower()):
+        return {}
+    return {"response_format": {"type": "json_object"}}
+
+
+def _gemini_json_config(json_mode: bool) -> Dict[str, Any]:
+    """Gemini JSON output arguments, if the installed SDK supports them"""
+    if not (json_mode and Config.LLM_JSON_MODE and _gemini_supports_json()):
+        return {}
+    return {"generation_config": {"response_mime_type": "application/json"}}
+
+
+@functools.lru_cache(maxsize=None)
+def _gemini_supports_json() -> bool:
+    # response_mime_type arrived in google-generativeai 0.5; older SDKs reject unknown config keys
+    try:
+        from google.generativeai.types import GenerationConfig
+        return "response_mime_type" in inspect.signature(GenerationConfig).parameters
+    except (ImportError, TypeError, ValueError):
+        return False
+
+
+def _gemini_request_options() -> Dict[str, Any]:
+    """Gemini per-request timeout (time left before the call's deadline), if the installed SDK supports it"""
+    remaining = call_timeout()
+    if remaining is None or not _gemini_supports_request_options():
+        return {}
+    return {"request_options": {"timeout": remaining}}
+
+
+@functools.lru_cache(maxsize=None)
+def _gemini_supports_request_options() -> bool:
+    # request_options arrived in google-generativeai 0.4; on older SDKs only
+    # async calls are bounded (by the guard's asyncio.wait_for)
+    try:
+        from google.generativeai import GenerativeModel
+        return "request_options" in inspect.signature(GenerativeModel.generate_content).parameters
+    except (ImportError, TypeError, ValueError):
+        return False
+
+
+def _failed_generation(error: Exception) -> Optional[str]:
+    """
+    The model's output from a Groq JSON-mode rejection (400 json_validate_failed)
+    
+    Groq refuses output that isn't valid JSON but returns it in the error;
+    extract_json_from_response can usually repair it, which is much cheaper
+    than generating again.
+    """
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        details = body.get("error", body)
+        if isinstance(details, dict) and details.get("code") == "json_validate_failed":
+            return details.get("failed_generation")
+    return None
+
+
+def stream_llm_response(prompt: str, provider: str = "groq") -> Iterator[str]:
+    """
+    Stream an LLM response chunk by chunk using the provider's streaming API
+    
+    Args:
+        prompt: The prompt to send to the LLM
+        provider: One of "groq", "gemini", "openai", "fake"
+    
+    Yields:
+        Text chunks as they arrive
+    """
+    if provider == "auto":
+        provider = _pick_stream_provider()
+    
+    chunks = guard_for(provider).stream(lambda: _stream_chunks(prompt, provider))
+    yield from track_stream(provider, prompt, chunks)
+
+
+def _stream_chunks(prompt: str, provider: str) -> Iterator[str]:
+    acquire_quota(provider, PROVIDER_MODELS.get(provider, ""), prompt)
+    if provider in ("groq", "openai"):
+        client = _client(provider)
+        model = PROVIDER_MODELS[provider]
+        
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=2000,
+            stream=True,
+            timeout=http_timeout(call_timeout())
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    elif provider == "gemini":
+        for chunk in _client("gemini").generate_content(prompt, stream=True, **_gemini_request_options()):
+            if chunk.text:
+                yield chunk.text
+    elif provider == "fake":
+        yield from fake_llm.stream(prompt)
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+
+async def astream_llm_response(prompt: str, provider: str = "groq") -> AsyncIterator[str]:
+    """Async version of stream_llm_response"""
+    if provider == "auto":
+        provider = _pick_stream_provider()
+    
+    chunks = guard_for(provider).astream(lambda: _astream_chunks(prompt, provider))
+    async for chunk in atrack_stream(provider, prompt, chunks):
+        yield chunk
+
+
+async def _astream_chunks(prompt: str, provider: str) -> AsyncIterator[str]:
+    await aacquire_quota(provider, PROVIDER_MODELS.get(provider, ""), prompt)
+    if provider in ("groq", "openai"):
+        client = _client(provider, async_client=True)
+        model = PROVIDER_MODELS[provider]
+        
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=2000,
+            stream=True,
+            timeout=http_timeout(call_timeout())
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    elif provider == "gemini":
+        response = await _client("gemini", async_client=True).generate_content_async(
+            prompt, stream=True, **_gemini_request_options()
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+    elif provider == "fake":
+        async for chunk in fake_llm.astream(prompt):
+            yield chunk
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+
+def _is_provider_configured(provider: str) -> bool:
+    """Whether the provider has credentials, without importing its SDK"""
+    return {
+        "groq": bool(Config.GROQ_API_KEY),
+        "gemini": bool(Config.GEMINI_API_KEY),
+        "openai": bool(Config.OPENAI_API_KEY),
+        "fake": Config.FAKE_LLM
+    }.get(provider, False)
+
+
+def _is_provider_available(provider: str) -> bool:
+    # Doesn't build the client; a provider whose SDK turns out to be missing drops out after its first call.
+    # Providers with an open circuit breaker are skipped until it lets a probe through
+    return (
+        _is_provider_configured(provider)
+        and not clients.failed(provider)
+        and not guard_for(provider).breaker.is_open()
+    )
+
+
+def _pick_stream_provider() -> str:
+    """Streams can't be hedged mid-response, so just take the best-ranked provider"""
+    ranked = router.rank()
+    if not ranked:
+        raise ValueError("No LLM providers initialized. Check your API keys")
+    return ranked[0]
+
+
+# Routes "auto" (and every call when LLM_FAILOVER is on) across providers
+router = LLMRouter(
+    sync_fns={
+        "groq": generate_with_groq,
+        "gemini": generate_with_gemini,
+        "openai": generate_with_openai,
+        "fake": generate_with_fake
+    },
+    async_fns={
+        "groq": agenerate_with_groq,
+        "gemini": agenerate_with_gemini,
+        "openai": agenerate_with_openai,
+        "fake": agenerate_with_fake
+    },
+    is_available=_is_provider_available,
+    timeout=Config.LLM_TIMEOUT,
+    hedge=Config.LLM_HEDGE
+)
+
+
+def extract_json_from_response(
+    response: str,
+    schema: Optional[Dict[str, type]] = None,
+    allow_truncated: bool = False
+) -> Dict[str, Any]:
     """
     Extract JSON from LLM response (handles cases where LLM includes extra text)
+    
+    Every object embedded in the text is tried in order, and the first one
+    with the schema's fields is returned, so stray braces around the JSON
+    don't break parsing. If none matches, repaired copies of the objects
+    (raw newlines in strings, trailing commas, missing closing brackets)
+    are tried before giving up.
+    
+    Args:
+        response: Raw LLM output
+        schema: Required fields and their types, e.g. {"reply": str}
+        allow_truncated: Accept output cut off in the middle of a required
+            field's value, e.g. for a reply but not a prompt (a cut-off
+            optional field is always accepted)
+    
+    Raises:
+        ValueError: If no matching JSON object can be recovered
     """
-    # Try to find JSON in the response
-    start_idx = response.find('{')
-    end_idx = response.rfind('}')
+    schema = schema or {}
+    for candidate in iter_json_objects(response):
+        if not missing_fields(candidate, schema):
+            metrics.inc('issa_llm_json_parse_total', {'result': 'ok'})
+            return candidate
     
-    if start_idx == -1 or end_idx == -1:
-        raise ValueError(f"No JSON found in response: {response}")
+    for candidate, incomplete in iter_repaired_objects(response):
+        if (allow_truncated or incomplete not in schema) and not missing_fields(candidate, schema):
+            metrics.inc('issa_llm_json_parse_total', {'result': 'repaired'})
+            return candidate
     
-    json_str = response[start_idx:end_idx + 1]
-    return json.loads(json_str)
+    metrics.inc('issa_llm_json_parse_total', {'result': 'failed'})
+    if '{' not in response:
+        raise ValueError(f"No JSON found in response: {response}")
+    raise ValueError(f"No valid JSON object with fields {sorted(schema)} in response: {response}")
+
+
+metrics.describe('issa_llm_json_parse_total', 'counter', 'JSON extraction from LLM output (ok, repaired or failed)')
 
 
 def format_chat_history(messages: list) -> str:
@@ -113,19 +569,26 @@ def format_chat_history(messages: list) -> str:
     if not messages:
         return "(No previous messages)"
     
-    formatted = []
-    for msg in messages:
-        role = msg.get('direction', msg.get('role', 'unknown'))
-        text = msg.get('text', msg.get('message', ''))
-        
-        if role in ['in', 'client']:
-            formatted.append(f"(CLIENT) {text}")
-        elif role in ['out', 'consultant']:
-            formatted.append(f"(CONSULTANT) {text}")
+    # Training examples carry a precomputed formatted prefix (parse_conversations.MessageSlice)
+    if hasattr(messages, 'formatted'):
+        return messages.formatted()
     
+    formatted = [line for line in map(format_chat_message, messages) if line is not None]
     return '\n'.join(formatted)
 
 
+def format_chat_message(msg: dict) -> Optional[str]:
+    """Format one chat message as a (CLIENT)/(CONSULTANT) line, or None for unknown roles"""
+    role = msg.get('direction', msg.get('role', 'unknown'))
+    text = msg.get('text', msg.get('message', ''))
+    
+    if role in ['in', 'client']:
+        return f"(CLIENT) {text}"
+    elif role in ['out', 'consultant']:
+        return f"(CONSULTANT) {text}"
+    return None
+
+
 def format_client_sequence(messages: list) -> str:
     """Format client message sequence"""
     if not messages:
@@ -152,7 +615,7 @@ def test_llm_integration():
     print("Testing LLM Integration...")
     print("=" * 60)
     
-    if groq_client:
+    if _is_provider_available("groq"):
         print("\n✓ Groq API Available")
         try:
             response = generate_with_groq(test_prompt)
@@ -162,7 +625,7 @@ def test_llm_integration():
     else:
         print("\n✗ Groq API Not Available")
     
-    if gemini_model:
+    if _is_provider_available("gemini"):
         print("\n✓ Gemini API Available")
         try:
             response = generate_with_gemini(test_prompt)
@@ -172,7 +635,7 @@ def test_llm_integration():
     else:
         print("\n✗ Gemini API Not Available")
     
-    if openai_client:
+    if _is_provider_available("openai"):
         print("\n✓ OpenAI API Available")
         try:
             response = generate_with_openai(test_prompt)
@@ -0,0 +1,277 @@
+"""
+LLM Router - latency-aware provider selection with failover and hedged requests
+Spreads calls over Groq, Gemini and OpenAI based on their recent behaviour
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Any
+
+
+class ProviderStats:
+    """Rolling latency and error window for one provider"""
+
+    def __init__(self, window: int = 50):
+        self._samples = deque(maxlen=window)  # (latency_seconds, ok)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def success_count(self) -> int:
+        with self._lock:
+            return sum(1 for _, ok in self._samples if ok)
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        """Percentile of successful call latencies, None until there is data"""
+        with self._lock:
+            latencies = sorted(lat for lat, ok in self._samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(pct / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._samples)
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        return {
+            'calls': calls,
+            'error_rate': round(self.error_rate(), 4),
+            'p50_seconds': round(p50, 3) if p50 is not None else None,
+            'p95_seconds': round(p95, 3) if p95 is not None else None
+        }
+
+
+class LLMRouter:
+    """
+    Picks the healthiest, fastest provider for each call and fails over on errors.
+
+    Providers are ranked by recent error rate, then by median latency, with
+    the caller's preferred provider first while it is healthy. A call that
+    errors or exceeds `timeout` moves on to the next provider. With hedging
+    enabled, a second provider is started when the first one runs past its
+    own p95 latency, and whichever answers first wins.
+    """
+
+    # Providers above this error rate lose their "preferred" priority
+    UNHEALTHY_ERROR_RATE = 0.5
+
+    # Successful samples needed before a p95 is trusted for hedging
+    MIN_HEDGE_SAMPLES = 5
+
+    # Threads for sync calls; calls abandoned after `timeout` keep theirs until they return
+    MAX_THREADS = 16
+
+    def __init__(
+        self,
+        sync_fns: Dict[str, Callable[..., str]],
+        async_fns: Dict[str, Callable],
+        is_available: Callable[[str], bool],
+        timeout: float = 60.0,
+        hedge: bool = False,
+        window: int = 50
+    ):
+        self.sync_fns = sync_fns
+        self.async_fns = async_fns
+        self.is_available = is_available
+        self.timeout = timeout
+        self.hedge = hedge
+        self.stats = {name: ProviderStats(window) for name in sync_fns}
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_THREADS, thread_name_prefix='llm-router')
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+
+    def rank(self, preferred: Optional[str] = None) -> List[str]:
+        """Available providers, best first"""
+        providers = [p for p in self.sync_fns if self.is_available(p)]
+
+        def score(provider):
+            stats = self.stats[provider]
+            p50 = stats.latency_percentile(50)
+            unhealthy = stats.error_rate() > self.UNHEALTHY_ERROR_RATE
+            return (
+                unhealthy,
+                provider != preferred,
+                round(stats.error_rate(), 1),
+                p50 if p50 is not None else 0.0
+            )
+
+        return sorted(providers, key=score)
+
+    def generate(self, prompt: str, preferred: Optional[str] = None, json_mode: bool = False) -> str:
+        """Generate a response, failing over across providers until one succeeds (json_mode is passed to each provider)"""
+        order = self.rank(preferred)
+        if not order:
+            raise ValueError("No LLM providers initialized. Check your API keys")
+
+        errors = []
+        tried = set()
+        for provider in order:
+            if provider in tried:
+                continue  # already failed as the hedge of an earlier provider
+            backup = next((p for p in order if p != provider and p not in tried), None)
+            try:
+                return self._generate_with_hedge(prompt, provider, backup, json_mode, tried)
+            except Exception as e:
+                errors.append(f"{provider}: {e}")
+                print(f"Warning: {provider} failed ({e}), failing over")
+
+        raise RuntimeError(f"All LLM providers failed: {'; '.join(errors)}")
+
+    async def agenerate(self, prompt: str, preferred: Optional[str] = None, json_mode: bool = False) -> str:
+        """Async version of generate"""
+        order = self.rank(preferred)
+        if not order:
+            raise ValueError("No LLM providers initialized. Check your API keys")
+
+        errors = []
+        tried = set()
+        for provider in order:
+            if provider in tried:
+                continue
+            backup = next((p for p in order if p != provider and p not in tried), None)
+            try:
+                return await self._agenerate_with_hedge(prompt, provider, backup, json_mode, tried)
+            except Exception as e:
+                errors.append(f"{provider}: {e}")
+                print(f"Warning: {provider} failed ({e}), failing over")
+
+        raise RuntimeError(f"All LLM providers failed: {'; '.join(errors)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-provider rolling stats, for health/metrics endpoints"""
+        return {
+            name: dict(stats.snapshot(), available=self.is_available(name))
+            for name, stats in self.stats.items()
+        }
+
+    def _hedge_delay(self, provider: str, backup: Optional[str]) -> Optional[float]:
+        if not self.hedge or not backup:
+            return None
+        stats = self.stats[provider]
+        if stats.success_count() < self.MIN_HEDGE_SAMPLES:
+            return None
+        return stats.latency_percentile(95)
+
+    def _timed_call(self, provider: str, prompt: str, json_mode: bool) -> str:
+        start = time.perf_counter()
+        try:
+            result = self.sync_fns[provider](prompt, json_mode=json_mode)
+        except Exception:
+            self.stats[provider].record(time.perf_counter() - start, ok=False)
+            raise
+        self.stats[provider].record(time.perf_counter() - start, ok=True)
+        return result
+
+    async def _atimed_call(self, provider: str, prompt: str, json_mode: bool) -> str:
+        start = time.perf_counter()
+        try:
+            result = await self.async_fns[provider](prompt, json_mode=json_mode)
+        except Exception:
+            self.stats[provider].record(time.perf_counter() - start, ok=False)
+            raise
+        self.stats[provider].record(time.perf_counter() - start, ok=True)
+        return result
+
+    def _submit(self, provider: str, prompt: str, json_mode: bool):
+        """Start a call on the thread pool, or return None if every thread is taken"""
+        with self._busy_lock:
+            if self._busy >= self.MAX_THREADS:
+                return None
+            self._busy += 1
+
+        def run():
+            try:
+                return self._timed_call(provider, prompt, json_mode)
+            finally:
+                with self._busy_lock:
+                    self._busy -= 1
+
+        # Copy the context so the call keeps the caller's priority and deadline (rate_limit.py, resilience.py)
+        return self._executor.submit(contextvars.copy_context().run, run)
+
+    def _generate_with_hedge(self, prompt: str, provider: str, backup: Optional[str], json_mode: bool, tried: set) -> str:
+        deadline = time.monotonic() + self.timeout
+        tried.add(provider)
+        future = self._submit(provider, prompt, json_mode)
+        if future is None:
+            # Pool saturated by slow or abandoned calls: call in this thread rather
+            # than queue behind them (the provider deadline still bounds it)
+            print("Warning: LLM router thread pool is full, calling without timeout or hedge")
+            return self._timed_call(provider, prompt, json_mode)
+        futures = {future: provider}
+
+        hedge_delay = self._hedge_delay(provider, backup)
+        if hedge_delay is not None:
+            done, _ = wait(futures, timeout=min(hedge_delay, self.timeout))
+            if not done:
+                hedge = self._submit(backup, prompt, json_mode)
+                if hedge is not None:
+                    futures[hedge] = backup
+                    tried.add(backup)
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+
+        if pending:
+            # Abandon the slow call; its thread finishes in the background and
+            # records its own outcome in the provider's stats
+            raise TimeoutError(f"No response within {self.timeout}s")
+        raise last_error
+
+    async def _agenerate_with_hedge(self, prompt: str, provider: str, backup: Optional[str], json_mode: bool, tried: set) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        tried.add(provider)
+        tasks = {asyncio.ensure_future(self._atimed_call(provider, prompt, json_mode))}
+
+        try:
+            hedge_delay = self._hedge_delay(provider, backup)
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=min(hedge_delay, self.timeout))
+                if not done:
+                    tasks.add(asyncio.ensure_future(self._atimed_call(backup, prompt, json_mode)))
+                    tried.add(backup)
+
+            last_error = None
+            pending = set(tasks)
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+
+            if pending:
+                self.stats[provider].record(self.timeout, ok=False)
+                raise TimeoutError(f"No response within {self.timeout}s")
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -0,0 +1,365 @@
+"""
+Metrics - Prometheus counters and histograms for the reply and editor pipelines
+Exposed in the Prometheus text format on GET /metrics, aggregated across the workers on a host
+"""
+
+import asyncio
+import bisect
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Any, Iterable, Iterator, AsyncIterator, List, Optional, Tuple
+from config import Config
+from timing import set_stage_listener
+from history_window import estimate_tokens
+
+# Latency buckets in seconds: fine-grained for cache/DB stages, wide enough for slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+class MetricsRegistry:
+    """
+    Minimal thread-safe metrics store with Prometheus text output.
+
+    Counters and histograms are recorded in-process (a lock and a couple of
+    dict operations per call). Collectors are called at scrape time to read
+    counters that other components already keep, such as cache hit counts.
+
+    With `shared_dir` set, each worker periodically writes its snapshot
+    there and render() sums the snapshots of every live worker, so a scrape
+    sees the whole host rather than whichever worker answered.
+    """
+
+    def __init__(self, shared_dir: Optional[str] = None, flush_interval: float = 5.0, buckets=DEFAULT_BUCKETS):
+        self.shared_dir = shared_dir
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._meta: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}  # bucket counts..., sum, count
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+        self._ensure_flusher()
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            row = series.get(key)
+            if row is None:
+                row = series[key] = [0.0] * (len(self.buckets) + 3)
+            row[index] += 1  # index len(buckets) is the +Inf overflow
+            row[-2] += value
+            row[-1] += 1
+        self._ensure_flusher()
+
+    def add_collector(self, collect: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]):
+        """Register fn() -> [(counter name, labels, cumulative value)] read at snapshot time"""
+        self._collectors.append(collect)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serialisable copy of this process's metrics"""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self._histograms.items()}
+
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    counters.setdefault(name, {})[_label_key(labels)] = float(value)
+            except Exception as e:
+                print(f"Warning: metrics collector failed ({e})")
+
+        return {
+            'counters': {name: [[list(map(list, k)), v] for k, v in s.items()] for name, s in counters.items()},
+            'histograms': {name: [[list(map(list, k)), v] for k, v in s.items()] for name, s in histograms.items()}
+        }
+
+    def render(self) -> str:
+        """Prometheus text exposition of this process, or of every live worker when shared"""
+        snapshots = [self.snapshot()]
+        if self.shared_dir:
+            self.flush(snapshots[0])
+            snapshots = self._read_shared()
+        counters, histograms = _merge(snapshots)
+
+        lines = []
+        for name in sorted(counters):
+            lines += self._header(name, 'counter')
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            lines += self._header(name, 'histogram')
+            for key, row in sorted(histograms[name].items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, row):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {_format_value(cumulative)}")
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {_format_value(row[-1])}")
+                lines.append(f"{name}_sum{_format_labels(key)} {row[-2]!r}")
+                lines.append(f"{name}_count{_format_labels(key)} {_format_value(row[-1])}")
+        return '\n'.join(lines) + '\n'
+
+    def flush(self, snapshot: Optional[Dict[str, Any]] = None):
+        """Write this worker's snapshot to the shared directory"""
+        if not self.shared_dir:
+            return
+        snapshot = snapshot or self.snapshot()
+        fd, tmp_path = tempfile.mkstemp(dir=self.shared_dir, prefix='.metrics')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, os.path.join(self.shared_dir, f"{os.getpid()}.json"))
+
+    def _header(self, name: str, default_kind: str) -> List[str]:
+        kind, help_text = self._meta.get(name, (default_kind, name))
+        return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+    def _read_shared(self) -> List[Dict[str, Any]]:
+        snapshots = []
+        for filename in os.listdir(self.shared_dir):
+            if not filename.endswith('.json') or not filename[:-5].isdigit():
+                continue
+            path = os.path.join(self.shared_dir, filename)
+            if not _pid_alive(int(filename[:-5])):
+                # Worker is gone; its counters reset like any restarted process
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def _ensure_flusher(self):
+        # One flush thread per process, restarted after a fork
+        if not self.shared_dir or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Warning: metrics flush failed ({e})")
+
+
+def _merge(snapshots: List[Dict[str, Any]]):
+    counters: Dict[str, Dict[LabelKey, float]] = {}
+    histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+    for snapshot in snapshots:
+        for name, series in snapshot['counters'].items():
+            merged = counters.setdefault(name, {})
+            for key, value in series:
+                key = tuple(map(tuple, key))
+                merged[key] = merged.get(key, 0.0) + value
+        for name, series in snapshot['histograms'].items():
+            merged = histograms.setdefault(name, {})
+            for key, row in series:
+                key = tuple(map(tuple, key))
+                if key in merged and len(merged[key]) == len(row):
+                    merged[key] = [a + b for a, b in zip(merged[key], row)]
+                else:
+                    merged[key] = list(row)
+    return counters, histograms
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    escaped = (
+        f'{k}="' + v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in key
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+# Process-wide registry, shared across workers through METRICS_DIR
+registry = MetricsRegistry(Config.METRICS_DIR or None, flush_interval=Config.METRICS_FLUSH_SECONDS)
+
+registry.describe('issa_stage_duration_seconds', 'histogram', 'Time spent in each pipeline stage')
+registry.describe('issa_stage_errors_total', 'counter', 'Pipeline stages that raised an exception')
+registry.describe('issa_http_request_duration_seconds', 'histogram', 'HTTP request latency by route and status')
+registry.describe('issa_llm_request_duration_seconds', 'histogram', 'LLM provider call latency')
+registry.describe('issa_llm_requests_total', 'counter', 'LLM provider calls by outcome')
+registry.describe('issa_llm_tokens_total', 'counter', 'LLM tokens used (estimated where the provider does not report usage)')
+registry.describe('issa_cache_requests_total', 'counter', 'Prompt and reply cache lookups by result')
+
+
+def _record_stage(name: str, seconds: float, failed: bool):
+    registry.observe('issa_stage_duration_seconds', seconds, {'stage': name})
+    if failed:
+        registry.inc('issa_stage_errors_total', {'stage': name})
+
+
+# Every timing.stage() block feeds the stage histogram, inside requests or not
+set_stage_listener(_record_stage)
+
+
+def record_http_request(route: str, method: str, status: int, seconds: float):
+    registry.observe('issa_http_request_duration_seconds', seconds, {
+        'route': route, 'method': method, 'status': str(status)
+    })
+
+
+# Called with (provider, prompt tokens, completion tokens) after each LLM call (see rate_limit.py)
+_usage_listener: Optional[Callable[[str, int, int], None]] = None
+
+
+def set_usage_listener(listener: Optional[Callable[[str, int, int], None]]):
+    global _usage_listener
+    _usage_listener = listener
+
+
+def record_llm_tokens(provider: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    if _usage_listener is not None:
+        _usage_listener(provider, prompt_tokens or 0, completion_tokens or 0)
+    if prompt_tokens:
+        registry.inc('issa_llm_tokens_total', {'provider': provider, 'kind': 'prompt'}, prompt_tokens)
+    if completion_tokens:
+        registry.inc('issa_llm_tokens_total', {'provider': provider, 'kind': 'completion'}, completion_tokens)
+
+
+def track_llm_call(provider: str):
+    """
+    Decorator for one provider's generate function (sync or async)
+
+    Records call latency and success/error counts; the function reports
+    its own token usage through record_usage.
+    """
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception:
+                    _record_llm_call(provider, started, ok=False)
+                    raise
+                _record_llm_call(provider, started, ok=True)
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                _record_llm_call(provider, started, ok=False)
+                raise
+            _record_llm_call(provider, started, ok=True)
+            return result
+        return wrapper
+
+    return decorate
+
+
+def track_stream(provider: str, prompt: str, chunks: Iterator[str]) -> Iterator[str]:
+    """Pass a provider stream through, recording it like one LLM call (tokens are estimated)"""
+    started = time.perf_counter()
+    received = []
+    try:
+        for chunk in chunks:
+            received.append(chunk)
+            yield chunk
+    except Exception:
+        _record_llm_call(provider, started, ok=False)
+        raise
+    _record_llm_call(provider, started, ok=True)
+    record_llm_tokens(provider, estimate_tokens(prompt), estimate_tokens(''.join(received)))
+
+
+async def atrack_stream(provider: str, prompt: str, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Async version of track_stream"""
+    started = time.perf_counter()
+    received = []
+    try:
+        async for chunk in chunks:
+            received.append(chunk)
+            yield chunk
+    except Exception:
+        _record_llm_call(provider, started, ok=False)
+        raise
+    _record_llm_call(provider, started, ok=True)
+    record_llm_tokens(provider, estimate_tokens(prompt), estimate_tokens(''.join(received)))
+
+
+def _record_llm_call(provider: str, started: float, ok: bool):
+    registry.observe('issa_llm_request_duration_seconds', time.perf_counter() - started, {'provider': provider})
+    registry.inc('issa_llm_requests_total', {'provider': provider, 'outcome': 'ok' if ok else 'error'})
+
+
+def record_usage(provider: str, prompt: str, response: Any, text: str):
+    """
+    Token usage from a provider response object
+
+    Groq/OpenAI responses carry usage.prompt_tokens/completion_tokens and
+    Gemini responses usage_metadata; anything else is estimated from the
+    prompt and output text.
+    """
+    usage = getattr(response, 'usage', None)
+    if usage is not None and getattr(usage, 'prompt_tokens', None) is not None:
+        record_llm_tokens(provider, usage.prompt_tokens, usage.completion_tokens)
+        return
+
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None and getattr(usage, 'prompt_token_count', None) is not None:
+        record_llm_tokens(provider, usage.prompt_token_count, getattr(usage, 'candidates_token_count', 0))
+        return
+
+    record_llm_tokens(provider, estimate_tokens(prompt), estimate_tokens(text))
+
+
+def render_metrics() -> str:
+    return registry.render()
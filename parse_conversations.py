@@ -3,61 +3,285 @@ CURSOR PROMPT 1 Implementation:
 Parse conversations.json to create a list of (client sequence + consultant sequence reply + chat history)
 """
 
+import itertools
 import json
-from typing import List, Dict, Any
+import threading
+from array import array
+from collections.abc import Sequence
+from typing import List, Dict, Any, Iterator, Iterable
 
 def load_conversations(filepath: str = 'conversations.json') -> List[Dict[str, Any]]:
     """Load conversations from JSON file"""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return list(iter_conversations(filepath))
 
-def extract_training_examples(conversations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def iter_conversations(filepath: str = 'conversations.json', chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    Yield conversations one at a time from a JSON array or a JSONL file.
+    Only one conversation (plus one read chunk) is held in memory at a time,
+    so multi-gigabyte exports can be processed in a small container.
+    
+    Raises:
+        ValueError: for malformed JSON, with the character offset in the file
+    """
+    decoder = json.JSONDecoder()
+    
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        buffer = f.read(chunk_size)
+        consumed = 0  # characters dropped from the front of buffer
+        eof = not buffer
+        pos = _skip_whitespace(buffer, 0)
+        
+        # JSON array: walk its elements; anything else is treated as JSONL
+        in_array = buffer[pos:pos + 1] == '['
+        if in_array:
+            pos += 1
+        
+        while True:
+            # Skip whitespace and separators between elements
+            pos = _skip_whitespace(buffer, pos)
+            while in_array and buffer[pos:pos + 1] == ',':
+                pos = _skip_whitespace(buffer, pos + 1)
+            
+            if in_array and buffer[pos:pos + 1] == ']':
+                return
+            
+            try:
+                if pos >= len(buffer):
+                    raise json.JSONDecodeError("Need more data", buffer, pos)
+                conversation, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof and pos >= len(buffer) and not in_array:
+                    return
+                if eof or not _cut_off_by_buffer(e):
+                    # Malformed element: fail now rather than buffering the rest of the file
+                    raise ValueError(f"{filepath}: {e.msg} at character {consumed + e.pos}") from None
+                # The next element continues past the end of the buffer: read
+                # more, growing the read so huge elements aren't rescanned often
+                more = f.read(max(chunk_size, len(buffer) - pos))
+                eof = not more
+                buffer = buffer[pos:] + more
+                consumed += pos
+                pos = 0
+                continue
+            
+            yield conversation
+            pos = end
+
+def _cut_off_by_buffer(error: json.JSONDecodeError) -> bool:
+    """
+    True if the decoder failed only because the element runs past the end of
+    the buffer. Strings report where they start, everything else fails within
+    a partial token (e.g. a split \\uXXXX escape pair) of the end.
+    """
+    return error.msg.startswith('Unterminated string') or error.pos >= len(error.doc) - 12
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+# Serialises building Conversation history buffers (examples from one
+# conversation are formatted concurrently by the training and eval pools)
+_format_lock = threading.Lock()
+
+class Conversation:
+    """
+    One conversation's messages, shared by every training example cut from it.
+    
+    Chat history starts at `history_start` (leading consultant messages with
+    no client message before them never count as history). The formatted
+    history lines are built once, on first use, together with the cumulative
+    end offset of each message, so any history prefix is a single slice of
+    the joined text instead of a fresh format of every earlier message.
+    Extending the buffers builds new ones under a lock and publishes them
+    text first, so readers never see offsets past the end of the text.
+    """
+    __slots__ = ('contact_id', 'scenario', 'messages', 'history_start', '_formatted', '_ends')
+    
+    def __init__(self, contact_id: str, scenario: str, messages: List[Dict[str, Any]]):
+        self.contact_id = contact_id
+        self.scenario = scenario
+        self.messages = messages
+        self.history_start = 0
+        self._formatted = None
+        self._ends = None
+    
+    def formatted_history(self, end: int) -> str:
+        """Same text as format_chat_history(messages[history_start:end])"""
+        count = end - self.history_start
+        ends = self._ends
+        if ends is None or len(ends) <= count:
+            with _format_lock:
+                if self._ends is None or len(self._ends) <= count:
+                    self._format_through(end)
+            ends = self._ends
+        stop = ends[count]
+        return self._formatted[:stop] if stop else "(No previous messages)"
+    
+    def _format_through(self, end: int):
+        # Only the messages not formatted yet are formatted: the per-example
+        # cost is the new messages, not the whole prefix
+        from llm_integration import format_chat_message
+        
+        ends = array('L', self._ends) if self._ends is not None else array('L', [0])
+        parts = [self._formatted or '']
+        length = ends[-1]
+        for msg in self.messages[self.history_start + len(ends) - 1:end]:
+            line = format_chat_message(msg)
+            if line is not None:
+                if length:
+                    parts.append('\n')
+                    length += 1
+                parts.append(line)
+                length += len(line)
+            ends.append(length)
+        self._formatted = ''.join(parts)
+        self._ends = ends
+
+class MessageSlice(Sequence):
+    """Read-only view of messages[start:stop] that doesn't copy the list"""
+    __slots__ = ('conversation', 'start', 'stop')
+    
+    def __init__(self, conversation: Conversation, start: int, stop: int):
+        self.conversation = conversation
+        self.start = start
+        self.stop = stop
+    
+    def __len__(self) -> int:
+        return self.stop - self.start
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.conversation.messages[j] for j in range(self.start, self.stop)[i]]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('message index out of range')
+        return self.conversation.messages[self.start + i]
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return itertools.islice(self.conversation.messages, self.start, self.stop)
+    
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Sequence) and list(self) == list(other)
+    
+    def __repr__(self) -> str:
+        return f"MessageSlice({list(self)!r})"
+    
+    def formatted(self) -> str:
+        """Formatted history text; history prefixes come from the shared buffer"""
+        if self.start == self.conversation.history_start:
+            return self.conversation.formatted_history(self.stop)
+        from llm_integration import format_chat_history
+        return format_chat_history(list(self))
+
+class TrainingExample:
+    """
+    One (chat history, client sequence, consultant reply) exchange.
+    
+    Instead of copying the history for every exchange, an example keeps a
+    reference to its conversation plus three offsets into its messages:
+    history is [history_start:client_start], the client sequence is
+    [client_start:reply_start] and the consultant reply is
+    [reply_start:reply_end]. Memory per conversation is linear in its length.
+    Fields can also be read dict-style (example['chat_history']).
+    """
+    __slots__ = ('conversation', 'client_start', 'reply_start', 'reply_end')
+    
+    FIELDS = ('contact_id', 'scenario', 'client_sequence', 'consultant_reply', 'chat_history')
+    
+    def __init__(self, conversation: Conversation, client_start: int, reply_start: int, reply_end: int):
+        self.conversation = conversation
+        self.client_start = client_start
+        self.reply_start = reply_start
+        self.reply_end = reply_end
+    
+    @property
+    def contact_id(self) -> str:
+        return self.conversation.contact_id
+    
+    @property
+    def scenario(self) -> str:
+        return self.conversation.scenario
+    
+    @property
+    def chat_history(self) -> MessageSlice:
+        return MessageSlice(self.conversation, self.conversation.history_start, self.client_start)
+    
+    @property
+    def client_sequence(self) -> MessageSlice:
+        return MessageSlice(self.conversation, self.client_start, self.reply_start)
+    
+    @property
+    def consultant_reply(self) -> MessageSlice:
+        return MessageSlice(self.conversation, self.reply_start, self.reply_end)
+    
+    @property
+    def formatted_history(self) -> str:
+        return self.conversation.formatted_history(self.client_start)
+    
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+    
+    def keys(self):
+        return self.FIELDS
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict with copied message lists (the old representation)"""
+        return {
+            'contact_id': self.contact_id,
+            'scenario': self.scenario,
+            'client_sequence': list(self.client_sequence),
+            'consultant_reply': list(self.consultant_reply),
+            'chat_history': list(self.chat_history)
+        }
+
+def extract_training_examples(conversations: Iterable[Dict[str, Any]]) -> Iterator[TrainingExample]:
     """
     Extract training examples from conversations.
     Each example contains:
     - client_sequence: List of consecutive client messages
     - consultant_reply: List of consecutive consultant replies
     - chat_history: All previous messages before this client sequence
-    """
-    training_examples = []
     
+    Examples are yielded lazily, so passing iter_conversations() keeps memory
+    bounded by the largest single conversation. Examples from one conversation
+    share its message list (see TrainingExample), so they cost a few offsets
+    each rather than a copy of the history.
+    """
     for conversation in conversations:
         messages = conversation.get('conversation', [])
-        contact_id = conversation.get('contact_id', 'unknown')
-        scenario = conversation.get('scenario', 'unknown')
+        shared = Conversation(
+            conversation.get('contact_id', 'unknown'),
+            conversation.get('scenario', 'unknown'),
+            messages
+        )
         
-        chat_history = []
         i = 0
-        
         while i < len(messages):
             # Collect consecutive client messages (direction "in")
-            client_sequence = []
+            client_start = i
             while i < len(messages) and messages[i]['direction'] == 'in':
-                client_sequence.append(messages[i])
                 i += 1
             
             # Collect consecutive consultant messages (direction "out")
-            consultant_reply = []
+            reply_start = i
             while i < len(messages) and messages[i]['direction'] == 'out':
-                consultant_reply.append(messages[i])
                 i += 1
             
-            # Only add if we have both client and consultant messages
-            if client_sequence and consultant_reply:
-                example = {
-                    'contact_id': contact_id,
-                    'scenario': scenario,
-                    'client_sequence': client_sequence,
-                    'consultant_reply': consultant_reply,
-                    'chat_history': chat_history.copy()
-                }
-                training_examples.append(example)
-                
-                # Update chat history with this exchange
-                chat_history.extend(client_sequence)
-                chat_history.extend(consultant_reply)
-    
-    return training_examples
+            # Only add if we have both client and consultant messages. The
+            # only exchange that can be skipped before another one is a
+            # leading consultant-only run, so history is always the slice
+            # between its end and the current client sequence
+            if reply_start > client_start and i > reply_start:
+                yield TrainingExample(shared, client_start, reply_start, i)
+            elif client_start == 0:
+                shared.history_start = i
 
 def format_example_for_display(example: Dict[str, Any]) -> str:
     """Format a training example for readable display"""
@@ -91,7 +315,7 @@ def main():
     print(f"Loaded {len(conversations)} conversations")
     
     print("\nExtracting training examples...")
-    training_examples = extract_training_examples(conversations)
+    training_examples = list(extract_training_examples(conversations))
     print(f"Extracted {len(training_examples)} training examples")
     
     # Display first 3 examples
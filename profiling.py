@@ -0,0 +1,133 @@
+"""
+Profiling - opt-in CPU profiles of individual requests
+A request is profiled when it carries the admin token in X-Profile or is picked by PROFILE_SAMPLE_RATE
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import tempfile
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+from timing import Trace
+
+
+def token_matches(provided: Optional[str], expected: Optional[str]) -> bool:
+    """Constant-time token check; always False when no token is configured"""
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(provided.encode('utf-8'), expected.encode('utf-8'))
+
+
+class RequestProfiler:
+    """
+    Captures a cProfile profile plus the stage trace of selected requests.
+
+    Each profile is stored in `directory` as `<id>.prof` (loadable with
+    pstats or snakeviz) and `<id>.json` (request details, wall-clock stage
+    timings and the top functions by cumulative time). Only the newest
+    `max_profiles` are kept.
+
+    cProfile only sees the thread that handles the request, so work done on
+    thread pools (e.g. hedged LLM calls) shows up as time spent waiting.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.0, max_profiles: int = 100, top_functions: int = 30):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.top_functions = top_functions
+        os.makedirs(directory, exist_ok=True)
+
+    def should_profile(self, requested: bool) -> bool:
+        return requested or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self) -> Optional[cProfile.Profile]:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Another profiler (or debugger) already owns this thread
+            print(f"Warning: Could not start request profile ({e})")
+            return None
+        return profile
+
+    def new_id(self) -> str:
+        # Ids start with a timestamp, so name order is age order
+        now = time.time()
+        return time.strftime('%Y%m%d%H%M%S', time.localtime(now)) + f"{int(now * 1e6) % 1000000:06d}" + uuid.uuid4().hex[:6]
+
+    def finish(self, profile: cProfile.Profile, profile_id: str, request_info: Dict[str, Any], trace: Optional[Trace]):
+        """Stop profiling and save the results under `profile_id`"""
+        profile.disable()
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profile, stream=summary)
+        stats.sort_stats('cumulative').print_stats(self.top_functions)
+
+        record = dict(request_info)
+        record.update({
+            'id': profile_id,
+            'created_at': time.time(),
+            'stages': [
+                {'stage': name, 'offset_ms': round(offset * 1000, 3), 'duration_ms': round(duration * 1000, 3)}
+                for name, offset, duration in (trace.stages if trace else [])
+            ],
+            'wall_ms': round(trace.totals()['total'], 3) if trace else None,
+            'cpu_seconds': round(stats.total_tt, 6),
+            'top_functions': summary.getvalue()
+        })
+
+        stats.dump_stats(self._path(profile_id, '.prof'))
+        self._write_json(profile_id, record)
+        self._prune()
+
+    def list_profiles(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Newest first, without the function listing"""
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith('.json') and len(profiles) < limit:
+                record = self.get(name[:-5])
+                if record:
+                    record.pop('top_functions', None)
+                    profiles.append(record)
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        if not profile_id.isalnum():
+            return None
+        try:
+            with open(self._path(profile_id, '.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def profile_path(self, profile_id: str) -> Optional[str]:
+        """Path of the raw .prof file, or None if there is no such profile"""
+        if not profile_id.isalnum():
+            return None
+        path = self._path(profile_id, '.prof')
+        return path if os.path.exists(path) else None
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def _write_json(self, profile_id: str, record: Dict[str, Any]):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.profile')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self._path(profile_id, '.json'))
+
+    def _prune(self):
+        ids = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+        for profile_id in ids[:-self.max_profiles] if self.max_profiles > 0 else []:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(self._path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
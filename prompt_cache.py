@@ -0,0 +1,90 @@
+"""
+Prompt Cache - in-process cache for database prompts
+Keeps the latest prompt per type so replies don't need a Supabase round trip
+"""
+
+import threading
+import time
+from typing import Dict, Any, Optional
+
+
+class PromptCache:
+    """
+    Thread-safe TTL cache of prompt records keyed by prompt type.
+
+    Entries younger than the TTL are served directly. Once an entry expires it
+    is kept around as "stale" so the database layer can check the stored
+    version and only refetch the prompt text when the version has changed.
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def get(self, prompt_type: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh entry, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(prompt_type)
+            if entry and time.monotonic() - entry['cached_at'] < self.ttl_seconds:
+                self.hits += 1
+                return entry
+            return None
+
+    def peek(self, prompt_type: str) -> Optional[Dict[str, Any]]:
+        """Return the entry regardless of age (used for version revalidation)"""
+        with self._lock:
+            return self._entries.get(prompt_type)
+
+    def set(self, prompt_type: str, prompt_text: str, version: int) -> Dict[str, Any]:
+        """Store a prompt record fetched from (or written to) the database"""
+        entry = {
+            'prompt_text': prompt_text,
+            'version': version,
+            'cached_at': time.monotonic()
+        }
+        with self._lock:
+            self._entries[prompt_type] = entry
+        return entry
+
+    def revalidate(self, prompt_type: str, version: int) -> Optional[Dict[str, Any]]:
+        """
+        Mark a stale entry fresh again if its version still matches the database.
+
+        Returns the entry when the version is unchanged, None when a refetch is needed.
+        """
+        with self._lock:
+            entry = self._entries.get(prompt_type)
+            if entry and entry['version'] == version:
+                entry['cached_at'] = time.monotonic()
+                self.revalidations += 1
+                return entry
+            return None
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def invalidate(self, prompt_type: Optional[str] = None):
+        """Drop one prompt type, or everything when prompt_type is None"""
+        with self._lock:
+            if prompt_type is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(prompt_type, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and currently cached versions"""
+        with self._lock:
+            lookups = self.hits + self.revalidations + self.misses
+            return {
+                'hits': self.hits,
+                'revalidations': self.revalidations,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.revalidations) / lookups, 4) if lookups else 0.0,
+                'ttl_seconds': self.ttl_seconds,
+                'versions': {k: v['version'] for k, v in self._entries.items()}
+            }
@@ -0,0 +1,84 @@
+"""
+Prompt Sync - cross-worker prompt version notifications
+Lets every gunicorn worker see prompt updates without polling the database
+"""
+
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; writes fall back to unlocked
+    fcntl = None
+
+
+class PromptVersionBoard:
+    """
+    Shared version counter for prompts, backed by a small file on local disk.
+
+    The worker that updates a prompt publishes the new version here. Readers
+    only stat() the file on each lookup and re-read it when it has been replaced,
+    so checking for updates costs a syscall instead of a Supabase query. All
+    workers of one container share the same file (tmpfs on most systems).
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._file_id = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def get(self, prompt_type: str) -> Optional[int]:
+        """Latest version published by any worker, or None if unknown"""
+        if not self.enabled:
+            return None
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        # Writers replace the file, so the inode changes even within one mtime tick
+        file_id = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            if file_id != self._file_id:
+                self._versions = self._read()
+                self._file_id = file_id
+            return self._versions.get(prompt_type)
+
+    def publish(self, prompt_type: str, version: int):
+        """Announce a new prompt version to every worker"""
+        if not self.enabled:
+            return
+
+        lock_path = self.path + '.lock'
+        with open(lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                versions = self._read()
+                # Never move a version backwards if two writers race
+                versions[prompt_type] = max(version, versions.get(prompt_type, 0))
+
+                directory = os.path.dirname(os.path.abspath(self.path))
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.prompt_versions')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(versions, f)
+                os.replace(tmp_path, self.path)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self) -> Dict[str, int]:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
@@ -147,3 +147,69 @@ Return a JSON object with:
 {ai_reply}
 
 Analyze the discrepancies and return an improved prompt."""
+
+
+# History Summary Prompt - condenses older turns of long conversations
+
+HISTORY_SUMMARY_PROMPT = """You are summarizing the earlier part of a conversation between a client and a Thai DTV visa consultant, so the consultant assistant can keep context without re-reading every message.
+
+Keep every fact that matters for answering the client: nationality, current country, application country, occupation/visa category, finances, documents already discussed or sent, fees and timelines quoted, decisions made, and open questions.
+Drop greetings, small talk and repeated information. Write in plain sentences, at most {max_words} words.
+
+### Previous Summary:
+{previous_summary}
+
+### New Messages To Fold In:
+{new_messages}
+
+Return ONLY the updated summary text."""
+
+
+# Batch Editor Prompt - one consolidated revision for several examples
+
+EDITOR_BATCH_PROMPT = """You are an AI prompt engineer specializing in refining conversational AI systems. Your task is to analyze the performance of a visa consultant chatbot across SEVERAL conversations at once and make one consolidated improvement to its system prompt.
+
+## Your Task:
+
+You will receive the current system prompt and a batch of examples. Each example has the chat history, the customer's message(s), what the real human consultant replied, and what the AI chatbot predicted.
+
+## Analysis Process:
+
+1. Compare each AI reply with the real consultant reply (tone, accuracy, completeness, flow, specificity, call-to-action, personality).
+2. Look for PATTERNS that repeat across examples - these matter most. One-off differences matter less.
+3. Make PRECISE, TARGETED changes to the prompt that fix the recurring problems.
+
+### Important Rules:
+- Make MINIMAL changes - only fix what's clearly broken
+- Preserve what's working well
+- Prefer general rules that cover several examples over example-specific patches
+- Don't add excessive examples - keep prompt concise
+- If the AI replies were already good, make NO changes or minimal refinements
+
+## Output Format:
+
+Return a JSON object with:
+1. "analysis": Brief explanation of the recurring issues across the batch (2-4 sentences)
+2. "changes_made": Bulleted list of specific edits
+3. "prompt": The complete updated system prompt
+
+```json
+{{
+  "analysis": "Your analysis here",
+  "changes_made": [
+    "Added specific detail about X to knowledge base",
+    "Clarified tone guideline for situation Y"
+  ],
+  "prompt": "Complete updated prompt here"
+}}
+```
+
+## Current Data:
+
+### Current System Prompt:
+{current_prompt}
+
+### Examples ({num_examples}):
+{examples}
+
+Analyze the discrepancies across all examples and return one improved prompt."""
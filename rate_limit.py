@@ -0,0 +1,390 @@
+"""
+Rate Limit - client-side token buckets for provider RPM/TPM quotas
+Buckets live in a SQLite file shared by every worker on the host, and live replies get priority over background work
+"""
+
+import asyncio
+import functools
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config import Config
+from clients import clients
+from metrics import registry as metrics, set_usage_listener
+from history_window import estimate_tokens
+from resilience import ProviderUnavailable, call_deadline, call_timeout
+
+LIVE, BACKGROUND = 'live', 'background'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    level REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# Priority of the LLM calls made in this context
+_priority: ContextVar[str] = ContextVar('llm_priority', default=LIVE)
+
+# Token estimate of the call in progress, corrected once the provider reports usage
+_reservation: ContextVar[Optional[List[Any]]] = ContextVar('llm_reservation', default=None)
+
+# Quota taken by queued_for_quota for the first attempt of the call in progress
+_prepaid: ContextVar[Optional[List[Any]]] = ContextVar('llm_prepaid_quota', default=None)
+
+
+class RateLimitExceeded(ProviderUnavailable):
+    """The local quota for a provider won't allow another call within the caller's wait limit"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} quota exhausted; next call possible in {retry_after:.1f}s", provider, retry_after)
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """'groq=30/12000,openai=500/200000' -> {provider: (requests per minute, tokens per minute)}; 0 = unlimited"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        provider, _, quota = entry.partition('=')
+        rpm, _, tpm = quota.partition('/')
+        try:
+            limits[provider.strip()] = (float(rpm or 0), float(tpm or 0))
+        except ValueError:
+            raise ValueError(f"Invalid RATE_LIMITS entry '{entry}' (expected provider=rpm/tpm)")
+    return limits
+
+
+class TokenBucketLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets per provider and model.
+
+    Each bucket holds up to a minute's quota (scaled by `headroom` to stay
+    clear of the provider's own limit) and refills continuously. A call
+    takes one request and its estimated tokens from both buckets, waiting
+    until they are available. Background calls must leave `reserve` of each
+    bucket untouched, so training and editor bursts can't starve live
+    replies.
+
+    The buckets are rows in a SQLite database updated in BEGIN IMMEDIATE
+    transactions, so all workers pointing at the same file draw from one
+    quota. `path=':memory:'` keeps them per process.
+    """
+
+    # Longest single sleep while waiting, so a freed-up quota is noticed quickly
+    POLL_SECONDS = 0.25
+
+    def __init__(
+        self,
+        path: str,
+        limits: Dict[str, Tuple[float, float]],
+        headroom: float = 0.9,
+        reserve: float = 0.25
+    ):
+        self.path = path
+        self.limits = limits
+        self.headroom = headroom
+        self.reserve = reserve
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ':memory:':
+                self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(_SCHEMA)
+
+    def enabled(self, provider: str) -> bool:
+        return any(self.limits.get(provider, (0, 0)))
+
+    def acquire(self, provider: str, model: str, tokens: int, priority: str = LIVE, max_wait: Optional[float] = None) -> float:
+        """
+        Take one request and `tokens` tokens, waiting up to `max_wait` seconds
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RateLimitExceeded: if the quota won't allow the call in time
+        """
+        started = time.monotonic()
+        while True:
+            wait = self.try_take(provider, model, tokens, priority)
+            waited = time.monotonic() - started
+            if wait <= 0:
+                return waited
+            if max_wait is not None and waited + wait > max_wait:
+                raise RateLimitExceeded(provider, wait)
+            time.sleep(min(wait, self.POLL_SECONDS))
+
+    async def aacquire(self, provider: str, model: str, tokens: int, priority: str = LIVE, max_wait: Optional[float] = None) -> float:
+        """Async version of acquire; waits on the event loop, only the SQLite transaction runs on a thread"""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        while True:
+            wait = await loop.run_in_executor(None, self.try_take, provider, model, tokens, priority)
+            waited = time.monotonic() - started
+            if wait <= 0:
+                return waited
+            if max_wait is not None and waited + wait > max_wait:
+                raise RateLimitExceeded(provider, wait)
+            await asyncio.sleep(min(wait, self.POLL_SECONDS))
+
+    def try_take(self, provider: str, model: str, tokens: int, priority: str = LIVE) -> float:
+        """Take one request and `tokens` tokens if available now; otherwise the seconds until they will be"""
+        return self._take(self._costs(provider, model, tokens), priority)
+
+    def adjust(self, provider: str, model: str, tokens: int):
+        """Charge (or refund, if negative) tokens once the real usage of a call is known"""
+        rpm, tpm = self.limits.get(provider, (0, 0))
+        if not tpm or not tokens:
+            return
+        key = f"{provider}:{model}:tokens"
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                capacity = tpm * self.headroom
+                level, updated = self._read(key, capacity)
+                now = time.time()
+                level = min(capacity, level + (now - updated) * capacity / 60) - tokens
+                self._db.execute('INSERT OR REPLACE INTO buckets (key, level, updated) VALUES (?, ?, ?)', (key, level, now))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def snapshot(self) -> Dict[str, float]:
+        """Current level of every bucket (refill applied), for health checks and metrics"""
+        with self._lock:
+            rows = self._db.execute('SELECT key, level, updated FROM buckets').fetchall()
+        now = time.time()
+        levels = {}
+        for key, level, updated in rows:
+            capacity = self._capacity(key)
+            if capacity:
+                levels[key] = round(min(capacity, level + (now - updated) * capacity / 60), 1)
+        return levels
+
+    def _costs(self, provider: str, model: str, tokens: int) -> List[Tuple[str, float, float]]:
+        rpm, tpm = self.limits.get(provider, (0, 0))
+        costs = []
+        if rpm:
+            costs.append((f"{provider}:{model}:requests", rpm * self.headroom, 1))
+        if tpm:
+            costs.append((f"{provider}:{model}:tokens", tpm * self.headroom, tokens))
+        return costs
+
+    def _capacity(self, key: str) -> float:
+        provider, kind = key.split(':', 1)[0], key.rsplit(':', 1)[-1]
+        rpm, tpm = self.limits.get(provider, (0, 0))
+        return (rpm if kind == 'requests' else tpm) * self.headroom
+
+    def _take(self, costs: List[Tuple[str, float, float]], priority: str) -> float:
+        """Deduct every cost if all buckets allow it; otherwise the seconds until they will"""
+        if not costs:
+            return 0.0
+        keep = self.reserve if priority != LIVE else 0.0
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                levels = []
+                wait = 0.0
+                for key, capacity, cost in costs:
+                    level, updated = self._read(key, capacity)
+                    level = min(capacity, level + (now - updated) * capacity / 60)
+                    # A call bigger than the bucket would wait forever; let it through when the bucket is full
+                    cost = min(cost, capacity * (1 - keep))
+                    needed = cost + capacity * keep
+                    if level < needed:
+                        wait = max(wait, (needed - level) * 60 / capacity)
+                    levels.append((key, level - cost))
+                if wait <= 0:
+                    self._db.executemany(
+                        'INSERT OR REPLACE INTO buckets (key, level, updated) VALUES (?, ?, ?)',
+                        [(key, level, now) for key, level in levels]
+                    )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return wait
+
+    def _read(self, key: str, capacity: float) -> Tuple[float, float]:
+        row = self._db.execute('SELECT level, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+        return row if row else (capacity, time.time())
+
+
+def _make_limiter() -> TokenBucketLimiter:
+    return TokenBucketLimiter(
+        Config.RATE_LIMIT_PATH or ':memory:',
+        parse_limits(Config.RATE_LIMITS),
+        headroom=Config.RATE_LIMIT_HEADROOM,
+        reserve=Config.RATE_LIMIT_RESERVE
+    )
+
+
+# Opened on first use and reopened in forked workers (SQLite connections can't cross a fork)
+clients.register('rate_limiter', _make_limiter)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+@contextmanager
+def background_priority():
+    """
+    Run the LLM calls in this block as background work (training, editor, evaluation)
+
+    Background calls also get LLM_BACKGROUND_DEADLINE instead of LLM_DEADLINE,
+    since editor output is much longer than a reply.
+    """
+    token = _priority.set(BACKGROUND)
+    try:
+        with call_deadline(Config.LLM_BACKGROUND_DEADLINE):
+            yield
+    finally:
+        _priority.reset(token)
+
+
+def in_background(fn: Callable) -> Callable:
+    """Wrap fn so its LLM calls run as background work, e.g. for tasks submitted to a thread pool"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with background_priority():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def quota_enabled(provider: str) -> bool:
+    return bool(Config.RATE_LIMITS) and clients.get('rate_limiter').enabled(provider)
+
+
+def acquire_quota(provider: str, model: str, prompt: str) -> Optional[List[Any]]:
+    """
+    Wait for quota for one call with this prompt
+
+    Live calls wait at most RATE_LIMIT_MAX_WAIT seconds and background calls
+    RATE_LIMIT_BACKGROUND_MAX_WAIT, both capped by the call's deadline.
+
+    Returns:
+        The reservation [provider, model, estimated tokens], or None when
+        the provider isn't rate limited
+    """
+    if not quota_enabled(provider):
+        return None
+
+    priority, tokens, max_wait = _quota_request(prompt)
+    try:
+        waited = clients.get('rate_limiter').acquire(provider, model, tokens, priority, max_wait)
+    except RateLimitExceeded:
+        metrics.inc('issa_rate_limit_rejections_total', {'provider': provider, 'priority': priority})
+        raise
+    metrics.observe('issa_rate_limit_wait_seconds', waited, {'provider': provider, 'priority': priority})
+    return [provider, model, tokens]
+
+
+async def aacquire_quota(provider: str, model: str, prompt: str) -> Optional[List[Any]]:
+    """Async version of acquire_quota; waiting doesn't tie up a thread"""
+    if not quota_enabled(provider):
+        return None
+
+    priority, tokens, max_wait = _quota_request(prompt)
+    try:
+        waited = await clients.get('rate_limiter').aacquire(provider, model, tokens, priority, max_wait)
+    except RateLimitExceeded:
+        metrics.inc('issa_rate_limit_rejections_total', {'provider': provider, 'priority': priority})
+        raise
+    metrics.observe('issa_rate_limit_wait_seconds', waited, {'provider': provider, 'priority': priority})
+    return [provider, model, tokens]
+
+
+def _quota_request(prompt: str) -> Tuple[str, int, float]:
+    """(priority, estimated tokens, longest wait) for a call made in this context"""
+    priority = _priority.get()
+    tokens = estimate_tokens(prompt) + Config.RATE_LIMIT_COMPLETION_TOKENS
+    max_wait = Config.RATE_LIMIT_MAX_WAIT if priority == LIVE else Config.RATE_LIMIT_BACKGROUND_MAX_WAIT
+    remaining = call_timeout()
+    if remaining is not None:
+        max_wait = min(max_wait, remaining)
+    return priority, tokens, max_wait
+
+
+def queued_for_quota(provider: str, model: str):
+    """
+    Decorator waiting for the first attempt's quota before a guarded provider call starts
+
+    Goes outside @resilient, so a long wait (background work may queue for
+    RATE_LIMIT_BACKGROUND_MAX_WAIT) doesn't use up the call's deadline. The
+    first attempt spends this quota; retries take their own (see rate_limited).
+    """
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(prompt, *args, **kwargs):
+                token = _prepaid.set([await aacquire_quota(provider, model, prompt)])
+                try:
+                    return await fn(prompt, *args, **kwargs)
+                finally:
+                    _prepaid.reset(token)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(prompt, *args, **kwargs):
+            token = _prepaid.set([acquire_quota(provider, model, prompt)])
+            try:
+                return fn(prompt, *args, **kwargs)
+            finally:
+                _prepaid.reset(token)
+        return wrapper
+    return decorate
+
+
+def rate_limited(provider: str, model: str):
+    """
+    Decorator taking quota for every attempt of a provider call (sync or async) whose first argument is the prompt
+
+    Goes inside @resilient, so retries (including those after a 429) are
+    charged too; their wait is capped by the time left before the deadline.
+    """
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(prompt, *args, **kwargs):
+                prepaid = _prepaid.get()
+                reservation = prepaid.pop() if prepaid else await aacquire_quota(provider, model, prompt)
+                token = _reservation.set(reservation)
+                try:
+                    return await fn(prompt, *args, **kwargs)
+                finally:
+                    _reservation.reset(token)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(prompt, *args, **kwargs):
+            prepaid = _prepaid.get()
+            reservation = prepaid.pop() if prepaid else acquire_quota(provider, model, prompt)
+            token = _reservation.set(reservation)
+            try:
+                return fn(prompt, *args, **kwargs)
+            finally:
+                _reservation.reset(token)
+        return wrapper
+    return decorate
+
+
+def _settle_usage(provider: str, prompt_tokens: int, completion_tokens: int):
+    """Correct the token bucket by the difference between the estimate and the reported usage"""
+    reservation = _reservation.get()
+    if not reservation or reservation[0] != provider:
+        return
+    _, model, estimated = reservation
+    reservation[2] = prompt_tokens + completion_tokens
+    clients.get('rate_limiter').adjust(provider, model, prompt_tokens + completion_tokens - estimated)
+
+
+set_usage_listener(_settle_usage)
+
+metrics.describe('issa_rate_limit_wait_seconds', 'histogram', 'Time LLM calls waited for local RPM/TPM quota')
+metrics.describe('issa_rate_limit_rejections_total', 'counter', 'LLM calls refused because the quota would not free up in time')
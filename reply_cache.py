@@ -0,0 +1,191 @@
+"""
+Reply Cache - exact-match cache for generated chatbot replies
+Retries, page refreshes and duplicate webhooks reuse the reply instead of calling the LLM again
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from clients import clients
+
+# Disk rows are trimmed to max_disk_entries once every this many writes per process
+_PRUNE_EVERY = 100
+
+
+def make_reply_cache_key(
+    prompt_version: int,
+    provider: str,
+    model: str,
+    formatted_history: str,
+    client_sequence: str
+) -> str:
+    """
+    Cache key for one reply request.
+
+    Including the prompt version means a prompt update automatically stops
+    old replies from matching; the conversation itself is hashed so keys stay
+    small however long the chat history is.
+    """
+    digest = hashlib.sha256()
+    digest.update(formatted_history.encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(client_sequence.encode('utf-8'))
+    return f"v{prompt_version}:{provider}:{model}:{digest.hexdigest()}"
+
+
+class ReplyCache:
+    """
+    Bounded LRU + TTL cache of replies, with an optional SQLite tier on disk.
+
+    The in-memory tier is per process. When `disk_path` is set, replies are
+    also written to a SQLite file, which survives restarts and is shared by
+    every worker on the host; memory misses fall through to it. The file
+    keeps at most `max_disk_entries` replies, dropping expired and then the
+    oldest ones, and each worker opens its own connection on first use.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 100000
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+        self._entries: OrderedDict = OrderedDict()  # key -> (reply, version, stored_at)
+        self._lock = threading.Lock()
+        self._latest_version = None
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # Opened on first use and reopened in forked workers (SQLite connections can't cross a fork)
+        self._db_name = f'reply_cache:{disk_path}' if disk_path else None
+        if self._db_name:
+            clients.register(self._db_name, self._connect)
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        return clients.get(self._db_name) if self._db_name else None
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.disk_path, check_same_thread=False, timeout=5)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS replies ('
+            'key TEXT PRIMARY KEY, reply TEXT NOT NULL, '
+            'version INTEGER NOT NULL, stored_at REAL NOT NULL)'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS replies_stored_at ON replies (stored_at)')
+        db.commit()
+        return db
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str, prompt_version: int) -> Optional[str]:
+        """Cached reply for key, or None. Seeing a newer prompt version purges older replies."""
+        if not self.enabled:
+            return None
+
+        self._observe_version(prompt_version)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[2] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+
+            db = self._db
+            if db:
+                row = db.execute(
+                    'SELECT reply, version, stored_at FROM replies WHERE key = ?', (key,)
+                ).fetchone()
+                if row and now - row[2] < self.ttl_seconds:
+                    self._store(key, row[0], row[1], row[2])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, reply: str, prompt_version: int):
+        if not self.enabled:
+            return
+
+        stored_at = time.time()
+        with self._lock:
+            self._store(key, reply, prompt_version, stored_at)
+            db = self._db
+            if db:
+                db.execute(
+                    'INSERT OR REPLACE INTO replies (key, reply, version, stored_at) VALUES (?, ?, ?, ?)',
+                    (key, reply, prompt_version, stored_at)
+                )
+                self._writes += 1
+                if self._writes % _PRUNE_EVERY == 0:
+                    self._prune_disk(db, stored_at)
+                db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            db = self._db
+            if db:
+                db.execute('DELETE FROM replies')
+                db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def _store(self, key: str, reply: str, version: int, stored_at: float):
+        self._entries[key] = (reply, version, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _observe_version(self, version: int):
+        """Drop replies generated with older prompts once a newer version shows up"""
+        with self._lock:
+            if self._latest_version is not None and version <= self._latest_version:
+                return
+            self._latest_version = version
+
+            stale = [k for k, entry in self._entries.items() if entry[1] < version]
+            for k in stale:
+                del self._entries[k]
+            db = self._db
+            if db:
+                db.execute('DELETE FROM replies WHERE version < ?', (version,))
+                db.commit()
+
+    def _prune_disk(self, db: sqlite3.Connection, now: float):
+        """Drop expired rows, then the oldest beyond max_disk_entries (0 = no row limit)"""
+        db.execute('DELETE FROM replies WHERE stored_at < ?', (now - self.ttl_seconds,))
+        if self.max_disk_entries <= 0:
+            return
+        db.execute(
+            'DELETE FROM replies WHERE stored_at <= ('
+            'SELECT stored_at FROM replies ORDER BY stored_at DESC LIMIT 1 OFFSET ?)',
+            (self.max_disk_entries,)
+        )
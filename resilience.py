@@ -0,0 +1,418 @@
+"""
+Resilience - retries, deadlines and circuit breakers for LLM provider calls
+Transient provider errors are retried with jittered backoff; a failing provider is fast-failed until it recovers
+"""
+
+import asyncio
+import email.utils
+import functools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+from config import Config
+from metrics import registry as metrics
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+# SDK exception types raised for network failures and timeouts (matched by
+# name so the SDKs stay optional imports)
+RETRYABLE_ERRORS = {
+    'APIConnectionError', 'APITimeoutError', 'ConnectError', 'ConnectTimeout', 'ReadTimeout',
+    'ReadError', 'RemoteProtocolError', 'PoolTimeout', 'ServiceUnavailable', 'DeadlineExceeded',
+    'InternalServerError', 'ResourceExhausted', 'TooManyRequests'
+}
+
+# Monotonic deadline of the provider call running in this context
+_deadline: ContextVar[Optional[float]] = ContextVar('llm_deadline', default=None)
+
+# Seconds per call set by call_deadline(), instead of the guard's own
+_budget: ContextVar[Optional[float]] = ContextVar('llm_deadline_seconds', default=None)
+
+
+class ProviderUnavailable(RuntimeError):
+    """Raised without calling the provider; retry_after says when it's worth trying again"""
+
+    def __init__(self, message: str, provider: str, retry_after: float):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ProviderUnavailable):
+    """The provider's circuit breaker is open"""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} is failing; not calling it for another {retry_in:.0f}s", provider, retry_in)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    are rejected for `reset_timeout` seconds. Then a single probe call is
+    let through (half-open): success closes the circuit, failure opens it
+    again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() >= self._opened_at + self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def is_open(self) -> bool:
+        """Whether a call now would be rejected"""
+        with self._lock:
+            if self._state == self.OPEN:
+                return time.monotonic() < self._opened_at + self.reset_timeout
+            return self._state == self.HALF_OPEN and self._probing
+
+    def before_call(self, provider: str):
+        """Reserve a call, or raise CircuitOpenError"""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                if now < self._opened_at + self.reset_timeout:
+                    raise CircuitOpenError(provider, self._opened_at + self.reset_timeout - now)
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(provider, self.reset_timeout)
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release(self):
+        """Give back a half-open probe that ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or (0 < self.failure_threshold <= self._failures):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def classify_error(error: BaseException) -> Tuple[bool, Optional[float]]:
+    """(whether the error is transient, server-requested delay in seconds if any)"""
+    if isinstance(error, ProviderUnavailable):
+        return False, None
+
+    status = getattr(error, 'status_code', None)
+    response = getattr(error, 'response', None)
+    if status is None:
+        status = getattr(response, 'status_code', None)
+    if status is None and isinstance(getattr(error, 'code', None), int):
+        status = error.code  # google.api_core exceptions
+
+    retry_after = getattr(error, 'retry_after', None)
+    headers = getattr(response, 'headers', None)
+    if retry_after is None and headers is not None:
+        retry_after = parse_retry_after(headers.get('retry-after-ms'), milliseconds=True)
+        if retry_after is None:
+            retry_after = parse_retry_after(headers.get('retry-after'))
+
+    if status is not None:
+        return status in RETRYABLE_STATUS, retry_after
+    transient = isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in RETRYABLE_ERRORS
+    return transient, retry_after
+
+
+def parse_retry_after(value: Optional[str], milliseconds: bool = False) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+        return max(0.0, seconds / 1000 if milliseconds else seconds)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def call_timeout() -> Optional[float]:
+    """Seconds left before the current provider call's deadline (None outside a guarded call)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.001, deadline - time.monotonic())
+
+
+@contextmanager
+def call_deadline(seconds: float):
+    """Give provider calls in this block `seconds` each (retries included) instead of LLM_DEADLINE"""
+    token = _budget.set(seconds)
+    try:
+        yield
+    finally:
+        _budget.reset(token)
+
+
+class ProviderGuard:
+    """
+    Retry policy, deadline and circuit breaker for one provider.
+
+    A call gets `deadline` seconds in total for every attempt and the
+    backoff between them; provider SDK calls read what's left through
+    call_timeout(). Transient errors are retried up to `max_attempts` with
+    full-jitter exponential backoff, or after the provider's Retry-After
+    when it sends one. A retry that couldn't start before the deadline
+    isn't attempted; the last error is raised instead.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        deadline: float = 30.0,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.provider = provider
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker()
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base_delay * 2^attempt)]"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        deadline = self._start_deadline()
+        token = _deadline.set(deadline)
+        try:
+            attempt = 0
+            while True:
+                self.breaker.before_call(self.provider)
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                self.breaker.record_success()
+                return result
+        finally:
+            _deadline.reset(token)
+
+    async def acall(self, fn: Callable, *args, **kwargs) -> Any:
+        deadline = self._start_deadline()
+        token = _deadline.set(deadline)
+        try:
+            attempt = 0
+            while True:
+                self.breaker.before_call(self.provider)
+                try:
+                    result = await asyncio.wait_for(fn(*args, **kwargs), timeout=call_timeout())
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                except BaseException:
+                    # Cancelled, e.g. the losing side of a hedged request
+                    self.breaker.release()
+                    raise
+                self.breaker.record_success()
+                return result
+        finally:
+            _deadline.reset(token)
+
+    def stream(self, open_stream: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """Stream chunks; a failure is only retried if no chunk has been sent yet"""
+        deadline = self._start_deadline()
+        attempt = 0
+        while True:
+            self.breaker.before_call(self.provider)
+            sent = False
+            try:
+                for chunk in _under_deadline(open_stream(), deadline):
+                    sent = True
+                    yield chunk
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None or sent:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Client went away mid-stream
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return
+
+    async def astream(self, open_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Async version of stream"""
+        deadline = self._start_deadline()
+        attempt = 0
+        while True:
+            self.breaker.before_call(self.provider)
+            sent = False
+            try:
+                async for chunk in _aunder_deadline(open_stream(), deadline):
+                    sent = True
+                    yield chunk
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None or sent:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return
+
+    def _start_deadline(self) -> float:
+        budget = _budget.get()
+        deadline = time.monotonic() + (budget if budget is not None else self.deadline)
+        outer = _deadline.get()
+        return min(deadline, outer) if outer is not None else deadline
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before retrying, or None to give up and raise"""
+        if isinstance(error, ProviderUnavailable):
+            # Never reached the provider (e.g. local rate limit), so says nothing about its health
+            self.breaker.release()
+            return None
+        transient, retry_after = classify_error(error)
+        if not transient:
+            # The provider answered (e.g. 400 for a bad request), so it is healthy
+            self.breaker.record_success()
+            return None
+
+        self.breaker.record_failure()
+        if attempt + 1 >= self.max_attempts or self.breaker.is_open():
+            return None
+        delay = retry_after if retry_after is not None else self.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        metrics.inc('issa_llm_retries_total', {'provider': self.provider})
+        print(f"Warning: {self.provider} call failed ({error}), retrying in {delay:.1f}s")
+        return delay
+
+
+def _under_deadline(chunks: Iterator[str], deadline: float) -> Iterator[str]:
+    """
+    Pull each chunk with the deadline set, so call_timeout() works inside the stream
+
+    Set and reset around every pull rather than across yields, since the
+    consumer may resume a stream from another context.
+    """
+    while True:
+        token = _deadline.set(deadline)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            _deadline.reset(token)
+        yield chunk
+
+
+async def _aunder_deadline(chunks: AsyncIterator[str], deadline: float) -> AsyncIterator[str]:
+    """Async version of _under_deadline"""
+    while True:
+        token = _deadline.set(deadline)
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            return
+        finally:
+            _deadline.reset(token)
+        yield chunk
+
+
+_guards: Dict[str, ProviderGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def guard_for(provider: str) -> ProviderGuard:
+    """The process-wide guard for a provider, configured from Config"""
+    guard = _guards.get(provider)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.setdefault(provider, ProviderGuard(
+                provider,
+                max_attempts=Config.LLM_MAX_ATTEMPTS,
+                base_delay=Config.LLM_BACKOFF_BASE,
+                max_delay=Config.LLM_BACKOFF_MAX,
+                deadline=Config.LLM_DEADLINE,
+                breaker=CircuitBreaker(Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_RESET_SECONDS)
+            ))
+    return guard
+
+
+def resilient(provider: str):
+    """Decorator running a provider call (sync or async) through guard_for(provider)"""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                return await guard_for(provider).acall(fn, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return guard_for(provider).call(fn, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _breaker_metrics():
+    # Summed across workers, so this counts the workers fast-failing each provider
+    return [
+        ('issa_llm_circuit_open', {'provider': provider}, 1 if guard.breaker.is_open() else 0)
+        for provider, guard in list(_guards.items())
+    ]
+
+
+metrics.describe('issa_llm_retries_total', 'counter', 'LLM provider calls retried after a transient error')
+metrics.describe('issa_llm_circuit_open', 'gauge', 'Workers whose circuit breaker is rejecting calls to the provider')
+metrics.add_collector(_breaker_metrics)
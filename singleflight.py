@@ -0,0 +1,105 @@
+"""
+Single Flight - coalesces identical calls that are in flight at the same time
+Duplicate webhook deliveries wait for the first delivery's LLM call and share its reply instead of making their own
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time within this process.
+
+    The first caller for a key (the leader) runs the call; callers that
+    arrive with the same key before it finishes wait for it and get the
+    same result, or the same exception. Nothing is kept once the call ends,
+    so later callers rely on the reply cache instead.
+
+    Thread callers (Flask) and event-loop callers (ASGI) are tracked
+    separately: do() blocks the calling thread, ado() awaits on the loop.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._tasks: Dict[Tuple[int, str], 'asyncio.Task'] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn, or wait for the identical call already in flight
+
+        Returns:
+            (result, shared) where shared is True for followers
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+                leader = True
+            else:
+                self.followers += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Async version of do()
+
+        The call runs as its own task, so a leader whose request is cancelled
+        (client disconnected) doesn't cancel it for the followers.
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            shared = task is not None
+            if shared:
+                self.followers += 1
+            else:
+                self.leaders += 1
+                task = self._tasks[task_key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda _: self._forget(task_key, task))
+        return await asyncio.shield(task), shared
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_flight': len(self._flights) + len(self._tasks),
+                'leaders': self.leaders,
+                'followers': self.followers
+            }
+
+    def _forget(self, task_key: Tuple[int, str], task: 'asyncio.Task'):
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+        if not task.cancelled():
+            # Mark the exception as retrieved if every caller went away
+            task.exception()
@@ -0,0 +1,101 @@
+"""
+Timing - per-request stage timings for the reply and editor pipelines
+Stages are reported to clients in a Server-Timing header so slow requests can be broken down
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Trace of the request being handled in this context (None outside requests)
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('timing_trace', default=None)
+
+# Called with (stage name, seconds, failed) for every stage (see metrics.py)
+_stage_listener: Optional[Callable[[str, float, bool], None]] = None
+
+
+class Trace:
+    """Stage timings collected while handling one request"""
+
+    __slots__ = ('started', 'stages')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float, float]] = []  # (name, offset, duration) in seconds
+
+    def add(self, name: str, started: float, duration: float):
+        self.stages.append((name, started - self.started, duration))
+
+    def totals(self) -> Dict[str, float]:
+        """Milliseconds per stage name (repeated stages are summed), plus the total so far"""
+        totals: Dict[str, float] = {}
+        for name, _, duration in self.stages:
+            totals[name] = totals.get(name, 0.0) + duration * 1000
+        totals['total'] = (time.perf_counter() - self.started) * 1000
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. 'prompt;dur=1.2, llm;dur=812.0, total;dur=815.3'"""
+        return ', '.join(f"{name};dur={ms:.1f}" for name, ms in self.totals().items())
+
+
+def start_trace():
+    """Begin a trace for the current request; returns a token for end_trace()"""
+    return _current_trace.set(Trace())
+
+
+def end_trace(token):
+    try:
+        _current_trace.reset(token)
+    except ValueError:
+        # Token from another context (e.g. a stream finished on another thread)
+        _current_trace.set(None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def set_stage_listener(listener: Optional[Callable[[str, float, bool], None]]):
+    global _stage_listener
+    _stage_listener = listener
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a named stage of the current request and report it to the stage listener"""
+    trace = _current_trace.get()
+    listener = _stage_listener
+    if trace is None and listener is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        if trace is not None:
+            trace.add(name, started, duration)
+        if listener is not None:
+            listener(name, duration, failed)
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Stage durations in ms from a Server-Timing header value"""
+    stages = {}
+    for entry in header.split(','):
+        name, _, params = entry.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'dur' and name:
+                try:
+                    stages[name] = stages.get(name, 0.0) + float(value)
+                except ValueError:
+                    pass
+    return stages